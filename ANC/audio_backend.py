@@ -0,0 +1,532 @@
+"""
+Audio backends for the ANC controllers.
+
+The controllers only need a handful of stream operations, collected here so
+the same ``run()`` code path can drive real sound cards or an offline model:
+
+``PyAudioBackend``
+    Speakers and microphones through PortAudio. ``pyaudio`` is imported
+    lazily, so headless installs without it can still use the simulation.
+``SimulatedBackend``
+    Streams connected to a ``SimulatedRoom``. Blocking streams advance the
+    room clock only when the controller reads, so a session runs as fast as
+    the DSP allows and is reproducible for a fixed seed. Callback streams are
+    driven by a clock thread at ``speed`` times real time.
+
+All samples exchanged with a backend are float32 in [-1, 1]. Multi-channel
+data is interleaved, i.e. a C-ordered (frames, channels) array.
+
+Output callbacks are called as ``callback(frame_count)`` and return the
+interleaved samples to play; input callbacks are called as
+``callback(samples, overflowed)``. Blocking streams report xruns the same
+way: ``write(samples)`` returns True if the device signalled an output
+underflow, and ``read(frames)`` returns ``(samples, overflowed)``.
+"""
+
+import abc
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyaudio  # type: ignore
+except ImportError:  # pragma: no cover - depends on the host
+    pyaudio = None
+
+OutputCallback = Callable[[int], np.ndarray]
+InputCallback = Callable[[np.ndarray, bool], None]
+
+
+class AudioBackend(abc.ABC):
+    """
+    Interface between a controller and an audio system.
+
+    ``role`` tells the backend what an output stream carries (``"control"``
+    for anti-noise, ``"reference"`` for the primary noise playback); real
+    devices ignore it.
+    """
+
+    @abc.abstractmethod
+    def open_output(
+        self,
+        channels: int,
+        rate: int,
+        frames_per_buffer: int,
+        device_index: Optional[int] = None,
+        callback: Optional[OutputCallback] = None,
+        role: str = "control",
+    ):
+        """Open a float32 output stream; with ``callback`` it pulls its samples."""
+
+    @abc.abstractmethod
+    def open_input(
+        self,
+        channels: int,
+        rate: int,
+        frames_per_buffer: int,
+        device_index: Optional[int] = None,
+        callback: Optional[InputCallback] = None,
+    ):
+        """Open an input stream; with ``callback`` it pushes what it captures."""
+
+    def terminate(self) -> None:
+        """Release the audio system; streams opened later re-acquire it."""
+
+
+class _PyAudioOutputStream:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, samples: np.ndarray) -> bool:
+        data = np.ascontiguousarray(samples, dtype=np.float32).tobytes()
+        try:
+            self._stream.write(data, exception_on_underflow=True)
+        except IOError as exc:
+            # PortAudio reports the underflow after the data has been queued.
+            if exc.errno != pyaudio.paOutputUnderflowed:
+                raise
+            return True
+        return False
+
+    def close(self) -> None:
+        self._stream.stop_stream()
+        self._stream.close()
+
+
+class _PyAudioInputStream:
+    def __init__(self, stream, channels: int):
+        self._stream = stream
+        self._channels = channels
+
+    def read(self, frames: int) -> Tuple[np.ndarray, bool]:
+        try:
+            raw = self._stream.read(frames, exception_on_overflow=True)
+        except IOError as exc:
+            # PortAudio reports the overflow with the block, but PyAudio drops the
+            # block when it raises. Silence in its place keeps one read per block,
+            # so the capture stays aligned with the playback.
+            if exc.errno != pyaudio.paInputOverflowed:
+                raise
+            return np.zeros(frames * self._channels, dtype=np.float32), True
+        return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0, False
+
+    def close(self) -> None:
+        self._stream.stop_stream()
+        self._stream.close()
+
+
+class PyAudioBackend(AudioBackend):
+    """PortAudio devices: float32 output streams and int16 input streams."""
+
+    def __init__(self):
+        if pyaudio is None:
+            raise RuntimeError(
+                "PyAudio is not installed; install it or use SimulatedBackend for offline runs"
+            )
+        self._pa = None
+
+    def _instance(self):
+        if self._pa is None:
+            self._pa = pyaudio.PyAudio()
+        return self._pa
+
+    def open_output(
+        self,
+        channels: int,
+        rate: int,
+        frames_per_buffer: int,
+        device_index: Optional[int] = None,
+        callback: Optional[OutputCallback] = None,
+        role: str = "control",
+    ):
+        stream_callback = None
+        if callback is not None:
+
+            def stream_callback(in_data, frame_count, time_info, status):
+                return callback(frame_count).tobytes(), pyaudio.paContinue
+
+        stream = self._instance().open(
+            format=pyaudio.paFloat32,
+            channels=channels,
+            rate=rate,
+            output=True,
+            frames_per_buffer=frames_per_buffer,
+            output_device_index=device_index,
+            stream_callback=stream_callback,
+        )
+        return _PyAudioOutputStream(stream)
+
+    def open_input(
+        self,
+        channels: int,
+        rate: int,
+        frames_per_buffer: int,
+        device_index: Optional[int] = None,
+        callback: Optional[InputCallback] = None,
+    ):
+        stream_callback = None
+        if callback is not None:
+            scratch = np.zeros(frames_per_buffer * channels, dtype=np.float32)
+
+            def stream_callback(in_data, frame_count, time_info, status):
+                raw = np.frombuffer(in_data, dtype=np.int16)
+                samples = scratch[: len(raw)] if len(raw) <= len(scratch) else np.empty(len(raw), np.float32)
+                np.multiply(raw, 1.0 / 32768.0, out=samples)
+                callback(samples, bool(status & pyaudio.paInputOverflow))
+                return None, pyaudio.paContinue
+
+        stream = self._instance().open(
+            format=pyaudio.paInt16,
+            channels=channels,
+            rate=rate,
+            input=True,
+            frames_per_buffer=frames_per_buffer,
+            input_device_index=device_index,
+            stream_callback=stream_callback,
+        )
+        return _PyAudioInputStream(stream, channels)
+
+    def terminate(self) -> None:
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+
+class _BlockConvolver:
+    """
+    Streaming FIR filter bank applied with FFT overlap-add.
+
+    ``fir`` has shape (outputs, inputs, taps); ``process`` maps an
+    (n, inputs) block to (n, outputs), summing over inputs, and carries the
+    convolution tail into the next call so blocks may have any length.
+    """
+
+    def __init__(self, fir: np.ndarray):
+        self.fir = np.asarray(fir, dtype=np.float64)
+        outputs, _, taps = self.fir.shape
+        self._tail = np.zeros((taps - 1, outputs))
+        self._spectra: dict = {}
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        n = len(block)
+        taps = self.fir.shape[2]
+        size = 1 << (n + taps - 2).bit_length()
+        spectrum = self._spectra.get(size)
+        if spectrum is None:
+            spectrum = self._spectra[size] = np.fft.rfft(self.fir, size, axis=-1)
+        mixed = np.einsum("kmf,fm->fk", spectrum, np.fft.rfft(block, size, axis=0))
+        out = np.fft.irfft(mixed, size, axis=0)[: n + taps - 1]
+        out[: taps - 1] += self._tail
+        self._tail = out[n:].copy()
+        return out[:n]
+
+
+class SimulatedRoom:
+    """
+    Sample-accurate acoustic model of a room with control speakers and microphones.
+
+    The error microphones hear the disturbance through the primary path and
+    the control speakers through the secondary paths, plus optional sensor
+    noise. Sound leaves the speakers ``delay_samples`` after it is written,
+    which models converter and buffering latency.
+
+    Parameters
+    ----------
+    primary_path:
+        FIR from the noise source to the error microphones: (P,) or (K, P).
+    secondary_path:
+        FIR from the control speakers to the error microphones: (S,), or
+        (K, M, S) for several speakers.
+    source:
+        Disturbance signal (any sliceable 1-D sequence, e.g. a
+        ``WavReference``), started at the room's time zero. Anything written
+        to a ``"reference"`` output stream is added to it.
+    loop_source:
+        If True, ``source`` repeats; otherwise it is followed by silence.
+    delay_samples:
+        Output-to-input latency added to both speaker types.
+    noise_level:
+        Standard deviation of white noise added to every microphone.
+    nonlinearity:
+        Optional function applied to the control speaker signal before the
+        secondary path, e.g. ``np.tanh`` for a saturating loudspeaker.
+    error_channels:
+        Input channels carrying the K error microphones.
+    reference_channel:
+        Optional input channel carrying a reference microphone that hears the
+        source through ``reference_mic_path`` (a delta by default).
+    reference_mic_path:
+        FIR from the noise source to the reference microphone.
+    seed:
+        Seed for the sensor noise.
+    """
+
+    def __init__(
+        self,
+        primary_path: np.ndarray,
+        secondary_path: np.ndarray,
+        source=None,
+        loop_source: bool = True,
+        delay_samples: int = 0,
+        noise_level: float = 0.0,
+        nonlinearity: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        error_channels=(0,),
+        reference_channel: Optional[int] = None,
+        reference_mic_path: Optional[np.ndarray] = None,
+        seed: Optional[int] = None,
+    ):
+        self.error_channels = [int(channel) for channel in error_channels]
+        n_errors = len(self.error_channels)
+
+        primary = np.asarray(primary_path, dtype=np.float64)
+        if primary.ndim == 1:
+            primary = np.broadcast_to(primary, (n_errors, len(primary)))
+        secondary = np.asarray(secondary_path, dtype=np.float64)
+        if secondary.ndim == 1:
+            secondary = np.broadcast_to(secondary, (n_errors, 1, len(secondary)))
+        if primary.shape[0] != n_errors or secondary.ndim != 3 or secondary.shape[0] != n_errors:
+            raise ValueError("primary_path and secondary_path must have one row per error channel")
+        if reference_channel is not None and reference_channel in self.error_channels:
+            raise ValueError("reference_channel must not be one of error_channels")
+        if delay_samples < 0:
+            raise ValueError("delay_samples must be non-negative")
+
+        self.primary_path = np.array(primary)
+        self.secondary_path = np.array(secondary)
+        self.n_speakers = secondary.shape[1]
+        self.source = source
+        self.loop_source = loop_source
+        self.delay_samples = int(delay_samples)
+        self.noise_level = noise_level
+        self.nonlinearity = nonlinearity
+        self.reference_channel = reference_channel
+        if reference_mic_path is None:
+            reference_mic_path = np.ones(1)
+        self.reference_mic_path = np.asarray(reference_mic_path, dtype=np.float64)
+        self.seed = seed
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Return to time zero with silent speakers."""
+        with self._lock:
+            self.clock = 0
+            self.control_underflows = 0
+            self._rng = np.random.default_rng(self.seed)
+            self._control_queue: List[np.ndarray] = [np.zeros((self.delay_samples, self.n_speakers))]
+            self._reference_queue: List[np.ndarray] = [np.zeros(self.delay_samples)]
+            self._primary = _BlockConvolver(self.primary_path[:, None, :])
+            self._secondary = _BlockConvolver(self.secondary_path)
+            self._reference_mic = _BlockConvolver(self.reference_mic_path[None, None, :])
+
+    def play_control(self, samples: np.ndarray) -> None:
+        """Queue interleaved control-speaker samples."""
+        with self._lock:
+            self._control_queue.append(np.asarray(samples, np.float64).reshape(-1, self.n_speakers))
+
+    def play_reference(self, samples: np.ndarray) -> None:
+        """Queue samples for the noise (reference) speaker."""
+        with self._lock:
+            self._reference_queue.append(np.asarray(samples, np.float64).reshape(-1))
+
+    def capture(self, frames: int, channels: int) -> np.ndarray:
+        """Advance the room by ``frames`` samples and return interleaved microphone data."""
+        with self._lock:
+            control = self._pop(self._control_queue, frames, (self.n_speakers,))
+            if self.nonlinearity is not None:
+                control = self.nonlinearity(control)
+            disturbance = self._source_block(frames) + self._pop(self._reference_queue, frames, ())
+
+            mic = self._primary.process(disturbance[:, None]) + self._secondary.process(control)
+            if self.noise_level:
+                mic += self._rng.normal(0.0, self.noise_level, size=mic.shape)
+
+            out = np.zeros((frames, channels), dtype=np.float32)
+            for k, channel in enumerate(self.error_channels):
+                if channel < channels:
+                    out[:, channel] = mic[:, k]
+            reference = self._reference_mic.process(disturbance[:, None])[:, 0]
+            if self.reference_channel is not None and self.reference_channel < channels:
+                out[:, self.reference_channel] = reference
+            self.clock += frames
+        np.clip(out, -1.0, 1.0, out=out)
+        return out.reshape(-1)
+
+    def _pop(self, queue: List[np.ndarray], frames: int, shape: tuple) -> np.ndarray:
+        """
+        Take ``frames`` samples from a speaker queue, padding a shortfall with silence.
+
+        Afterwards only the samples missing from ``delay_samples`` are re-added
+        as silence, so whatever is written next plays ``delay_samples`` later
+        however far the queue had run down, and an underrun does not add to it.
+        """
+        out = np.zeros((frames,) + shape)
+        pos = 0
+        while queue and pos < frames:
+            head = queue[0]
+            take = min(len(head), frames - pos)
+            out[pos : pos + take] = head[:take]
+            pos += take
+            if take == len(head):
+                queue.pop(0)
+            else:
+                queue[0] = head[take:]
+        if pos < frames and queue is self._control_queue:
+            self.control_underflows += 1
+        missing = self.delay_samples - sum(len(chunk) for chunk in queue)
+        if missing > 0:
+            queue.append(np.zeros((missing,) + shape))
+        return out
+
+    def _source_block(self, frames: int) -> np.ndarray:
+        out = np.zeros(frames)
+        if self.source is None or len(self.source) == 0:
+            return out
+        n_total = len(self.source)
+        pos = 0
+        start = self.clock
+        while pos < frames:
+            if start >= n_total:
+                if not self.loop_source:
+                    break
+                start %= n_total
+            take = min(frames - pos, n_total - start)
+            out[pos : pos + take] = self.source[start : start + take]
+            pos += take
+            start += take
+        return out
+
+
+class _SimulatedOutputStream:
+    def __init__(self, backend: "SimulatedBackend", channels: int, role: str, callback, frames: int):
+        self.backend = backend
+        self.channels = channels
+        self.role = role
+        self.callback = callback
+        self.frames = frames
+
+    def write(self, samples: np.ndarray) -> bool:
+        if self.role == "reference":
+            self.backend.room.play_reference(samples)
+        else:
+            self.backend.room.play_control(samples)
+        return False
+
+    def close(self) -> None:
+        self.backend._remove(self)
+
+
+class _SimulatedInputStream:
+    def __init__(self, backend: "SimulatedBackend", channels: int, callback, frames: int):
+        self.backend = backend
+        self.channels = channels
+        self.callback = callback
+        self.frames = frames
+
+    def read(self, frames: int) -> Tuple[np.ndarray, bool]:
+        return self.backend.room.capture(frames, self.channels), False
+
+    def close(self) -> None:
+        self.backend._remove(self)
+
+
+class SimulatedBackend(AudioBackend):
+    """
+    Streams backed by a ``SimulatedRoom``.
+
+    Parameters
+    ----------
+    room:
+        The acoustic model shared by all streams.
+    speed:
+        Clock rate of callback streams relative to real time. Blocking
+        streams are not paced at all.
+    """
+
+    def __init__(self, room: SimulatedRoom, speed: float = 1.0):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        self.room = room
+        self.speed = speed
+        self._callback_streams: list = []
+        self._streams_lock = threading.Lock()
+        self._clock_thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def open_output(
+        self,
+        channels: int,
+        rate: int,
+        frames_per_buffer: int,
+        device_index: Optional[int] = None,
+        callback: Optional[OutputCallback] = None,
+        role: str = "control",
+    ):
+        if role == "control" and channels != self.room.n_speakers:
+            raise ValueError(
+                f"Control stream has {channels} channels but the room has {self.room.n_speakers} speakers"
+            )
+        stream = _SimulatedOutputStream(self, channels, role, callback, frames_per_buffer)
+        if callback is not None:
+            self._add(stream, rate)
+        return stream
+
+    def open_input(
+        self,
+        channels: int,
+        rate: int,
+        frames_per_buffer: int,
+        device_index: Optional[int] = None,
+        callback: Optional[InputCallback] = None,
+    ):
+        stream = _SimulatedInputStream(self, channels, callback, frames_per_buffer)
+        if callback is not None:
+            self._add(stream, rate)
+        return stream
+
+    def terminate(self) -> None:
+        self._running = False
+        if self._clock_thread is not None:
+            self._clock_thread.join()
+            self._clock_thread = None
+
+    def _add(self, stream, rate: int) -> None:
+        with self._streams_lock:
+            self._callback_streams.append(stream)
+        if self._clock_thread is None:
+            self._running = True
+            self._clock_thread = threading.Thread(
+                target=self._drive, args=(stream.frames, rate), name="simulated-audio", daemon=True
+            )
+            self._clock_thread.start()
+
+    def _remove(self, stream) -> None:
+        with self._streams_lock:
+            if stream in self._callback_streams:
+                self._callback_streams.remove(stream)
+            idle = not self._callback_streams
+        if idle and self._clock_thread is not None and threading.current_thread() is not self._clock_thread:
+            self.terminate()
+
+    def _drive(self, frames: int, rate: int) -> None:
+        """Clock thread: each period pull from output callbacks, then push captured audio."""
+        period = frames / rate / self.speed
+        next_tick = time.monotonic()
+        while self._running:
+            with self._streams_lock:
+                streams = list(self._callback_streams)
+            inputs = [s for s in streams if isinstance(s, _SimulatedInputStream)]
+            # Speakers only advance together with a microphone clock.
+            if inputs:
+                for stream in streams:
+                    if isinstance(stream, _SimulatedOutputStream):
+                        stream.write(stream.callback(frames))
+                for stream in inputs:
+                    stream.callback(self.room.capture(frames, stream.channels), False)
+            # Resume from "now" after a stall rather than firing the missed
+            # periods back to back, which would only drain the rings.
+            now = time.monotonic()
+            next_tick = max(next_tick + period, now)
+            time.sleep(next_tick - now)
@@ -0,0 +1,281 @@
+"""
+Benchmark suite for the FxLMS engines.
+
+Drives the controller's DSP path (reference fetch, decimation, synthesis,
+interpolation, latency alignment and weight update) block by block without
+opening any audio device, for every combination of the swept parameters, and
+reports a JSON document:
+
+``samples_per_second``
+    Device-rate samples processed per second of DSP time.
+``real_time_factor``
+    DSP time divided by the audio time it covers; below 1 the configuration
+    keeps up in real time, and ``1 / real_time_factor`` is the headroom.
+``block_latency_us``
+    Percentiles of the per-block processing time, next to the block deadline
+    ``block_size / sample_rate`` and the number of blocks that missed it.
+``peak_memory_bytes``
+    Peak Python allocation (``tracemalloc``) while building the controller and
+    processing ``memory_blocks`` blocks. Measured in a separate pass, because
+    tracing slows the timed pass down.
+
+Run it as ``python fxlms_controller.py bench ...`` or ``python benchmark.py ...``.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import DEFAULT_SAMPLE_RATE, ENGINES, UPDATE_RULES, FxLMSANC
+
+DEFAULT_BENCH_FILTER_LENGTHS = (128, 512)
+DEFAULT_BENCH_BLOCK_SIZES = (64, 256)
+DEFAULT_BENCH_ENGINES = ("loop", "block", "frequency")
+DEFAULT_BENCH_BLOCKS = 200
+DEFAULT_BENCH_WARMUP_BLOCKS = 10
+LATENCY_PERCENTILES = (50, 90, 99)
+# Length of the synthetic reference file; blocks beyond it loop.
+BENCH_REFERENCE_SECONDS = 5.0
+
+
+def _write_noise_wav(path: str, sample_rate: int, seconds: float, seed: int = 0) -> None:
+    """Write white noise as a mono 16-bit WAV to serve as the reference."""
+    noise = np.random.default_rng(seed).uniform(-0.5, 0.5, int(sample_rate * seconds))
+    with wave.open(path, "wb") as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(sample_rate)
+        handle.writeframes((noise * 32767).astype("<i2").tobytes())
+
+
+def _process_blocks(controller: FxLMSANC, n_blocks: int) -> np.ndarray:
+    """
+    Run ``n_blocks`` blocks through the DSP path and return their durations in seconds.
+
+    This is the controller's own per-block step, with the audio exchange
+    replaced by an error signal that is a scaled copy of the reference,
+    which keeps the update rules numerically busy without a room model.
+    """
+
+    def exchange(anti_noise_block: np.ndarray, ref_block: np.ndarray) -> np.ndarray:
+        return 0.1 * ref_block
+
+    durations = np.empty(n_blocks)
+    for index in range(n_blocks):
+        start = time.perf_counter()
+        controller._process_block(controller._next_reference_block(loop=True), exchange)
+        controller.frame_index += 1
+        durations[index] = time.perf_counter() - start
+    return durations
+
+
+def benchmark_configuration(
+    reference_path: str,
+    n_blocks: int = DEFAULT_BENCH_BLOCKS,
+    warmup_blocks: int = DEFAULT_BENCH_WARMUP_BLOCKS,
+    memory_blocks: int = 20,
+    **controller_kwargs,
+) -> Dict:
+    """
+    Benchmark a single controller configuration.
+
+    ``controller_kwargs`` are passed to ``FxLMSANC``; the result holds them
+    together with the measurements described in the module docstring.
+    """
+    def build() -> FxLMSANC:
+        room = SimulatedRoom(np.ones(1), np.ones(1))
+        return FxLMSANC(reference_path, audio_backend=SimulatedBackend(room), **controller_kwargs)
+
+    controller = build()
+    _process_blocks(controller, warmup_blocks)
+    durations = _process_blocks(controller, n_blocks)
+
+    tracemalloc.start()
+    try:
+        traced = build()
+        _process_blocks(traced, memory_blocks)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    sample_rate = controller.sample_rate
+    block_size = controller.block_size
+    deadline = block_size / sample_rate
+    total = float(durations.sum())
+    audio_seconds = n_blocks * deadline
+    latency = {f"p{q}": float(np.percentile(durations, q)) * 1e6 for q in LATENCY_PERCENTILES}
+    latency["max"] = float(durations.max()) * 1e6
+
+    return {
+        "config": dict(controller_kwargs, sample_rate=sample_rate, block_size=block_size),
+        "blocks": n_blocks,
+        "samples_per_second": n_blocks * block_size / total,
+        "real_time_factor": total / audio_seconds,
+        "block_deadline_us": deadline * 1e6,
+        "block_latency_us": latency,
+        "deadline_misses": int(np.count_nonzero(durations > deadline)),
+        "peak_memory_bytes": int(peak_memory),
+        "rejected_updates": controller.rejected_updates,
+    }
+
+
+def run_benchmark(
+    filter_lengths: Iterable[int] = DEFAULT_BENCH_FILTER_LENGTHS,
+    block_sizes: Iterable[int] = DEFAULT_BENCH_BLOCK_SIZES,
+    engines: Iterable[str] = DEFAULT_BENCH_ENGINES,
+    sample_rates: Iterable[int] = (DEFAULT_SAMPLE_RATE,),
+    update_rules: Iterable[str] = ("lms",),
+    decimation: int = 1,
+    n_blocks: int = DEFAULT_BENCH_BLOCKS,
+    warmup_blocks: int = DEFAULT_BENCH_WARMUP_BLOCKS,
+) -> Dict:
+    """
+    Sweep every combination of the given parameters.
+
+    Combinations the controller rejects (for example ``"rls"`` with the
+    frequency engine) are listed with the reason instead of measurements.
+    """
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory(prefix="anc-bench-") as workdir:
+        for sample_rate in sample_rates:
+            reference_path = os.path.join(workdir, f"noise_{sample_rate}.wav")
+            _write_noise_wav(reference_path, sample_rate, BENCH_REFERENCE_SECONDS)
+            sweep = itertools.product(engines, update_rules, filter_lengths, block_sizes)
+            for engine, update_rule, filter_length, block_size in sweep:
+                config = dict(
+                    sample_rate=sample_rate,
+                    engine=engine,
+                    update_rule=update_rule,
+                    filter_length=filter_length,
+                    block_size=block_size,
+                    decimation=decimation,
+                )
+                if engine == "narrowband":
+                    config["fundamental_hz"] = 100.0
+                try:
+                    result = benchmark_configuration(
+                        reference_path, n_blocks=n_blocks, warmup_blocks=warmup_blocks, **config
+                    )
+                except ValueError as exc:
+                    result = {"config": config, "skipped": str(exc)}
+                else:
+                    logging.info(
+                        "%s/%s L=%d B=%d @%d Hz: RTF %.3f, p99 %.0f us",
+                        engine,
+                        update_rule,
+                        filter_length,
+                        block_size,
+                        sample_rate,
+                        result["real_time_factor"],
+                        result["block_latency_us"]["p99"],
+                    )
+                results.append(result)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def build_benchmark_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="fxlms_controller.py bench",
+        description="Benchmark the ANC engines without audio devices.",
+    )
+    parser.add_argument(
+        "--filter-lengths",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_BENCH_FILTER_LENGTHS),
+        help="Control filter lengths to sweep",
+    )
+    parser.add_argument(
+        "--block-sizes",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_BENCH_BLOCK_SIZES),
+        help="Block sizes to sweep",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=ENGINES,
+        default=list(DEFAULT_BENCH_ENGINES),
+        help="Engines to sweep",
+    )
+    parser.add_argument(
+        "--sample-rates",
+        type=int,
+        nargs="+",
+        default=[DEFAULT_SAMPLE_RATE],
+        help="Device sample rates to sweep",
+    )
+    parser.add_argument(
+        "--update-rules",
+        nargs="+",
+        choices=UPDATE_RULES,
+        default=["lms"],
+        help="Weight update rules to sweep",
+    )
+    parser.add_argument("--decimation", type=int, default=1, help="Decimation factor for all runs")
+    parser.add_argument(
+        "--blocks",
+        type=int,
+        default=DEFAULT_BENCH_BLOCKS,
+        help="Timed blocks per configuration",
+    )
+    parser.add_argument(
+        "--warmup-blocks",
+        type=int,
+        default=DEFAULT_BENCH_WARMUP_BLOCKS,
+        help="Untimed blocks before measuring",
+    )
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_benchmark_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    report = run_benchmark(
+        filter_lengths=args.filter_lengths,
+        block_sizes=args.block_sizes,
+        engines=args.engines,
+        sample_rates=args.sample_rates,
+        update_rules=args.update_rules,
+        decimation=args.decimation,
+        n_blocks=args.blocks,
+        warmup_blocks=args.warmup_blocks,
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(text + "\n")
+        logging.info("Benchmark report written to %s", args.output)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,31 +6,213 @@ with the filtered-x LMS algorithm, and plays the anti-noise through a speaker
 while adapting the control filter using feedback from an error microphone that
 is positioned at the listener's ear location.
 
+Instead of a recording, the reference can also be captured live from a
+reference microphone (``live_reference_channel``). It is read in the same
+multi-channel input stream as the error microphone, so both stay
+sample-aligned, and each captured block goes straight into the engine.
+
 The implementation favours clarity over raw performance so you can iterate on
 the DSP without diving into C extensions. The core loop operates on short
 blocks (default: 256 samples) and keeps per-sample state to perform the
 filtered-x weight updates.
+
+Two interchangeable engines are available through the ``engine`` option:
+
+``"loop"``
+    The reference implementation. Shifts the history buffers and evaluates
+    the filters one sample at a time.
+``"block"``
+    Computes the anti-noise, the filtered-x matrix and the weight update for a
+    whole block with batched NumPy operations. Within a block the control
+    filter is held constant and the per-sample LMS increments do not depend on
+    the weights, so the result is the same as the loop engine up to float32
+    summation order (``BLOCK_ENGINE_RTOL``/``BLOCK_ENGINE_ATOL``).
+``"frequency"``
+    Frequency-domain block FxLMS for long control filters (1024-4096 taps).
+    Filtering and the gradient are computed with overlap-save FFTs of size
+    ``N >= filter_length + block_size - 1`` and the update is normalised per
+    frequency bin. With ``block_size`` close to ``filter_length`` the cost per
+    sample grows with ``log(filter_length)`` instead of ``filter_length``.
+``"narrowband"``
+    Harmonic controller for tonal hum (refrigerators, air conditioners).
+    Tracks the fundamental of the reference and adapts a cosine/sine weight
+    pair per harmonic on a synthetic reference, O(harmonics) per sample. The
+    filtered reference uses the secondary-path response at each harmonic.
+
+Audio I/O runs in one of two modes (``io_mode``). ``"blocking"`` writes the
+anti-noise and then reads the error microphone from the calling thread.
+``"callback"`` lets PortAudio drive playback and capture through preallocated
+ring buffers while a dedicated DSP thread runs the engine, so DSP, playback and
+capture overlap and small blocks (32-64 samples) keep their deadline.
+
+The error captured after writing anti-noise block ``k`` is really the response
+to an earlier block because of buffering and acoustic delay. After
+``measure_loop_latency`` (or with ``latency_samples`` given), whole blocks of
+that delay are compensated by pairing each error block with the filtered-x data
+of the matching past block; the sub-block remainder is left to the secondary
+path model, which ``measure_secondary_path`` estimates on the same alignment.
+
+GOYO only targets 20-250 Hz, so with ``decimation=M`` the reference and error
+signals are decimated by polyphase anti-alias filters and the engine adapts at
+``sample_rate / M`` (1-2 kHz); the anti-noise is interpolated back to the device
+rate. ``filter_length`` and the secondary path are then expressed in samples
+at the reduced rate, which cuts the cost for a given acoustic filter span by
+about ``M**2``.
+
+Because the reference is a prerecorded file, ``fx_cache=True`` convolves it
+with the secondary-path estimate once (FFT, chunked) and then indexes the
+filtered-x signal per block instead of filtering sample by sample. The cache is
+keyed by the file hash and the path coefficients, can live on disk
+(``fx_cache_dir``) and is dropped whenever ``secondary_path`` changes.
+
+The ``update_rule`` option selects how the time-domain engines adapt the
+weights from the filtered-x matrix:
+
+``"lms"``
+    The original (N)LMS update, O(L) per sample.
+``"apa"``
+    Affine projection of order P over consecutive groups of P samples,
+    O(L P + P**2) per sample. Decorrelates coloured (low-frequency) reference
+    signals and converges much faster than NLMS.
+``"rls"``
+    Exponentially weighted block RLS (Woodbury update of the inverse
+    correlation matrix), O(L**2) per sample. Fastest convergence, for moderate
+    filter lengths only.
+
+With ``online_secondary_path=True`` the secondary path keeps being identified
+while the controller runs: low-level white auxiliary noise is added to the
+anti-noise, an NLMS modelling filter predicts its contribution at the error
+mic, and the estimate is hot-swapped into the engine every
+``secondary_path_update_interval`` blocks. The modelled auxiliary component is
+removed from the error before the control update.
+
+The auxiliary level and the modelling step trade against each other. The
+uncancelled noise is the modelling filter's measurement noise, so a quiet
+auxiliary signal needs a small step or the model wanders off (level 0.01
+with step 0.05 never converges). The level also sets the floor of the
+residual: roughly ``aux_noise_level / sqrt(3)`` times the secondary-path gain
+stays audible. A smaller step lowers the misadjustment but slows the
+identification by the same factor.
+
+Reference files are read through ``WavReference``, which memory-maps the PCM
+data instead of loading it, so hour-long multichannel recordings cost no more
+memory than a short clip.
+
+Streams come from an ``audio_backend`` (see ``audio_backend.py``): PortAudio
+devices by default, or a ``SimulatedBackend`` whose ``SimulatedRoom`` applies
+primary and secondary impulse responses, so the same ``run()`` can be profiled
+and reproduced offline (``max_blocks`` bounds such runs).
+
+The engines compute ``y`` such that ``s * y`` matches the disturbance; the
+speaker plays ``-y`` so that the two cancel at the error microphone, whose
+signal ``e = d - s * y`` drives the updates.
 """
 
 from __future__ import annotations
 
 import argparse
+import copy
+import hashlib
+import json
 import logging
 import os
+import struct
 import sys
+import threading
 import time
-import wave
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import astuple, dataclass, fields
 from typing import Callable, Optional, Sequence, Tuple
 
 import numpy as np
-import pyaudio  # type: ignore
+from audio_backend import AudioBackend, PyAudioBackend, SimulatedBackend, SimulatedRoom
+from instrumentation import COMPUTE_STAGES, STAGES, RunInstrumentation
+from profile_switcher import AncProfile, ClassifierFeed, ProfileSwitcher
+from session_recorder import RECORDING_FORMATS, SessionRecorder
+from weight_store import DEFAULT_NOISE_CLASS, StoredWeights, WeightStore
 
 
 DEFAULT_SAMPLE_RATE = 16_000
 DEFAULT_FILTER_LENGTH = 128
 DEFAULT_BLOCK_SIZE = 128
+DEFAULT_STEP_SIZE = 5e-4
 EPSILON = 1e-9  # Small constant to avoid divide-by-zero
+# Regularization of the normalized LMS step, per filter tap: filtered-x power
+# below about -60 dBFS is not normalized up. Right after a reset the fx window
+# is nearly empty, and with a measured secondary path its few nonzero values
+# come from the model's noise floor; normalizing by their energy alone turns
+# the first updates into huge, random steps.
+NLMS_REGULARIZATION = 1e-6
+ENGINES = ("loop", "block", "frequency", "narrowband")
+DEFAULT_ENGINE = "loop"
+# What the frozen filter of a profile crossfade takes over from the controller:
+# settings and read-only data it shares, and the filter state it copies.
+SNAPSHOT_SHARED = (
+    "engine", "filter_length", "block_size", "control_block_size", "control_rate", "sample_rate",
+    "harmonics", "track_frequency", "fx_cache", "fx_cache_dir", "reference_signal", "reference_path",
+    "_reference_digest", "_secondary_path", "_fx_cache", "fft_size",
+)
+SNAPSHOT_COPIED = (
+    "weights", "ref_history", "sec_history", "fx_history",
+    "tracked_frequency", "_nb_phase", "_nb_last_demodulation", "_nb_acquisition",
+    "_fd_ref_buffer", "_fd_fx_buffer", "_fd_error_buffer", "_fd_sec_spectrum", "_fd_weight_spectrum", "_fd_power",
+)
+# Agreement between the "block" and "loop" engines (anti-noise and weights),
+# limited only by float32 accumulation order.
+BLOCK_ENGINE_RTOL = 1e-4
+BLOCK_ENGINE_ATOL = 1e-6
+# Forgetting factor of the per-bin power estimate used by the frequency engine.
+FREQUENCY_POWER_SMOOTHING = 0.9
+IO_MODES = ("blocking", "callback")
+DEFAULT_IO_MODE = "blocking"
+DEFAULT_CALLBACK_BUFFER_BLOCKS = 4
+# How long the DSP thread waits for the audio callbacks before giving up.
+CALLBACK_STALL_TIMEOUT = 2.0
+# Samples kept in the secondary-path model when compensating whole blocks of
+# latency, so the onset of the response never falls before the first tap.
+LATENCY_GUARD_SAMPLES = 16
+# Measured secondary-path model: at least this many taps, and always this many
+# past the uncompensated latency for the speaker/microphone response itself.
+DEFAULT_SECONDARY_PATH_LENGTH = 64
+SECONDARY_PATH_TAIL_TAPS = 48
+# Anti-alias/anti-image filter of the multirate pipeline: taps per polyphase
+# branch and passband edge as a fraction of the reduced Nyquist frequency.
+MULTIRATE_TAPS_PER_PHASE = 16
+MULTIRATE_CUTOFF = 0.8
+# Chunk length of the FFT convolution that builds the filtered-x cache.
+FX_CACHE_CHUNK = 1 << 16
+FX_CACHE_VERSION = 1
+SECONDARY_PATH_METHODS = ("wiener", "lstsq")
+# Diagonal loading of the Wiener-Hopf system relative to the excitation power.
+WIENER_REGULARIZATION = 1e-6
+# Online secondary-path modelling: about -35 dBFS of auxiliary noise and a
+# step small enough to average out the disturbance (see the module docstring).
+DEFAULT_AUX_NOISE_LEVEL = 0.05
+DEFAULT_AUX_STEP_SIZE = 0.002
+DEFAULT_HARMONICS = 4
+# Fundamental search range and reference length used when no fundamental is given.
+NARROWBAND_MIN_HZ = 20.0
+NARROWBAND_MAX_HZ = 250.0
+NARROWBAND_ACQUISITION_SECONDS = 1.0
+# Frequency-locked loop: share of the measured offset applied per block, and
+# the minimum fraction of reference power at the fundamental to trust it.
+NARROWBAND_TRACKING_GAIN = 0.5
+NARROWBAND_COHERENCE_MIN = 0.1
+UPDATE_RULES = ("lms", "apa", "rls")
+DEFAULT_PROJECTION_ORDER = 4
+# Diagonal loading of the affine-projection Gram matrices (relative to their trace).
+APA_REGULARIZATION = 1e-3
+# Upper bound on step_size times the number of projections per block.
+APA_MAX_BLOCK_STEP = 1.0
+DEFAULT_RLS_FORGETTING = 0.999
+# Initial inverse correlation matrix is I / RLS_INITIAL_DELTA.
+RLS_INITIAL_DELTA = 1e-2
+# The L x L inverse correlation matrix becomes impractical beyond this.
+RLS_MAX_FILTER_LENGTH = 1024
+# Reinitialise the inverse correlation matrix if its trace exceeds this.
+RLS_MAX_TRACE = 1e12
+# Sound classifier that drives --profiles (classification_model/streaming_classifier.py).
+CLASSIFIER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "classification_model")
 
 
 @dataclass
@@ -40,31 +222,350 @@ class AncMetrics:
     frame_index: int
     error_rms: float
     step_size: float
+    latency_samples: int = 0
+    # Compute time of the block in seconds (0.0 without instrumentation).
+    dsp_time: float = 0.0
+    deadline_misses: int = 0
+    input_overflows: int = 0
+    output_underflows: int = 0
+
+
+# WAVE format tags (WAVE_FORMAT_EXTENSIBLE carries the real tag in its sub-format).
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavReference:
+    """
+    Memory-mapped, single-channel view of a PCM or float WAV file.
+
+    Supports 16/24/32-bit integer and 32-bit float samples. Nothing is decoded
+    up front: ``raw_view`` returns zero-copy strided views of the mapped file
+    and ``read_into`` converts just the requested range of one channel into a
+    caller-provided float32 buffer. Slicing returns a new float32 array.
+
+    Parameters
+    ----------
+    path:
+        WAV file to map.
+    channel:
+        Channel to expose from multichannel files.
+    """
+
+    def __init__(self, path: str, channel: int = 0):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Reference audio not found: {path}")
+
+        self.path = path
+        fmt, data_offset, data_size = self._parse_header(path)
+        format_tag, channels, sample_rate, block_align, bits = fmt
+
+        if not 0 <= channel < channels:
+            raise ValueError(f"Channel {channel} out of range for {channels}-channel file")
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.channel = channel
+        self.sample_width = bits // 8
+        self.n_frames = data_size // block_align
+
+        if format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+            dtype, self._scale = np.dtype("<f4"), 1.0
+        elif format_tag == _WAVE_FORMAT_PCM and bits == 16:
+            dtype, self._scale = np.dtype("<i2"), 1.0 / 32768.0
+        elif format_tag == _WAVE_FORMAT_PCM and bits == 24:
+            dtype, self._scale = None, 1.0 / 8388608.0
+        elif format_tag == _WAVE_FORMAT_PCM and bits == 32:
+            dtype, self._scale = np.dtype("<i4"), 1.0 / 2147483648.0
+        else:
+            raise ValueError(f"Unsupported sample format: tag {format_tag:#06x}, {bits} bits")
+
+        mapped = np.memmap(
+            path,
+            dtype=np.uint8,
+            mode="r",
+            offset=data_offset,
+            shape=(self.n_frames * block_align,),
+        )
+        frames = mapped.reshape(self.n_frames, block_align)
+        if dtype is None:
+            # (frames, 3) little-endian bytes of the selected channel.
+            self._samples = frames[:, channel * 3 : channel * 3 + 3]
+        else:
+            self._samples = frames.view(dtype)[:, channel]
+
+    @staticmethod
+    def _parse_header(path: str) -> Tuple[Tuple[int, int, int, int, int], int, int]:
+        """Locate the ``fmt `` and ``data`` chunks of a RIFF/WAVE file."""
+        file_size = os.path.getsize(path)
+        fmt = None
+        with open(path, "rb") as handle:
+            riff, _, wave_id = struct.unpack("<4sI4s", handle.read(12))
+            if riff != b"RIFF" or wave_id != b"WAVE":
+                raise ValueError(f"Not a RIFF/WAVE file: {path}")
+            while True:
+                header = handle.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"No data chunk in {path}")
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    body = handle.read(chunk_size)
+                    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack(
+                        "<HHIIHH", body[:16]
+                    )
+                    if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                        format_tag = struct.unpack("<H", body[24:26])[0]
+                    fmt = (format_tag, channels, sample_rate, block_align, bits)
+                    if chunk_size % 2:
+                        handle.seek(1, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    if fmt is None:
+                        raise ValueError(f"data chunk before fmt chunk in {path}")
+                    data_offset = handle.tell()
+                    # Streaming writers may leave the size unset; trust the file.
+                    data_size = min(chunk_size, file_size - data_offset)
+                    return fmt, data_offset, data_size
+                else:
+                    handle.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def raw_view(self, start: int, stop: int) -> np.ndarray:
+        """Zero-copy view of the stored samples (bytes triplets for 24-bit)."""
+        return self._samples[start:stop]
+
+    def read_into(self, start: int, out: np.ndarray) -> None:
+        """Convert ``len(out)`` samples starting at ``start`` into ``out``."""
+        raw = self._samples[start : start + len(out)]
+        if raw.ndim == 2:
+            value = (
+                raw[:, 0].astype(np.int32)
+                | (raw[:, 1].astype(np.int32) << 8)
+                | (raw[:, 2].view(np.int8).astype(np.int32) << 16)
+            )
+            np.multiply(value, self._scale, out=out, casting="unsafe")
+        elif self._scale == 1.0:
+            out[:] = raw
+        else:
+            np.multiply(raw, self._scale, out=out, casting="unsafe")
+
+    def __getitem__(self, index: slice) -> np.ndarray:
+        if not isinstance(index, slice):
+            raise TypeError("WavReference only supports slicing")
+        start, stop, step = index.indices(self.n_frames)
+        if step != 1:
+            raise ValueError("WavReference slices must be contiguous")
+        out = np.empty(max(0, stop - start), dtype=np.float32)
+        self.read_into(start, out)
+        return out
 
 
-def read_mono_wav(path: str) -> Tuple[np.ndarray, int]:
+def read_mono_wav(path: str, channel: int = 0) -> Tuple[np.ndarray, int]:
     """Load a WAV file as a float32 mono array in the range [-1, 1]."""
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Reference audio not found: {path}")
+    reference = WavReference(path, channel=channel)
+    return reference[:], reference.sample_rate
 
-    with wave.open(path, "rb") as wav_file:
-        channels = wav_file.getnchannels()
-        sample_width = wav_file.getsampwidth()
-        sample_rate = wav_file.getframerate()
-        n_frames = wav_file.getnframes()
-        raw = wav_file.readframes(n_frames)
 
-    if sample_width == 2:
-        data = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
-    elif sample_width == 4:
-        data = np.frombuffer(raw, dtype=np.int32).astype(np.float32) / 2147483648.0
-    else:
-        raise ValueError(f"Unsupported sample width: {sample_width * 8} bits")
+class _RingBuffer:
+    """
+    Preallocated single-producer/single-consumer float32 FIFO.
+
+    The producer only advances ``_write_count`` and the consumer only advances
+    ``_read_count``; both are published after the samples are copied, so the
+    audio callback and the DSP thread never need a lock.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._write_count = 0
+        self._read_count = 0
+
+    def available(self) -> int:
+        """Number of samples that can be read."""
+        return self._write_count - self._read_count
+
+    def free(self) -> int:
+        """Number of samples that can be written."""
+        return self.capacity - self.available()
+
+    def write(self, samples: np.ndarray) -> bool:
+        """Append ``samples``; returns False (writing nothing) if they do not fit."""
+        n = len(samples)
+        if n > self.free():
+            return False
+        start = self._write_count % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start : start + first] = samples[:first]
+        self._data[: n - first] = samples[first:]
+        self._write_count += n
+        return True
+
+    def read_into(self, out: np.ndarray) -> bool:
+        """Fill ``out`` from the buffer; returns False (reading nothing) on shortfall."""
+        n = len(out)
+        if n > self.available():
+            return False
+        start = self._read_count % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._data[start : start + first]
+        out[first:] = self._data[: n - first]
+        self._read_count += n
+        return True
+
+    def discard(self) -> None:
+        """Drop everything currently buffered (consumer side, or while no consumer runs)."""
+        self._read_count = self._write_count
+
+
+def _design_lowpass(num_taps: int, cutoff: float) -> np.ndarray:
+    """Windowed-sinc FIR lowpass with unity DC gain; ``cutoff`` is relative to Nyquist."""
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    taps = cutoff * np.sinc(cutoff * n) * np.blackman(num_taps)
+    return (taps / np.sum(taps)).astype(np.float32)
+
+
+class _PolyphaseDecimator:
+    """
+    Streaming lowpass-and-downsample by an integer factor.
+
+    Only every ``factor``-th output of the anti-alias filter is evaluated, which
+    is what the polyphase decomposition buys, using strided windows over the
+    filter history and the new block.
+    """
 
-    if channels > 1:
-        data = data.reshape(-1, channels)[:, 0]
+    def __init__(self, factor: int, taps_per_phase: int = MULTIRATE_TAPS_PER_PHASE):
+        self.factor = factor
+        self.taps = _design_lowpass(factor * taps_per_phase, MULTIRATE_CUTOFF / factor)
+        self._reversed_taps = self.taps[::-1].copy()
+        self._history = np.zeros(len(self.taps) - 1, dtype=np.float32)
 
-    return data, sample_rate
+    def process(self, block: np.ndarray) -> np.ndarray:
+        extended = np.concatenate([self._history, np.asarray(block, dtype=np.float32)])
+        windows = np.lib.stride_tricks.sliding_window_view(extended, len(self.taps))
+        out = windows[self.factor - 1 :: self.factor] @ self._reversed_taps
+        self._history = extended[len(extended) - len(self._history) :]
+        return out.astype(np.float32, copy=False)
+
+
+class _PolyphaseInterpolator:
+    """
+    Streaming upsample-and-lowpass by an integer factor.
+
+    The anti-image filter is split into ``factor`` branches that each run at
+    the low rate on the unstuffed input; their outputs are interleaved.
+    """
+
+    def __init__(self, factor: int, taps_per_phase: int = MULTIRATE_TAPS_PER_PHASE):
+        self.factor = factor
+        taps = _design_lowpass(factor * taps_per_phase, MULTIRATE_CUTOFF / factor) * factor
+        # phases[p, j] = taps[j * factor + p]
+        self._phases = taps.reshape(taps_per_phase, factor).T.copy()
+        self._history = np.zeros(taps_per_phase, dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        extended = np.concatenate([self._history, np.asarray(block, dtype=np.float32)])
+        windows = _history_windows(extended, self._phases.shape[1])
+        out = windows @ self._phases.T
+        self._history = extended[len(extended) - len(self._history) :]
+        return out.reshape(-1).astype(np.float32, copy=False)
+
+
+def _fft_filter(signal: np.ndarray, fir: np.ndarray, out: np.ndarray) -> None:
+    """
+    Write the full linear convolution of ``signal`` and ``fir`` into ``out``.
+
+    Overlap-save over ``FX_CACHE_CHUNK`` samples keeps the working set small,
+    so ``signal`` and ``out`` may be memory-mapped.
+    """
+    taps = len(fir)
+    size = 1 << (FX_CACHE_CHUNK + taps - 2).bit_length()
+    step = size - taps + 1
+    fir_spectrum = np.fft.rfft(fir, size)
+    padded_length = len(signal) + taps - 1
+    history = np.zeros(taps - 1, dtype=np.float32)
+    for start in range(0, padded_length, step):
+        chunk = np.asarray(signal[start : start + step], dtype=np.float32)
+        extended = np.concatenate([history, chunk])
+        filtered = np.fft.irfft(np.fft.rfft(extended, size) * fir_spectrum, size)
+        n_valid = min(step, padded_length - start)
+        out[start : start + n_valid] = filtered[taps - 1 : taps - 1 + n_valid]
+        if taps > 1:
+            history = np.concatenate([history, chunk, np.zeros(step - len(chunk), np.float32)])[-(taps - 1) :]
+
+
+def solve_toeplitz(column: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    """
+    Solve ``T x = rhs`` for the symmetric Toeplitz matrix with first column ``column``.
+
+    Levinson recursion in O(n**2) time and O(n) memory; ``T`` must be
+    positive definite (an autocorrelation sequence is).
+    """
+    column = np.asarray(column, dtype=np.float64)
+    rhs = np.asarray(rhs, dtype=np.float64)
+    n = len(rhs)
+    forward = np.zeros(n)
+    solution = np.zeros(n)
+    forward[0] = 1.0 / column[0]
+    solution[0] = rhs[0] / column[0]
+    for k in range(1, n):
+        lags = column[k:0:-1]
+        error = float(np.dot(lags, forward[:k]))
+        # [f; 0] and its reversal [0; b] span the order-(k + 1) forward vector.
+        padded = forward[: k + 1].copy()
+        padded[k] = 0.0
+        forward[: k + 1] = (padded - error * padded[::-1]) / (1.0 - error * error)
+        residual = rhs[k] - float(np.dot(lags, solution[:k]))
+        solution[: k + 1] += residual * forward[k::-1]
+    return solution
+
+
+class SecondaryPathEstimator:
+    """
+    Streaming Wiener-Hopf estimate of an FIR path from excitation/response blocks.
+
+    Each ``update`` adds the block's contribution to the auto-correlation of
+    the excitation and its cross-correlation with the response (lags
+    ``0..fir_length-1``, computed with FFTs). ``solve`` turns them into the FIR
+    with a Levinson solve, so memory stays O(fir_length) however long the
+    measurement runs and the model is ready as soon as the excitation stops.
+    """
+
+    def __init__(self, fir_length: int):
+        self.fir_length = fir_length
+        self._history = np.zeros(fir_length - 1, dtype=np.float64)
+        self._auto = np.zeros(fir_length, dtype=np.float64)
+        self._cross = np.zeros(fir_length, dtype=np.float64)
+        self.n_samples = 0
+
+    def update(self, excitation: np.ndarray, response: np.ndarray) -> None:
+        """Accumulate one block of excitation and the response it produced."""
+        excitation = np.asarray(excitation, dtype=np.float64)
+        response = np.asarray(response, dtype=np.float64)
+        lag_span = self.fir_length - 1
+        size = 1 << (len(excitation) + lag_span - 1).bit_length()
+
+        extended = np.concatenate([self._history, excitation])
+        extended_spectrum = np.conj(np.fft.rfft(extended, size))
+        # Current samples sit after ``lag_span`` zeros so lag k pairs n with n - k.
+        current = np.fft.rfft(np.concatenate([np.zeros(lag_span), excitation]), size)
+        answer = np.fft.rfft(np.concatenate([np.zeros(lag_span), response]), size)
+
+        self._auto += np.fft.irfft(extended_spectrum * current, size)[: self.fir_length]
+        self._cross += np.fft.irfft(extended_spectrum * answer, size)[: self.fir_length]
+        if lag_span:
+            self._history = extended[-lag_span:]
+        self.n_samples += len(excitation)
+
+    def solve(self) -> np.ndarray:
+        """Return the FIR minimising the squared response error so far."""
+        if self.n_samples == 0:
+            raise RuntimeError("No excitation has been accumulated")
+        auto = self._auto.copy()
+        auto[0] += WIENER_REGULARIZATION * auto[0] + EPSILON
+        return solve_toeplitz(auto, self._cross).astype(np.float32)
 
 
 class FxLMSANC:
@@ -74,24 +575,28 @@ class FxLMSANC:
     Parameters
     ----------
     reference_path:
-        WAV path for the prerecorded noise reference signal.
+        WAV path for the prerecorded noise reference signal. The file is
+        memory-mapped, not loaded. Leave as None when ``live_reference_channel``
+        is set.
     sample_rate:
         Desired operating sample rate. If None, the reference file's rate is used.
     filter_length:
         Number of taps in the adaptive control filter.
     step_size:
         LMS adaptation step. Smaller values converge slower but are safer.
+        Ignored by ``update_rule="rls"``, whose adaptation speed is set by
+        ``rls_forgetting``.
     block_size:
         Number of samples per processing block.
     secondary_path:
         FIR coefficients modelling the speaker→error mic transfer function.
         Provide a 1-D NumPy array. If omitted, an identity path is used.
     control_device_index:
-        PyAudio output device index for the anti-noise signal (speaker near user).
+        Output device index for the anti-noise signal (speaker near user).
     record_device_index:
-        Optional PyAudio input device index.
+        Optional input device index.
     reference_device_index:
-        Optional PyAudio output device index for the primary noise playback.
+        Optional output device index for the primary noise playback.
         Provide this when you need to feed the original noise into a separate
         loudspeaker. If omitted and ``play_reference`` is True, the reference
         signal is mixed into the control speaker instead (legacy behaviour).
@@ -99,156 +604,658 @@ class FxLMSANC:
         If True, the primary noise is audible. Either written to the dedicated
         reference speaker (when ``reference_device_index`` is set) or mixed into
         the control speaker output.
+    reference_channel:
+        Channel of the reference file to use.
+    live_reference_channel:
+        Input channel of ``record_device_index`` carrying a reference
+        microphone. Enables the live feedforward mode; ``sample_rate`` then
+        defaults to ``DEFAULT_SAMPLE_RATE``.
+    error_channel:
+        Input channel of ``record_device_index`` carrying the error microphone.
     normalize_step:
         If True, scales the step size by the energy of the filtered reference
         each sample (NLMS variant of FxLMS).
+    engine:
+        DSP engine, one of ``ENGINES``. ``"loop"`` runs the per-sample
+        reference implementation, ``"block"`` the vectorized one,
+        ``"frequency"`` the overlap-save frequency-domain variant and
+        ``"narrowband"`` the harmonic controller for tonal noise, with a
+        cosine/sine weight pair per harmonic (see ``harmonics``) instead of
+        ``filter_length`` taps.
+    io_mode:
+        ``"blocking"`` (default) or ``"callback"``. In callback mode audio
+        callbacks move audio through ring buffers and a dedicated DSP thread
+        runs the engine.
+    callback_buffer_blocks:
+        Ring buffer capacity in blocks for callback mode. One block of silence
+        is queued ahead of the anti-noise, the rest absorbs scheduling jitter.
+    latency_samples:
+        Known output-to-input loop latency. If omitted, no compensation is
+        applied until ``measure_loop_latency`` is called.
+    decimation:
+        Integer factor between the device rate and the adaptation rate. With
+        values above 1, ``filter_length`` and ``secondary_path`` refer to the
+        reduced rate and ``block_size`` must be a multiple of the factor.
+    fx_cache:
+        If True, precompute the filtered-x signal for the whole reference file
+        and index into it per block. Not available with ``decimation``.
+    fx_cache_dir:
+        Optional directory for persisting the cache as memory-mapped ``.npy``
+        files. Without it the cache is kept in memory.
+    online_secondary_path:
+        If True, inject auxiliary noise and keep adapting the secondary path
+        estimate during ``run()``. Not available with ``fx_cache``.
+    aux_noise_level:
+        Peak amplitude of the uniform auxiliary noise. Higher levels identify
+        the path faster and more robustly but stay audible in the residual.
+    aux_step_size:
+        Normalised (NLMS) step of the secondary-path modelling filter. Keep
+        it small when the disturbance is much louder than the auxiliary
+        noise; the model's time constant is about
+        ``len(secondary_path) / aux_step_size`` samples.
+    secondary_path_update_interval:
+        Blocks between hot-swaps of the modelled path into the engine.
+    aux_noise_seed:
+        Seed for the auxiliary noise generator, for reproducible sessions.
+    update_rule:
+        Weight update rule, one of ``UPDATE_RULES``. ``"apa"`` and ``"rls"``
+        need an engine with a filtered-x matrix (``"loop"`` or ``"block"``).
+    projection_order:
+        Order P of the affine projection; must divide the (control) block size.
+        ``step_size`` is the per-projection step and is limited so that the
+        projections of one block add up to at most ``APA_MAX_BLOCK_STEP``.
+    rls_forgetting:
+        Exponential forgetting factor of the RLS rule, in (0, 1].
+    harmonics:
+        Number of harmonics (including the fundamental) for the narrowband engine.
+    fundamental_hz:
+        Initial fundamental for the narrowband engine. If None, it is found in
+        the first ``NARROWBAND_ACQUISITION_SECONDS`` of reference, during which
+        no anti-noise is produced.
+    track_frequency:
+        If True, the narrowband engine follows drift of the fundamental.
+    audio_backend:
+        Source of the audio streams. Defaults to ``PyAudioBackend``; pass a
+        ``SimulatedBackend`` to run against a simulated room.
+    instrumentation:
+        Optional ``RunInstrumentation`` that receives per-stage timings,
+        deadline misses and xrun counts of every block during ``run()``.
+        Without it no timestamps are taken.
+    recorder:
+        Optional ``SessionRecorder`` that saves the reference, anti-noise and
+        error of every block with its ``AncMetrics`` during ``run()``.
+    weight_store:
+        Optional ``WeightStore``. ``run()`` then starts from the weights and
+        secondary-path model stored for this device pair and ``noise_class``
+        (when compatible) and stores the final ones when it ends.
+    noise_class:
+        Noise class part of the ``weight_store`` key.
+    profile_switcher:
+        Optional ``ProfileSwitcher``. Its profiles are applied during
+        ``run()`` with ``apply_profile`` as the classifier reports new noise
+        classes; ``noise_class`` names the profile the controller starts in.
+    classifier_feed:
+        Optional ``ClassifierFeed`` that runs the sound classifier (whose
+        labels go to ``profile_switcher.observe``) on the reference blocks or
+        its own input device during ``run()``.
     """
 
     def __init__(
         self,
-        reference_path: str,
+        reference_path: Optional[str],
         sample_rate: Optional[int] = None,
         filter_length: int = DEFAULT_FILTER_LENGTH,
-        step_size: float = 5e-4,
+        step_size: float = DEFAULT_STEP_SIZE,
         block_size: int = DEFAULT_BLOCK_SIZE,
         secondary_path: Optional[np.ndarray] = None,
         control_device_index: Optional[int] = None,
         record_device_index: Optional[int] = None,
         reference_device_index: Optional[int] = None,
         play_reference: bool = False,
+        reference_channel: int = 0,
+        live_reference_channel: Optional[int] = None,
+        error_channel: int = 0,
         normalize_step: bool = True,
+        engine: str = DEFAULT_ENGINE,
+        io_mode: str = DEFAULT_IO_MODE,
+        callback_buffer_blocks: int = DEFAULT_CALLBACK_BUFFER_BLOCKS,
+        latency_samples: Optional[int] = None,
+        decimation: int = 1,
+        fx_cache: bool = False,
+        fx_cache_dir: Optional[str] = None,
+        online_secondary_path: bool = False,
+        aux_noise_level: float = DEFAULT_AUX_NOISE_LEVEL,
+        aux_step_size: float = DEFAULT_AUX_STEP_SIZE,
+        secondary_path_update_interval: int = 1,
+        aux_noise_seed: Optional[int] = None,
+        update_rule: str = "lms",
+        projection_order: int = DEFAULT_PROJECTION_ORDER,
+        rls_forgetting: float = DEFAULT_RLS_FORGETTING,
+        harmonics: int = DEFAULT_HARMONICS,
+        fundamental_hz: Optional[float] = None,
+        track_frequency: bool = True,
+        audio_backend: Optional[AudioBackend] = None,
+        instrumentation: Optional[RunInstrumentation] = None,
+        recorder: Optional[SessionRecorder] = None,
+        weight_store: Optional[WeightStore] = None,
+        noise_class: str = DEFAULT_NOISE_CLASS,
+        profile_switcher: Optional[ProfileSwitcher] = None,
+        classifier_feed: Optional[ClassifierFeed] = None,
     ):
-        self.reference_signal, ref_rate = read_mono_wav(reference_path)
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}. Choose one of {ENGINES}.")
+        if io_mode not in IO_MODES:
+            raise ValueError(f"Unknown io_mode {io_mode!r}. Choose one of {IO_MODES}.")
+        if callback_buffer_blocks < 2:
+            raise ValueError("callback_buffer_blocks must be at least 2")
+        if decimation < 1 or block_size % decimation:
+            raise ValueError("decimation must be a positive divisor of block_size")
+        if fx_cache and decimation > 1:
+            raise ValueError("fx_cache cannot be combined with decimation")
+        if fx_cache and online_secondary_path:
+            raise ValueError("fx_cache cannot be combined with online_secondary_path")
+        if secondary_path_update_interval < 1:
+            raise ValueError("secondary_path_update_interval must be at least 1")
+        if update_rule not in UPDATE_RULES:
+            raise ValueError(f"Unknown update_rule {update_rule!r}. Choose one of {UPDATE_RULES}.")
+        if engine == "narrowband" and (fx_cache or harmonics < 1):
+            raise ValueError("narrowband engine needs harmonics >= 1 and no fx_cache")
+        if update_rule != "lms" and engine == "frequency":
+            raise ValueError(f"update_rule={update_rule!r} needs the 'loop' or 'block' engine")
+        if update_rule == "apa" and (
+            projection_order < 1 or (block_size // decimation) % projection_order
+        ):
+            raise ValueError("projection_order must divide block_size / decimation")
+        if update_rule == "rls":
+            if not 0.0 < rls_forgetting <= 1.0:
+                raise ValueError("rls_forgetting must be in (0, 1]")
+            if filter_length > RLS_MAX_FILTER_LENGTH:
+                raise ValueError(
+                    f"update_rule='rls' supports at most {RLS_MAX_FILTER_LENGTH} taps; "
+                    "use 'apa' or the frequency engine for longer filters"
+                )
 
-        self.sample_rate = sample_rate or ref_rate
-        if self.sample_rate != ref_rate:
-            raise ValueError(
-                f"Reference sample rate ({ref_rate} Hz) does not match "
-                f"requested {self.sample_rate} Hz. Resample the file before use."
-            )
+        self.live_reference_channel = live_reference_channel
+        self.error_channel = error_channel
+        self.reference_path = reference_path
+        if live_reference_channel is not None:
+            if reference_path is not None:
+                raise ValueError("Use either reference_path or live_reference_channel, not both")
+            if fx_cache or play_reference:
+                raise ValueError("fx_cache and play_reference need a prerecorded reference")
+            if live_reference_channel == error_channel:
+                raise ValueError("live_reference_channel and error_channel must differ")
+            self.reference_signal = None
+            self.sample_rate = sample_rate or DEFAULT_SAMPLE_RATE
+            self.input_channels = max(live_reference_channel, error_channel) + 1
+        else:
+            if reference_path is None:
+                raise ValueError("reference_path is required without live_reference_channel")
+            self.reference_signal = WavReference(reference_path, channel=reference_channel)
+            ref_rate = self.reference_signal.sample_rate
+
+            self.sample_rate = sample_rate or ref_rate
+            if self.sample_rate != ref_rate:
+                raise ValueError(
+                    f"Reference sample rate ({ref_rate} Hz) does not match "
+                    f"requested {self.sample_rate} Hz. Resample the file before use."
+                )
+            self.input_channels = error_channel + 1
 
         self.filter_length = filter_length
         self.block_size = block_size
+        self.decimation = decimation
+        self.control_block_size = block_size // decimation
+        self.control_rate = self.sample_rate / decimation
         self.base_step_size = step_size
         self.normalize_step = normalize_step
         self.play_reference = play_reference
-
+        self.engine = engine
+        self.fx_cache = fx_cache
+        self.fx_cache_dir = fx_cache_dir
+        self._fx_cache: Optional[np.ndarray] = None
+        self._reference_digest: Optional[str] = None
+        self.online_secondary_path = online_secondary_path
+        self.aux_noise_level = aux_noise_level
+        self.aux_step_size = aux_step_size
+        self.secondary_path_update_interval = secondary_path_update_interval
+        self._aux_rng = np.random.default_rng(aux_noise_seed)
+        self.update_rule = update_rule
+        self.projection_order = projection_order
+        self.rls_forgetting = rls_forgetting
+        self.rejected_updates = 0
+        self.harmonics = harmonics
+        self.fundamental_hz = fundamental_hz
+        self.track_frequency = track_frequency
+
+        # A stored warm-start model only replaces the placeholder delta.
+        self._secondary_path_known = secondary_path is not None
         if secondary_path is None:
             # Use a single-sample delta if no model is provided.
-            self.secondary_path = np.zeros(8, dtype=np.float32)
-            self.secondary_path[0] = 1.0
-        else:
-            self.secondary_path = np.array(secondary_path, dtype=np.float32)
-
-        if self.secondary_path.ndim != 1:
+            secondary_path = np.zeros(8, dtype=np.float32)
+            secondary_path[0] = 1.0
+        secondary_path = np.array(secondary_path, dtype=np.float32)
+        if secondary_path.ndim != 1:
             raise ValueError("secondary_path must be a 1-D array")
+        self.secondary_path = secondary_path
 
         self.control_device_index = control_device_index
         self.record_device_index = record_device_index
         self.reference_device_index = reference_device_index
 
-        self._audio = pyaudio.PyAudio()
+        self._audio = audio_backend if audio_backend is not None else PyAudioBackend()
         self._control_stream = None
         self._reference_stream = None
         self._input_stream = None
         self._stop_requested = False
 
+        self.io_mode = io_mode
+        self.callback_buffer_blocks = callback_buffer_blocks
+        self.output_channels = 1
+        self._allocate_io_buffers()
+        self._capture_event = threading.Event()
+        self._playback_event = threading.Event()
+        self.input_overflows = 0
+        self.output_underflows = 0
+        self.dropped_capture_blocks = 0
+        self.instrumentation = instrumentation
+        self.recorder = recorder
+        self.weight_store = weight_store
+        self.noise_class = noise_class
+        self.profile_switcher = profile_switcher
+        self.classifier_feed = classifier_feed
+        self.deadline_misses = 0
+        self._stage_stamps = np.zeros(len(STAGES) + 1, dtype=np.int64)
+        self._reference_block = np.zeros(block_size, dtype=np.float32)
+        self._pending_error: Optional[np.ndarray] = None
+
+        self.latency_samples = 0
+        self.delay_blocks = 0
+        self._set_latency(latency_samples or 0)
+
         self._reset_state()
 
+    @property
+    def secondary_path(self) -> np.ndarray:
+        """FIR estimate of the speaker→error mic path."""
+        return self._secondary_path
+
+    @secondary_path.setter
+    def secondary_path(self, value: np.ndarray) -> None:
+        self._secondary_path = value
+        # Any cached filtered-x signal was computed with the previous model.
+        self._fx_cache = None
+        # Hot-swap into a running frequency engine if the FFT size still fits.
+        if (
+            self.engine == "frequency"
+            and getattr(self, "fft_size", 0) >= len(value) + self.control_block_size - 1
+        ):
+            self._fd_sec_spectrum = np.fft.rfft(value, self.fft_size)
+
     def _reset_state(self) -> None:
-        """Initialise adaptive filter state."""
-        self.weights = np.zeros(self.filter_length, dtype=np.float32)
+        """Initialise adaptive filter state and rewind the stream position."""
+        self._reset_filter_state()
+        self.reference_index = 0
+        self._reference_pass = 0
+        self._reference_segments: list = []
+        self.frame_index = 0
+        self._pending_error = None
+        self._crossfade = None
+        if self.online_secondary_path:
+            self._aux_delay_line: deque = deque(maxlen=self.delay_blocks + 1)
+            self._aux_history = np.zeros(len(self.secondary_path), dtype=np.float32)
+            self._online_path = self.secondary_path.astype(np.float32).copy()
+            self._online_updates = 0
+        if self.decimation > 1:
+            self._reference_decimator = _PolyphaseDecimator(self.decimation)
+            self._error_decimator = _PolyphaseDecimator(self.decimation)
+            self._output_interpolator = _PolyphaseInterpolator(self.decimation)
+
+    def _reset_filter_state(self) -> None:
+        """Zero the weights and the engine's histories; the stream position is kept."""
+        if self.engine == "narrowband":
+            self._reset_narrowband_state()
+        else:
+            self.weights = np.zeros(self.filter_length, dtype=np.float32)
+        if self.update_rule == "rls":
+            self._reset_rls_state()
         self.ref_history = np.zeros(self.filter_length, dtype=np.float32)
         self.sec_history = np.zeros(len(self.secondary_path), dtype=np.float32)
         self.fx_history = np.zeros(self.filter_length, dtype=np.float32)
-        self.reference_index = 0
-        self.frame_index = 0
+        self._fx_delay_line: deque = deque(maxlen=self.delay_blocks + 1)
+        if self.engine == "frequency":
+            self._reset_frequency_state()
+
+    def _reset_narrowband_state(self) -> None:
+        """Zero the harmonic weights ([cos..., sin...]) and restart tracking."""
+        self.weights = np.zeros(2 * self.harmonics, dtype=np.float32)
+        self.tracked_frequency = self.fundamental_hz
+        self._nb_phase = 0.0
+        self._nb_last_demodulation: Optional[float] = None
+        self._nb_acquisition: list = []
+
+    def _reset_rls_state(self) -> None:
+        """Initialise the inverse correlation matrix of the RLS rule."""
+        self._rls_inverse = np.eye(len(self.weights)) / RLS_INITIAL_DELTA
+
+    def _reset_frequency_state(self) -> None:
+        """Allocate the overlap-save buffers of the frequency engine."""
+        span = max(self.filter_length, len(self.secondary_path)) + self.control_block_size - 1
+        self.fft_size = 1 << (span - 1).bit_length()
+        n_bins = self.fft_size // 2 + 1
+        self._fd_ref_buffer = np.zeros(self.fft_size, dtype=np.float32)
+        self._fd_fx_buffer = np.zeros(self.fft_size, dtype=np.float32)
+        self._fd_error_buffer = np.zeros(self.fft_size, dtype=np.float32)
+        self._fd_sec_spectrum = np.fft.rfft(self.secondary_path, self.fft_size)
+        self._fd_weight_spectrum = np.zeros(n_bins, dtype=np.complex128)
+        self._fd_power: Optional[np.ndarray] = None
+
+    def _allocate_io_buffers(self) -> None:
+        """Size the callback ring buffers for the current channel counts."""
+        ring_capacity = self.callback_buffer_blocks * self.block_size
+        self._playback_ring = _RingBuffer(ring_capacity * self.output_channels)
+        self._reference_ring = _RingBuffer(ring_capacity)
+        self._capture_ring = _RingBuffer(ring_capacity * self.input_channels)
+        self._playback_scratch = np.zeros(ring_capacity * self.output_channels, dtype=np.float32)
+        self._reference_scratch = np.zeros(ring_capacity, dtype=np.float32)
 
     def stop(self) -> None:
         """Request the processing loop to halt after the current block."""
         self._stop_requested = True
 
     def _open_streams(self) -> None:
-        """Open PyAudio output and input streams."""
+        """Open the output and input streams on the audio backend."""
+        callback = self.io_mode == "callback"
+        if callback and self._control_stream is None:
+            self._prime_callback_buffers()
+
         if self._control_stream is None:
-            self._control_stream = self._audio.open(
-                format=pyaudio.paFloat32,
-                channels=1,
+            self._control_stream = self._audio.open_output(
+                channels=self.output_channels,
                 rate=self.sample_rate,
-                output=True,
                 frames_per_buffer=self.block_size,
-                output_device_index=self.control_device_index,
+                device_index=self.control_device_index,
+                callback=self._playback_callback if callback else None,
             )
 
-        if self.play_reference and self.reference_device_index is not None and self._reference_stream is None:
-            self._reference_stream = self._audio.open(
-                format=pyaudio.paFloat32,
+        if self._uses_reference_stream() and self._reference_stream is None:
+            self._reference_stream = self._audio.open_output(
                 channels=1,
                 rate=self.sample_rate,
-                output=True,
                 frames_per_buffer=self.block_size,
-                output_device_index=self.reference_device_index,
+                device_index=self.reference_device_index,
+                callback=self._reference_callback if callback else None,
+                role="reference",
             )
 
         if self._input_stream is None:
-            self._input_stream = self._audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
+            self._input_stream = self._audio.open_input(
+                channels=self.input_channels,
                 rate=self.sample_rate,
-                input=True,
                 frames_per_buffer=self.block_size,
-                input_device_index=self.record_device_index,
+                device_index=self.record_device_index,
+                callback=self._capture_callback if callback else None,
             )
 
+    def _uses_reference_stream(self) -> bool:
+        return self.play_reference and self.reference_device_index is not None
+
+    def _prime_callback_buffers(self) -> None:
+        """
+        Empty the rings and queue exactly one block of silence for playback.
+
+        Called before the streams open, so no callback is consuming. Whatever
+        a measurement or an earlier ``run()`` left queued (excitation,
+        anti-noise, captured audio) would otherwise be played or adapted on
+        at the start of the next session.
+        """
+        for ring, channels in (
+            (self._capture_ring, 0),
+            (self._playback_ring, self.output_channels),
+            (self._reference_ring, 1),
+        ):
+            ring.discard()
+            if channels:
+                ring.write(np.zeros(self.block_size * channels, dtype=np.float32))
+
+    def _playback_callback(self, frame_count: int) -> np.ndarray:
+        """Audio callback feeding the control speaker from the playback ring."""
+        return self._drain_ring(
+            self._playback_ring, self._playback_scratch, frame_count * self.output_channels
+        )
+
+    def _reference_callback(self, frame_count: int) -> np.ndarray:
+        """Audio callback feeding the reference speaker from its ring."""
+        return self._drain_ring(self._reference_ring, self._reference_scratch, frame_count)
+
+    def _drain_ring(self, ring: _RingBuffer, scratch: np.ndarray, n_samples: int) -> np.ndarray:
+        out = scratch[:n_samples]
+        if not ring.read_into(out):
+            # Not enough anti-noise queued: play silence rather than stale data.
+            out[:] = 0.0
+            self.output_underflows += 1
+        self._playback_event.set()
+        return out
+
+    def _capture_callback(self, samples: np.ndarray, overflowed: bool) -> None:
+        """Audio callback pushing interleaved microphone samples into the capture ring."""
+        if overflowed:
+            self.input_overflows += 1
+        if not self._capture_ring.write(samples):
+            self.dropped_capture_blocks += 1
+        self._capture_event.set()
+
+    def _write_output(self, output_block: np.ndarray, ref_block: Optional[np.ndarray] = None) -> None:
+        """
+        Send a control block (and optionally the reference block) to the speakers.
+
+        Multichannel control blocks are (block_size, output_channels) arrays
+        and are sent interleaved.
+        """
+        output_block = np.ascontiguousarray(output_block, dtype=np.float32)
+        if self.io_mode == "callback":
+            if ref_block is not None:
+                self._push_playback(self._reference_ring, ref_block.astype(np.float32, copy=False))
+            self._push_playback(self._playback_ring, output_block.reshape(-1))
+            return
+
+        if ref_block is not None and self._reference_stream.write(ref_block):
+            self.output_underflows += 1
+        if self._control_stream.write(output_block):
+            self.output_underflows += 1
+
+    def _push_playback(self, ring: _RingBuffer, block: np.ndarray) -> None:
+        """Queue ``block`` for playback, waiting for the callback to make room."""
+        deadline = time.monotonic() + CALLBACK_STALL_TIMEOUT
+        while not ring.write(block):
+            if self._stop_requested:
+                return
+            if time.monotonic() >= deadline:
+                raise RuntimeError("Playback callback stalled; is the output device running?")
+            self._playback_event.wait(CALLBACK_STALL_TIMEOUT / 20)
+            self._playback_event.clear()
+
+    def _exchange_block(self, output_block: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Play one measurement block and read one error block, in ``run()``'s order.
+
+        The live mode captures before it writes; measured in the other order,
+        latency and secondary path would be off by one block against run().
+        """
+        if self.live_reference_channel is not None:
+            error_block = self._read_error_block()
+            self._write_output(output_block)
+            return error_block
+        self._write_output(output_block)
+        return self._read_error_block()
+
+    def _read_error_block(self) -> Optional[np.ndarray]:
+        """Return the next error-microphone block (None if stopped while waiting)."""
+        if self._pending_error is not None:
+            error_block, self._pending_error = self._pending_error, None
+            return error_block
+        frames = self._capture_frames()
+        if frames is None:
+            return None
+        return frames[:, self.error_channel]
+
+    def _capture_frames(self) -> Optional[np.ndarray]:
+        """Capture one block of all input channels as a (block_size, channels) array."""
+        if self.io_mode == "callback":
+            frames = np.empty(self.block_size * self.input_channels, dtype=np.float32)
+            deadline = time.monotonic() + CALLBACK_STALL_TIMEOUT
+            while not self._capture_ring.read_into(frames):
+                if self._stop_requested:
+                    return None
+                if time.monotonic() >= deadline:
+                    raise RuntimeError("Capture callback stalled; is the input device running?")
+                self._capture_event.wait(CALLBACK_STALL_TIMEOUT / 20)
+                self._capture_event.clear()
+        else:
+            frames, overflowed = self._input_stream.read(self.block_size)
+            if overflowed:
+                self.input_overflows += 1
+        return frames.reshape(self.block_size, self.input_channels)
+
     def _close_streams(self) -> None:
-        """Close streams and terminate PyAudio."""
+        """Close streams and release the audio backend."""
         if self._control_stream:
-            self._control_stream.stop_stream()
             self._control_stream.close()
             self._control_stream = None
         if self._reference_stream:
-            self._reference_stream.stop_stream()
             self._reference_stream.close()
             self._reference_stream = None
         if self._input_stream:
-            self._input_stream.stop_stream()
             self._input_stream.close()
             self._input_stream = None
-        if self._audio:
-            self._audio.terminate()
-
-    def _next_reference_block(self, loop: bool) -> np.ndarray:
-        """Fetch the next reference block, padding or looping as required."""
-        start = self.reference_index
-        end = start + self.block_size
-        if start >= len(self.reference_signal):
-            if loop:
-                self.reference_index = 0
-                return self._next_reference_block(loop=False)
-            return np.zeros(self.block_size, dtype=np.float32)
+        self._audio.terminate()
 
-        block = self.reference_signal[start:end]
-        if len(block) < self.block_size:
-            if loop:
-                remaining = self.block_size - len(block)
+    def _next_reference_block(self, loop: bool) -> Optional[np.ndarray]:
+        """
+        Fetch the next reference block, padding or looping as required.
+
+        The block is converted into a preallocated buffer that is reused by
+        the next call. In live mode the block is captured instead, and the
+        error samples captured alongside it are kept for ``_read_error_block``
+        (None is returned if stopped while waiting).
+        """
+        if self.live_reference_channel is not None:
+            frames = self._capture_frames()
+            if frames is None:
+                return None
+            self._pending_error = frames[:, self.error_channel]
+            return frames[:, self.live_reference_channel]
+
+        n_total = len(self.reference_signal)
+        segments = []
+        remaining = self.block_size
+        while remaining:
+            if self.reference_index >= n_total:
+                if not loop:
+                    break
                 self.reference_index = 0
-                block = np.concatenate(
-                    [block, self._next_reference_block(loop=False)[:remaining]]
-                )
-                self.reference_index = remaining
-            else:
-                block = np.pad(block, (0, self.block_size - len(block)))
-                self.reference_index = len(self.reference_signal)
-                return block.astype(np.float32)
+                self._reference_pass += 1
+            take = min(remaining, n_total - self.reference_index)
+            segments.append((self.reference_index, self.reference_index + take, self._reference_pass))
+            self.reference_index += take
+            remaining -= take
+
+        # Remembered so the filtered-x cache can be indexed the same way.
+        self._reference_segments = segments
+
+        block = self._reference_block
+        pos = 0
+        for start, stop, _ in segments:
+            self.reference_signal.read_into(start, block[pos : pos + stop - start])
+            pos += stop - start
+        block[pos:] = 0.0
+        return block
+
+    def _ensure_fx_cache(self) -> np.ndarray:
+        """Build (or load) the filtered-x signal for the current secondary path."""
+        if self._fx_cache is not None:
+            return self._fx_cache
+
+        taps = len(self.secondary_path)
+        n_total = len(self.reference_signal)
+        if taps - 1 > n_total:
+            raise ValueError("fx_cache needs a reference longer than the secondary path")
+
+        path = None
+        if self.fx_cache_dir:
+            os.makedirs(self.fx_cache_dir, exist_ok=True)
+            path = os.path.join(self.fx_cache_dir, f"fx_{self._fx_cache_key()}.npy")
+            if os.path.exists(path):
+                logging.info("Loading filtered-x cache %s", path)
+                self._fx_cache = np.load(path, mmap_mode="r")
+                return self._fx_cache
+
+        # Layout: full linear convolution (first pass and the padded tail),
+        # with the wrap-around of looped passes derived on lookup.
+        length = n_total + taps - 1
+        if path:
+            cache = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=np.float32, shape=(length,))
         else:
-            self.reference_index = end
-        return block.astype(np.float32)
+            cache = np.empty(length, dtype=np.float32)
+        _fft_filter(self.reference_signal, self.secondary_path, cache)
+
+        if path:
+            cache.flush()
+            del cache
+            os.replace(path + ".tmp", path)
+            cache = np.load(path, mmap_mode="r")
+        logging.info("Filtered-x cache built (%d samples)", length)
+        self._fx_cache = cache
+        return cache
+
+    def _fx_cache_key(self) -> str:
+        """Digest of the reference file, secondary path and sample rate."""
+        if self._reference_digest is None:
+            file_hash = hashlib.sha1()
+            with open(self.reference_path, "rb") as handle:
+                for chunk in iter(lambda: handle.read(1 << 20), b""):
+                    file_hash.update(chunk)
+            self._reference_digest = file_hash.hexdigest()
+
+        key = hashlib.sha1()
+        key.update(f"{FX_CACHE_VERSION}:{self._reference_digest}:{self.sample_rate}".encode())
+        key.update(np.ascontiguousarray(self.secondary_path, dtype=np.float32).tobytes())
+        return key.hexdigest()
+
+    def _cached_filtered_block(self) -> np.ndarray:
+        """
+        Filtered-x samples for the reference segments fetched last.
+
+        The first pass reads the linear convolution. Later passes add the tail
+        of the previous pass to their first ``len(secondary_path) - 1``
+        samples, which is what continuous filtering of the looped file gives.
+        The zero padding after a final pass reads the convolution tail.
+        """
+        cache = self._ensure_fx_cache()
+        n_total = len(self.reference_signal)
+        overlap = len(self.secondary_path) - 1
+
+        block = np.zeros(self.block_size, dtype=np.float32)
+        pos = 0
+        for start, stop, ref_pass in self._reference_segments:
+            block[pos : pos + stop - start] = cache[start:stop]
+            if ref_pass > 0 and start < overlap:
+                wrap_stop = min(stop, overlap)
+                block[pos : pos + wrap_stop - start] += cache[n_total + start : n_total + wrap_stop]
+            pos += stop - start
+
+        if pos < self.block_size and self._reference_segments:
+            tail_start = self._reference_segments[-1][1]
+            n_tail = min(self.block_size - pos, n_total + overlap - tail_start)
+            if n_tail > 0:
+                block[pos : pos + n_tail] = cache[tail_start : tail_start + n_tail]
+        return block
 
     def _compute_step(self, fx_vector: np.ndarray) -> float:
         """Adjust step size if normalisation is requested."""
         if not self.normalize_step:
             return self.base_step_size
-        energy = float(np.dot(fx_vector, fx_vector)) + EPSILON
+        energy = float(np.dot(fx_vector, fx_vector)) + NLMS_REGULARIZATION * len(fx_vector)
         return self.base_step_size / energy
 
     def run(
@@ -256,6 +1263,7 @@ class FxLMSANC:
         loop_reference: bool = False,
         max_duration: Optional[float] = None,
         metrics_callback: Optional[Callable[[AncMetrics], None]] = None,
+        max_blocks: Optional[int] = None,
     ) -> None:
         """
         Execute the adaptive control loop.
@@ -268,62 +1276,504 @@ class FxLMSANC:
             Optional wall-clock limit in seconds.
         metrics_callback:
             Optional callable invoked once per block with AncMetrics data.
+        max_blocks:
+            Optional limit on the number of processed blocks, which unlike
+            ``max_duration`` does not depend on how fast the backend runs.
         """
-        self._open_streams()
+        stored = self._load_stored_weights()
         self._reset_state()
+        if stored is not None:
+            self._apply_stored_weights(stored)
+        if self.fx_cache:
+            self._ensure_fx_cache()
+        if self.profile_switcher is not None:
+            self.profile_switcher.start(self.noise_class)
         self._stop_requested = False
+        self.input_overflows = 0
+        self.output_underflows = 0
+        self.dropped_capture_blocks = 0
+        self.deadline_misses = 0
+        if self.instrumentation is not None:
+            compute_stages = COMPUTE_STAGES
+            if self.live_reference_channel is not None:
+                # The live reference block is a capture wait, not computation.
+                compute_stages = tuple(stage for stage in COMPUTE_STAGES if stage != "reference")
+            self.instrumentation.start(self.block_size / self.sample_rate, compute_stages)
+        if self.recorder is not None:
+            self.recorder.start(
+                self.sample_rate,
+                self.block_size,
+                self._recording_channels(),
+                [field.name for field in fields(AncMetrics)],
+            )
+        if self.classifier_feed is not None:
+            self.classifier_feed.start(self.sample_rate, self.block_size, self._audio)
+        self._open_streams()
 
         start_time = time.time()
 
         try:
-            while not self._stop_requested:
-                if max_duration and (time.time() - start_time) >= max_duration:
-                    break
-
-                ref_block = self._next_reference_block(loop_reference)
-                if not loop_reference and self.reference_index >= len(
-                    self.reference_signal
-                ):
-                    # We are at the final padded block and will exit next iteration.
-                    self._stop_requested = True
+            if self.io_mode == "callback":
+                self._run_dsp_thread(
+                    loop_reference, max_duration, metrics_callback, start_time, max_blocks
+                )
+            else:
+                self._control_loop(
+                    loop_reference, max_duration, metrics_callback, start_time, max_blocks
+                )
+        except KeyboardInterrupt:
+            logging.info("ANC loop interrupted by user.")
+        finally:
+            self._close_streams()
+            self._store_weights()
+            if self.instrumentation is not None:
+                self.instrumentation.stop()
+            if self.classifier_feed is not None:
+                self.classifier_feed.stop()
+                if self.classifier_feed.dropped_blocks:
+                    logging.warning(
+                        "Classifier fell behind and dropped %d block(s)",
+                        self.classifier_feed.dropped_blocks,
+                    )
+            if self.profile_switcher is not None and self.profile_switcher.switches:
+                logging.info(
+                    "Switched profile %d time(s), %d switch(es) suppressed",
+                    self.profile_switcher.switches,
+                    self.profile_switcher.suppressed_switches,
+                )
+            if self.recorder is not None:
+                self.recorder.stop()
+                if self.recorder.dropped_blocks:
+                    logging.warning(
+                        "Recorder fell behind and dropped %d block(s)", self.recorder.dropped_blocks
+                    )
+            if self.deadline_misses:
+                logging.warning("DSP missed the block deadline %d time(s)", self.deadline_misses)
+            if self.input_overflows or self.output_underflows or self.dropped_capture_blocks:
+                logging.warning(
+                    "Audio xruns: %d input overflows, %d output underflows, "
+                    "%d dropped capture blocks",
+                    self.input_overflows,
+                    self.output_underflows,
+                    self.dropped_capture_blocks,
+                )
 
-                anti_noise_block, fx_vectors = self._synthesize_block(ref_block)
+    def _run_dsp_thread(
+        self,
+        loop_reference: bool,
+        max_duration: Optional[float],
+        metrics_callback: Optional[Callable[[AncMetrics], None]],
+        start_time: float,
+        max_blocks: Optional[int] = None,
+    ) -> None:
+        """Run the control loop on a dedicated DSP thread fed by the audio callbacks."""
+        errors: list = []
 
-                if self.play_reference and self.reference_device_index is not None and self._reference_stream:
-                    self._reference_stream.write(ref_block.astype(np.float32).tobytes())
-                    output_block = anti_noise_block
-                elif self.play_reference:
-                    output_block = np.clip(ref_block + anti_noise_block, -1.0, 1.0)
-                else:
-                    output_block = np.clip(anti_noise_block, -1.0, 1.0)
+        def target() -> None:
+            try:
+                self._control_loop(
+                    loop_reference, max_duration, metrics_callback, start_time, max_blocks
+                )
+            except BaseException as exc:  # re-raised on the caller's thread
+                errors.append(exc)
+                self._stop_requested = True
 
-                self._control_stream.write(output_block.astype(np.float32).tobytes())
+        dsp_thread = threading.Thread(target=target, name="fxlms-dsp", daemon=True)
+        dsp_thread.start()
+        try:
+            while dsp_thread.is_alive():
+                dsp_thread.join(timeout=0.1)
+        except KeyboardInterrupt:
+            self._stop_requested = True
+            dsp_thread.join()
+            raise
+        if errors:
+            raise errors[0]
 
-                error_raw = self._input_stream.read(
-                    self.block_size, exception_on_overflow=False
-                )
-                error_block = (
-                    np.frombuffer(error_raw, dtype=np.int16).astype(np.float32)
-                    / 32768.0
-                )
+    def _control_loop(
+        self,
+        loop_reference: bool,
+        max_duration: Optional[float],
+        metrics_callback: Optional[Callable[[AncMetrics], None]],
+        start_time: float,
+        max_blocks: Optional[int] = None,
+    ) -> None:
+        """
+        Block-by-block synthesis, playback, capture and adaptation.
 
-                self._update_weights(error_block, fx_vectors)
+        With ``instrumentation`` set, a timestamp is taken before the block and
+        after each of its ``STAGES``.
+        """
+        probe = self.instrumentation
+        stamps = self._stage_stamps
+        while not self._stop_requested:
+            if max_duration and (time.time() - start_time) >= max_duration:
+                break
+            if max_blocks is not None and self.frame_index >= max_blocks:
+                break
+            if self.profile_switcher is not None:
+                profile = self.profile_switcher.poll(self.frame_index * self.block_size / self.sample_rate)
+                if profile is not None:
+                    self.apply_profile(profile, self.profile_switcher.crossfade_seconds)
+
+            if probe is not None:
+                stamps[0] = time.perf_counter_ns()
+            ref_block = self._next_reference_block(loop_reference)
+            if ref_block is None:
+                break
+            if self.classifier_feed is not None:
+                self.classifier_feed.push_block(ref_block)
+            # Without looping, the final (padded) block ends the session.
+            last_block = (
+                self.reference_signal is not None
+                and not loop_reference
+                and self.reference_index >= len(self.reference_signal)
+            )
 
-                if metrics_callback:
-                    error_rms = float(np.sqrt(np.mean(error_block**2)))
-                    metrics = AncMetrics(
-                        frame_index=self.frame_index,
-                        error_rms=error_rms,
-                        step_size=self.base_step_size,
+            played = self._process_block(ref_block, self._play_and_capture)
+            if played is None:
+                break
+            anti_noise_block, error_block = played
+
+            dsp_time = 0.0
+            if probe is not None:
+                if probe.record(
+                    self.frame_index,
+                    stamps,
+                    self.input_overflows,
+                    self.output_underflows,
+                    self.dropped_capture_blocks,
+                ):
+                    self.deadline_misses += 1
+                dsp_time = probe.last_dsp_ns / 1e9
+
+            if metrics_callback or self.recorder is not None:
+                error_rms = float(np.sqrt(np.mean(error_block**2)))
+                metrics = AncMetrics(
+                    frame_index=self.frame_index,
+                    error_rms=error_rms,
+                    step_size=self.base_step_size,
+                    latency_samples=self.latency_samples,
+                    dsp_time=dsp_time,
+                    deadline_misses=self.deadline_misses,
+                    input_overflows=self.input_overflows,
+                    output_underflows=self.output_underflows,
+                )
+                if self.recorder is not None:
+                    self.recorder.record_block(
+                        self.frame_index,
+                        (ref_block, anti_noise_block, error_block),
+                        astuple(metrics),
                     )
+                if metrics_callback:
                     metrics_callback(metrics)
 
-                self.frame_index += 1
+            self.frame_index += 1
+            if last_block:
+                break
 
-        except KeyboardInterrupt:
-            logging.info("ANC loop interrupted by user.")
-        finally:
-            self._close_streams()
+    def _process_block(
+        self,
+        ref_block: np.ndarray,
+        exchange: Callable[[np.ndarray, np.ndarray], Optional[np.ndarray]],
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        The DSP of one block, around ``exchange(anti_noise_block, ref_block)``.
+
+        ``exchange`` plays the anti-noise and returns the error block it
+        produced, or None to stop. Returns the anti-noise and error blocks at
+        the device rate, or None if ``exchange`` did.
+        """
+        probe = self.instrumentation
+        stamps = self._stage_stamps
+        control_ref = ref_block
+        if self.decimation > 1:
+            control_ref = self._reference_decimator.process(ref_block)
+        if probe is not None:
+            stamps[1] = time.perf_counter_ns()
+        anti_noise_block, fx_vectors = self._synthesize_block(control_ref)
+        if self._crossfade is not None:
+            anti_noise_block = self._crossfade_block(anti_noise_block, control_ref)
+        # Phase inversion: the speaker plays -y. Every update rule here
+        # assumes e = d - s*y and steps along +e*fx. The original loop
+        # played +y with the same update, i.e. e = d + s*y, for which
+        # +e*fx is the gradient *ascent* direction: the filter grew the
+        # noise instead of cancelling it. Auxiliary noise is added
+        # afterwards so the online model identifies the path itself.
+        anti_noise_block = -anti_noise_block
+        if self.online_secondary_path:
+            aux_block = self._next_aux_block()
+            anti_noise_block = anti_noise_block + aux_block
+        if self.decimation > 1:
+            anti_noise_block = self._output_interpolator.process(anti_noise_block)
+        if probe is not None:
+            stamps[2] = time.perf_counter_ns()
+
+        error_block = exchange(anti_noise_block, ref_block)
+        if error_block is None:
+            return None
+
+        control_error = error_block
+        if self.decimation > 1:
+            control_error = self._error_decimator.process(error_block)
+        if probe is not None:
+            stamps[4] = time.perf_counter_ns()
+
+        if self.online_secondary_path:
+            aligned_aux = self._delayed(self._aux_delay_line, aux_block)
+            if aligned_aux is not None:
+                control_error = self._update_secondary_model(control_error, aligned_aux)
+
+        aligned_fx = self._align_fx(fx_vectors)
+        if aligned_fx is not None:
+            self._update_weights(control_error, aligned_fx)
+        if probe is not None:
+            stamps[5] = time.perf_counter_ns()
+        return anti_noise_block, error_block
+
+    def _play_and_capture(self, anti_noise_block: np.ndarray, ref_block: np.ndarray) -> Optional[np.ndarray]:
+        """Play one anti-noise block, with the reference if it is played too, and read the error."""
+        if self._uses_reference_stream():
+            self._write_output(anti_noise_block, ref_block)
+        elif self.play_reference:
+            self._write_output(np.clip(ref_block + anti_noise_block, -1.0, 1.0))
+        else:
+            self._write_output(np.clip(anti_noise_block, -1.0, 1.0))
+        if self.instrumentation is not None:
+            self._stage_stamps[3] = time.perf_counter_ns()
+        return self._read_error_block()
+
+    def apply_profile(self, profile: AncProfile, crossfade_seconds: float = 0.0) -> None:
+        """
+        Switch engine, filter length and step size without touching the streams.
+
+        The current weights are saved to ``weight_store`` under the old noise
+        class, the filter state is rebuilt for the profile and warm-started
+        from the store entry of the new class. For ``crossfade_seconds`` the
+        output then blends from a frozen copy of the old filter into the new
+        one with a raised-cosine ramp, so the switch does not click.
+        """
+        harmonics = profile.harmonics if profile.harmonics is not None else self.harmonics
+        if profile.engine not in ENGINES:
+            raise ValueError(f"Unknown engine {profile.engine!r}. Choose one of {ENGINES}.")
+        if profile.engine == "narrowband" and (self.fx_cache or harmonics < 1):
+            raise ValueError("narrowband engine needs harmonics >= 1 and no fx_cache")
+        if self.update_rule != "lms" and profile.engine == "frequency":
+            raise ValueError(f"update_rule={self.update_rule!r} needs the 'loop' or 'block' engine")
+        if self.update_rule == "rls" and profile.filter_length > RLS_MAX_FILTER_LENGTH:
+            raise ValueError(f"update_rule='rls' supports at most {RLS_MAX_FILTER_LENGTH} taps")
+
+        if self.frame_index > 0:
+            self._store_weights()
+        shadow = self._filter_snapshot() if crossfade_seconds > 0 and self.frame_index > 0 else None
+        previous_path = self.secondary_path
+
+        self.engine = profile.engine
+        self.filter_length = profile.filter_length
+        self.base_step_size = profile.step_size
+        self.harmonics = harmonics
+        if profile.fundamental_hz is not None:
+            self.fundamental_hz = profile.fundamental_hz
+        self.noise_class = profile.name
+        stored = self._load_stored_weights()
+        self._reset_filter_state()
+        if stored is not None:
+            self._apply_stored_weights(stored)
+        if self.online_secondary_path and self.secondary_path is not previous_path:
+            # The online model goes on from the path stored for the new class.
+            self._online_path = self.secondary_path.astype(np.float32).copy()
+            self._aux_history = np.zeros(len(self._online_path), dtype=np.float32)
+        if self.fx_cache:
+            self._ensure_fx_cache()
+
+        self._crossfade = None
+        if shadow is not None:
+            length = max(1, int(round(crossfade_seconds * self.control_rate)))
+            self._crossfade = [shadow, 0, length]
+        logging.info(
+            "Profile %r: engine=%s filter_length=%d step_size=%g",
+            profile.name,
+            profile.engine,
+            profile.filter_length,
+            profile.step_size,
+        )
+
+    def _filter_snapshot(self) -> "FxLMSANC":
+        """
+        Copy of the filter alone, which keeps producing the old profile's output.
+
+        The weights and the histories the engine advances are copied, settings
+        and read-only data are shared, and nothing else (streams, buffers,
+        recorder) is taken over.
+        """
+        snapshot = object.__new__(type(self))
+        state = vars(self)
+        vars(snapshot).update({name: state[name] for name in SNAPSHOT_SHARED if name in state})
+        vars(snapshot).update({name: copy.deepcopy(state[name]) for name in SNAPSHOT_COPIED if name in state})
+        return snapshot
+
+    def _crossfade_block(self, anti_noise_block: np.ndarray, control_ref: np.ndarray) -> np.ndarray:
+        """Blend the previous profile's output into ``anti_noise_block`` after a switch."""
+        shadow, position, length = self._crossfade
+        # The frozen filter reads the same reference segments from the fx cache.
+        shadow._reference_segments = self._reference_segments
+        previous, _ = shadow._synthesize_block(control_ref)
+        ramp = np.minimum((position + 1 + np.arange(len(anti_noise_block))) / length, 1.0)
+        gain = (0.5 - 0.5 * np.cos(np.pi * ramp)).astype(np.float32)
+        if anti_noise_block.ndim > 1:
+            gain = gain[:, None]
+        position += len(anti_noise_block)
+        self._crossfade = None if position >= length else [shadow, position, length]
+        return (gain * anti_noise_block + (1.0 - gain) * previous).astype(np.float32)
+
+    def _weight_store_key(self) -> tuple:
+        """(control device, error device, noise class) key of ``weight_store``."""
+        control = "default" if self.control_device_index is None else self.control_device_index
+        error = "default" if self.record_device_index is None else self.record_device_index
+        return control, error, self.noise_class
+
+    def _load_stored_weights(self) -> Optional[StoredWeights]:
+        """
+        Fetch a compatible warm-start entry and adopt its secondary-path model.
+
+        The model is taken if it was identified with the same whole-block
+        latency compensation and the current one is only a placeholder (no
+        path given or measured) or an online model's starting point. The
+        weights are applied after ``_reset_state``.
+        """
+        if self.weight_store is None:
+            return None
+        stored = self.weight_store.load(
+            *self._weight_store_key(),
+            control_rate=int(self.control_rate),
+            filter_length=2 * self.harmonics if self.engine == "narrowband" else self.filter_length,
+            engine_kind="narrowband" if self.engine == "narrowband" else "fir",
+        )
+        # Leading dimensions (outputs of a multichannel controller) must match too.
+        if stored is None or stored.weights.shape[:-1] != self.weights.shape[:-1]:
+            return None
+        if self.online_secondary_path or not self._secondary_path_known:
+            if stored.compensated_latency == self.delay_blocks * self.control_block_size:
+                self.secondary_path = stored.secondary_path
+            else:
+                logging.info("Stored secondary path was modelled for another latency; ignoring it")
+        return stored
+
+    def _apply_stored_weights(self, stored: StoredWeights) -> None:
+        """Start adapting from stored weights instead of zeros."""
+        self.weights = stored.weights.astype(np.float32).copy()
+        if self.engine == "frequency":
+            self._fd_weight_spectrum = np.fft.rfft(self.weights, self.fft_size)
+        if self.engine == "narrowband" and self.tracked_frequency is None:
+            self.tracked_frequency = stored.metadata.get("tracked_frequency")
+        logging.info(
+            "Warm start from stored weights (revision %d, noise class %r)", stored.revision, self.noise_class
+        )
+
+    def _store_weights(self) -> None:
+        """Save the current weights and secondary-path model to ``weight_store``."""
+        if self.weight_store is None or self.frame_index == 0:
+            return
+        if not np.all(np.isfinite(self.weights)):
+            logging.warning("Not storing non-finite weights")
+            return
+        metadata = {"blocks": self.frame_index, "sample_rate": self.sample_rate, "engine": self.engine}
+        if self.engine == "narrowband":
+            metadata["tracked_frequency"] = self.tracked_frequency
+        self.weight_store.save(
+            *self._weight_store_key(),
+            weights=self.weights,
+            secondary_path=self.secondary_path,
+            control_rate=int(self.control_rate),
+            engine_kind="narrowband" if self.engine == "narrowband" else "fir",
+            compensated_latency=self.delay_blocks * self.control_block_size,
+            metadata=metadata,
+        )
+
+    def _recording_channels(self) -> list:
+        """Channel names of a session recording, in ``record_block`` order."""
+        return ["reference", "anti_noise", "error"]
+
+    def _align_fx(self, fx_vectors):
+        """
+        Return the filtered-x data that the current error block responds to.
+
+        Payloads are queued for ``delay_blocks`` blocks; until the queue has
+        filled there is no matching data and None is returned.
+        """
+        return self._delayed(self._fx_delay_line, fx_vectors)
+
+    def _delayed(self, delay_line: deque, payload):
+        """Push ``payload`` and return the one from ``delay_blocks`` blocks ago."""
+        delay_line.append(payload)
+        if len(delay_line) <= self.delay_blocks:
+            return None
+        return delay_line[0]
+
+    def _next_aux_block(self) -> np.ndarray:
+        """White auxiliary noise for online secondary-path modelling."""
+        aux = self._aux_rng.uniform(-1.0, 1.0, size=self.control_block_size)
+        return (aux * self.aux_noise_level).astype(np.float32)
+
+    def _update_secondary_model(self, error_block: np.ndarray, aux_block: np.ndarray) -> np.ndarray:
+        """
+        NLMS step of the online secondary-path model.
+
+        ``aux_block`` is the auxiliary noise that produced ``error_block``.
+        The modelled auxiliary component is subtracted from the error, the
+        residual drives the model update, and the residual is returned for the
+        control update. The model is copied into ``secondary_path`` every
+        ``secondary_path_update_interval`` blocks.
+        """
+        extended = np.concatenate([self._aux_history[::-1], aux_block])
+        aux_vectors = _history_windows(extended, len(self._online_path))
+        self._aux_history = aux_vectors[-1].copy()
+
+        residual = (error_block - aux_vectors @ self._online_path).astype(np.float32)
+        energy = np.einsum("ij,ij->i", aux_vectors, aux_vectors) + EPSILON
+        self._online_path += (aux_vectors.T @ (self.aux_step_size / energy * residual)).astype(
+            np.float32
+        )
+
+        self._online_updates += 1
+        if self._online_updates % self.secondary_path_update_interval == 0:
+            self.secondary_path = self._online_path.copy()
+        return residual
+
+    def _set_latency(self, latency_samples: int) -> None:
+        """Record the loop latency and derive the whole-block compensation."""
+        if latency_samples < 0:
+            raise ValueError("latency_samples must be non-negative")
+        self.latency_samples = int(latency_samples)
+        self.delay_blocks = max(0, self.latency_samples - LATENCY_GUARD_SAMPLES) // self.block_size
+        if self.live_reference_channel is not None:
+            # The error is captured together with the reference, before the
+            # anti-noise computed from that reference can reach the mic. The
+            # measurements capture first as well, so latency_samples is at
+            # least a block; the guard could still round it down to zero.
+            self.delay_blocks = max(1, self.delay_blocks)
+
+    @property
+    def uncompensated_latency(self) -> int:
+        """Loop latency in adaptation-rate samples left to the secondary-path model."""
+        return self.latency_samples // self.decimation - self.delay_blocks * self.control_block_size
+
+    def _secondary_path_length(self, fir_length: Optional[int]) -> int:
+        """
+        Validate ``fir_length``, or pick one that covers the uncompensated latency.
+
+        A model no longer than that latency misses the whole response, and
+        the controller diverges on it.
+        """
+        residual = self.uncompensated_latency
+        if fir_length is None:
+            return max(DEFAULT_SECONDARY_PATH_LENGTH, residual + SECONDARY_PATH_TAIL_TAPS)
+        if fir_length <= residual:
+            raise ValueError(
+                f"fir_length={fir_length} does not reach past the uncompensated latency of "
+                f"{residual} samples; use at least {residual + SECONDARY_PATH_TAIL_TAPS}"
+            )
+        return fir_length
 
     def _synthesize_block(
         self, ref_block: np.ndarray
@@ -334,15 +1784,25 @@ class FxLMSANC:
         Returns
         -------
         anti_noise_block:
-            Array of length block_size containing the control signal.
+            Array of length control_block_size containing the control signal.
         fx_vectors:
-            Matrix with shape (block_size, filter_length) containing the
-            filtered reference vectors per sample for LMS updates.
+            Matrix with shape (control_block_size, filter_length) containing the
+            filtered reference vectors per sample for LMS updates. The
+            frequency engine returns the spectrum of the filtered-reference
+            buffer instead.
         """
-        anti_noise = np.zeros(self.block_size, dtype=np.float32)
-        fx_vectors = np.zeros((self.block_size, self.filter_length), dtype=np.float32)
-
-        for i in range(self.block_size):
+        if self.engine == "block":
+            return self._synthesize_block_vectorized(ref_block)
+        if self.engine == "frequency":
+            return self._synthesize_block_frequency(ref_block)
+        if self.engine == "narrowband":
+            return self._synthesize_block_narrowband(ref_block)
+
+        anti_noise = np.zeros(self.control_block_size, dtype=np.float32)
+        fx_vectors = np.zeros((self.control_block_size, self.filter_length), dtype=np.float32)
+        cached = self._cached_filtered_block() if self.fx_cache else None
+
+        for i in range(self.control_block_size):
             x_n = ref_block[i]
 
             # Update reference history
@@ -353,9 +1813,12 @@ class FxLMSANC:
             anti_noise[i] = float(np.dot(self.weights, self.ref_history))
 
             # Filtered-x: pass the reference through secondary path estimate
-            self.sec_history[1:] = self.sec_history[:-1]
-            self.sec_history[0] = x_n
-            filtered_sample = float(np.dot(self.secondary_path, self.sec_history))
+            if cached is not None:
+                filtered_sample = cached[i]
+            else:
+                self.sec_history[1:] = self.sec_history[:-1]
+                self.sec_history[0] = x_n
+                filtered_sample = float(np.dot(self.secondary_path, self.sec_history))
 
             self.fx_history[1:] = self.fx_history[:-1]
             self.fx_history[0] = filtered_sample
@@ -364,67 +1827,533 @@ class FxLMSANC:
 
         return anti_noise, fx_vectors
 
+    def _synthesize_block_vectorized(
+        self, ref_block: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Block engine counterpart of ``_synthesize_block``.
+
+        Each history buffer (newest sample first) is unrolled in front of the
+        new samples, so row ``i`` of a sliding window over the extended signal
+        is exactly the history vector the loop engine holds at sample ``i``.
+        The returned ``fx_vectors`` is a strided view, not a copy.
+        """
+        ref_block = np.asarray(ref_block, dtype=np.float32)
+
+        ref_ext = np.concatenate([self.ref_history[::-1], ref_block])
+        ref_windows = _history_windows(ref_ext, self.filter_length)
+        anti_noise = ref_windows @ self.weights
+
+        if self.fx_cache:
+            filtered = self._cached_filtered_block()
+        else:
+            sec_ext = np.concatenate([self.sec_history[::-1], ref_block])
+            sec_windows = _history_windows(sec_ext, len(self.secondary_path))
+            filtered = sec_windows @ self.secondary_path
+            self.sec_history = sec_windows[-1].copy()
+
+        fx_ext = np.concatenate([self.fx_history[::-1], filtered])
+        fx_vectors = _history_windows(fx_ext, self.filter_length)
+
+        self.ref_history = ref_windows[-1].copy()
+        self.fx_history = fx_vectors[-1].copy()
+
+        return anti_noise.astype(np.float32, copy=False), fx_vectors
+
     def _update_weights(self, error_block: np.ndarray, fx_vectors: np.ndarray) -> None:
         """LMS weight adaptation for the current block."""
+        if self.update_rule == "apa":
+            self._update_weights_affine_projection(error_block, fx_vectors)
+            return
+        if self.update_rule == "rls":
+            self._update_weights_rls(error_block, fx_vectors)
+            return
+        if self.engine in ("block", "narrowband"):
+            self._update_weights_vectorized(error_block, fx_vectors)
+            return
+        if self.engine == "frequency":
+            self._update_weights_frequency(error_block, fx_vectors)
+            return
+
         for e, fx in zip(error_block, fx_vectors):
             step = self._compute_step(fx)
             self.weights += step * e * fx
 
-    def measure_secondary_path(
-        self,
-        duration: float = 2.0,
-        excitation_level: float = 0.2,
-        fir_length: int = 64,
-    ) -> np.ndarray:
+    def _update_weights_vectorized(
+        self, error_block: np.ndarray, fx_vectors: np.ndarray
+    ) -> None:
         """
-        Excite the secondary path (speaker→mic) and estimate an FIR model.
+        Block engine counterpart of ``_update_weights``.
 
-        This sends white noise to the speaker for the requested duration,
-        records the response at the error microphone, and solves a least-squares
-        problem to approximate the impulse response.
+        The per-sample increments ``step[i] * e[i] * fx[i]`` only depend on the
+        filtered reference, so their sum is a single matrix-vector product.
         """
-        self._open_streams()
+        error_block = np.asarray(error_block, dtype=np.float32)
+        if self.normalize_step:
+            energy = np.einsum("ij,ij->i", fx_vectors, fx_vectors)
+            steps = self.base_step_size / (energy + NLMS_REGULARIZATION * fx_vectors.shape[1])
+        else:
+            steps = np.full(len(error_block), self.base_step_size, dtype=np.float32)
+        self.weights += (fx_vectors.T @ (steps * error_block)).astype(np.float32)
 
-        n_samples = int(duration * self.sample_rate)
-        excitation = np.random.uniform(-1.0, 1.0, size=n_samples).astype(np.float32)
-        excitation *= excitation_level
+    def _update_weights_affine_projection(
+        self, error_block: np.ndarray, fx_vectors: np.ndarray
+    ) -> None:
+        """
+        Affine projection update over consecutive groups of ``projection_order`` samples.
+
+        Each group ``c`` contributes ``X_c^T (X_c X_c^T + delta I)^-1 e_c``. As
+        with the LMS rule the errors are measured, not recomputed, so the
+        groups are independent and solved as one batched system.
+        """
+        order = self.projection_order
+        n_groups = len(error_block) // order
+        rows = np.asarray(fx_vectors, dtype=np.float64).reshape(n_groups, order, -1)
+        errors = np.asarray(error_block, dtype=np.float64).reshape(n_groups, order, 1)
+
+        gram = rows @ rows.transpose(0, 2, 1)
+        loading = APA_REGULARIZATION * np.trace(gram, axis1=1, axis2=2) / order + EPSILON
+        gram += loading[:, None, None] * np.eye(order)
+        coefficients = np.linalg.solve(gram, errors)[..., 0]
+
+        step = min(self.base_step_size, APA_MAX_BLOCK_STEP / n_groups)
+        self._apply_update(step * np.einsum("cpl,cp->l", rows, coefficients))
+
+    def _update_weights_rls(self, error_block: np.ndarray, fx_vectors: np.ndarray) -> None:
+        """
+        Exponentially weighted RLS update for one block.
+
+        The weights are constant within a block, so the measured errors are
+        the a-priori errors of all rows and the block can be absorbed with one
+        Woodbury update of the inverse correlation matrix ``P``:
+        ``K = P X^T (D^-1 + X P X^T)^-1``, ``w += K e``,
+        ``P = (P - K X P) / lambda**B`` with ``D = diag(lambda**-(i + 1))``.
+        """
+        rows = np.asarray(fx_vectors, dtype=np.float64)
+        errors = np.asarray(error_block, dtype=np.float64)
+        n_rows = len(errors)
+        forgetting = self.rls_forgetting
+        inverse = self._rls_inverse
+
+        gain_basis = inverse @ rows.T
+        innovation = rows @ gain_basis
+        innovation[np.diag_indices(n_rows)] += forgetting ** (np.arange(n_rows) + 1.0)
+        try:
+            gain = np.linalg.solve(innovation, gain_basis.T).T
+        except np.linalg.LinAlgError:
+            self._reject_update("singular RLS innovation matrix")
+            return
+
+        inverse = (inverse - gain @ gain_basis.T) / forgetting**n_rows
+        inverse = 0.5 * (inverse + inverse.T)
+        if not np.all(np.isfinite(inverse)) or np.trace(inverse) > RLS_MAX_TRACE:
+            self._reject_update("RLS inverse correlation matrix diverged")
+            self._reset_rls_state()
+            return
+
+        self._rls_inverse = inverse
+        self._apply_update(gain @ errors)
+
+    def _apply_update(self, delta: np.ndarray) -> None:
+        """Add a weight increment unless it is not finite."""
+        if not np.all(np.isfinite(delta)):
+            self._reject_update("non-finite weight update")
+            return
+        self.weights += delta.astype(np.float32)
+
+    def _reject_update(self, reason: str) -> None:
+        self.rejected_updates += 1
+        if self.rejected_updates == 1 or self.rejected_updates % 100 == 0:
+            logging.warning("Skipped weight update (%s); %d so far", reason, self.rejected_updates)
+
+    def _synthesize_block_narrowband(
+        self, ref_block: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Narrowband engine counterpart of ``_synthesize_block``.
+
+        Returns the harmonic anti-noise and a (control_block_size, 2 * harmonics)
+        matrix of filtered synthetic references, so the regular block update
+        rules adapt the cosine/sine weights.
+        """
+        n = self.control_block_size
+        if self.tracked_frequency is None:
+            self._acquire_fundamental(ref_block)
+            if self.tracked_frequency is None:
+                return np.zeros(n, dtype=np.float32), np.zeros((n, 2 * self.harmonics), np.float32)
+
+        omega = 2.0 * np.pi * self.tracked_frequency / self.control_rate
+        phases = self._nb_phase + omega * np.arange(n)
+        self._nb_phase = float((self._nb_phase + omega * n) % (2.0 * np.pi))
+
+        orders = np.arange(1, self.harmonics + 1)
+        # Harmonics at or above Nyquist cannot be reproduced; leave them silent.
+        audible = orders * omega < np.pi
+        carriers = np.exp(1j * np.outer(phases, orders)) * audible
+        references = np.concatenate([carriers.real, carriers.imag], axis=1)
+        if self.track_frequency:
+            self._track_fundamental(ref_block, references)
+
+        # Secondary-path gain and phase at each harmonic.
+        taps = np.arange(len(self.secondary_path))
+        response = np.exp(-1j * np.outer(orders * omega, taps)) @ self.secondary_path
+        filtered = carriers * response
+
+        fx_vectors = np.concatenate([filtered.real, filtered.imag], axis=1)
+        anti_noise = references @ self.weights
+        return anti_noise.astype(np.float32), fx_vectors.astype(np.float32)
+
+    def _acquire_fundamental(self, ref_block: np.ndarray) -> None:
+        """Collect reference and pick the fundamental with a harmonic sum of log spectra."""
+        self._nb_acquisition.append(np.array(ref_block, dtype=np.float32))
+        needed = int(NARROWBAND_ACQUISITION_SECONDS * self.control_rate)
+        if sum(len(block) for block in self._nb_acquisition) < needed:
+            return
+
+        signal = np.concatenate(self._nb_acquisition)
+        self._nb_acquisition = []
+        size = 1 << (4 * len(signal) - 1).bit_length()
+        magnitude = np.abs(np.fft.rfft(signal * np.hanning(len(signal)), size)) + EPSILON
+        resolution = self.control_rate / size
+
+        low = max(1, int(NARROWBAND_MIN_HZ / resolution))
+        high = min(int(NARROWBAND_MAX_HZ / resolution), (len(magnitude) - 1) // self.harmonics)
+        candidates = np.arange(low, high + 1)
+        orders = np.arange(1, self.harmonics + 1)
+        score = np.log(magnitude[np.outer(candidates, orders)]).sum(axis=1)
+        peak = int(candidates[np.argmax(score)])
+
+        # Parabolic interpolation on the fundamental's log magnitude.
+        left, centre, right = np.log(magnitude[peak - 1 : peak + 2])
+        curvature = left - 2.0 * centre + right
+        offset = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+        self.tracked_frequency = float((peak + offset) * resolution)
+        logging.info("Narrowband engine locked to %.2f Hz", self.tracked_frequency)
+
+    def _track_fundamental(self, ref_block: np.ndarray, references: np.ndarray) -> None:
+        """
+        Frequency-locked loop on the reference.
+
+        All harmonics are fitted jointly on the synthetic carriers (blocks are
+        too short for the harmonics to separate by demodulation alone). The
+        fundamental's phase then advances by ``2*pi*(f - f0)*n/fs`` per block,
+        and that advance corrects f0.
+        """
+        ref_block = np.asarray(ref_block, dtype=np.float64)
+        n = len(ref_block)
+        amplitudes = np.linalg.lstsq(references, ref_block, rcond=None)[0]
+        power = float(np.dot(ref_block, ref_block))
+        fundamental = amplitudes[0] - 1j * amplitudes[self.harmonics]
+        coherence = 0.5 * n * abs(fundamental) ** 2 / (power + EPSILON)
+        if coherence < NARROWBAND_COHERENCE_MIN:
+            self._nb_last_demodulation = None
+            return
+
+        phase = float(np.angle(fundamental))
+        if self._nb_last_demodulation is not None:
+            advance = (phase - self._nb_last_demodulation + np.pi) % (2.0 * np.pi) - np.pi
+            offset = advance * self.control_rate / (2.0 * np.pi * n)
+            self.tracked_frequency += NARROWBAND_TRACKING_GAIN * offset
+        self._nb_last_demodulation = phase
+
+    def _synthesize_block_frequency(
+        self, ref_block: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Frequency engine counterpart of ``_synthesize_block``.
 
+        The reference and filtered-reference buffers hold the last
+        ``fft_size`` samples; only the final ``control_block_size`` outputs of
+        each circular convolution are kept (overlap-save).
+        """
+        n = self.control_block_size
+        size = self.fft_size
+
+        self._fd_ref_buffer[:-n] = self._fd_ref_buffer[n:]
+        self._fd_ref_buffer[-n:] = ref_block
+        ref_spectrum = np.fft.rfft(self._fd_ref_buffer)
+
+        anti_noise = np.fft.irfft(ref_spectrum * self._fd_weight_spectrum, size)[-n:]
+        if self.fx_cache:
+            filtered = self._cached_filtered_block()
+        else:
+            filtered = np.fft.irfft(ref_spectrum * self._fd_sec_spectrum, size)[-n:]
+
+        self._fd_fx_buffer[:-n] = self._fd_fx_buffer[n:]
+        self._fd_fx_buffer[-n:] = filtered
+        fx_spectrum = np.fft.rfft(self._fd_fx_buffer)
+
+        return anti_noise.astype(np.float32), fx_spectrum
+
+    def _update_weights_frequency(
+        self, error_block: np.ndarray, fx_spectrum: np.ndarray
+    ) -> None:
+        """
+        Constrained, per-bin normalised gradient step of the frequency engine.
+
+        The cross-correlation of the error block with the filtered reference is
+        taken in the FFT domain and truncated to ``filter_length`` taps. With
+        normalisation each bin is divided by its smoothed power; the step is
+        rescaled by ``fft_size / filter_length`` so a given ``step_size``
+        behaves like the time-domain NLMS engines on white input.
+        """
+        self._fd_error_buffer[-self.control_block_size :] = error_block
+        error_spectrum = np.fft.rfft(self._fd_error_buffer)
+        gradient_spectrum = np.conj(fx_spectrum) * error_spectrum
+
+        if self.normalize_step:
+            power = np.abs(fx_spectrum) ** 2
+            if self._fd_power is None:
+                self._fd_power = power
+            else:
+                self._fd_power = (
+                    FREQUENCY_POWER_SMOOTHING * self._fd_power
+                    + (1.0 - FREQUENCY_POWER_SMOOTHING) * power
+                )
+            gradient_spectrum = gradient_spectrum / (self._fd_power + EPSILON)
+            step = self.base_step_size * self.fft_size / self.filter_length
+        else:
+            step = self.base_step_size
+
+        gradient = np.fft.irfft(gradient_spectrum, self.fft_size)[: self.filter_length]
+        self.weights += (step * gradient).astype(np.float32)
+        self._fd_weight_spectrum = np.fft.rfft(self.weights, self.fft_size)
+
+    def _play_and_record(self, excitation: np.ndarray) -> np.ndarray:
+        """Play ``excitation`` on the control speaker and record the error mic."""
+        self._open_streams()
+
+        n_samples = len(excitation)
         recorded = np.zeros(n_samples, dtype=np.float32)
         ptr = 0
 
-        logging.info("Measuring secondary path for %.2f s", duration)
-
         while ptr < n_samples:
             block = excitation[ptr : ptr + self.block_size]
             if len(block) < self.block_size:
                 block = np.pad(block, (0, self.block_size - len(block)))
 
-            self._control_stream.write(block.astype(np.float32).tobytes())
-            raw = self._input_stream.read(
-                self.block_size, exception_on_overflow=False
-            )
-            error_block = (
-                np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
-            )
+            error_block = self._exchange_block(block)
+            if error_block is None:
+                raise RuntimeError("Measurement interrupted by stop()")
             slice_len = min(self.block_size, n_samples - ptr)
             recorded[ptr : ptr + slice_len] = error_block[:slice_len]
             ptr += self.block_size
 
-        # Build Toeplitz matrix for least squares: y = Xh
-        X = np.zeros((n_samples - fir_length, fir_length), dtype=np.float32)
-        for i in range(fir_length):
-            X[:, i] = excitation[i : i + n_samples - fir_length]
-        y = recorded[fir_length:]
+        return recorded
+
+    def _finish_measurement(self) -> None:
+        """
+        Close callback streams after a measurement.
+
+        Their callbacks would otherwise keep draining the rings until ``run()``,
+        which changes the latency that was just measured; reopening re-primes
+        the rings to the measured state.
+        """
+        if self.io_mode == "callback":
+            self._close_streams()
+
+    def measure_loop_latency(
+        self,
+        duration: float = 1.0,
+        excitation_level: float = 0.2,
+    ) -> int:
+        """
+        Measure the output-to-input latency of the control loop in samples.
+
+        A white-noise burst is played through ``_play_and_record``; the lag of
+        the cross-correlation peak between excitation and recording covers the
+        stream buffering plus the acoustic delay. Works equally with a physical
+        loopback cable in place of the speaker and microphone.
+        """
+        n_samples = int(duration * self.sample_rate)
+        excitation = np.random.uniform(-1.0, 1.0, size=n_samples).astype(np.float32)
+        excitation *= excitation_level
+
+        logging.info("Measuring loop latency for %.2f s", duration)
+        try:
+            recorded = self._play_and_record(excitation)
+        finally:
+            self._finish_measurement()
+
+        size = 1 << (2 * n_samples - 1).bit_length()
+        xcorr = np.fft.irfft(
+            np.fft.rfft(recorded, size) * np.conj(np.fft.rfft(excitation, size)), size
+        )[: n_samples // 2]
+        latency = int(np.argmax(np.abs(xcorr)))
+
+        self._set_latency(latency)
+        logging.info(
+            "Loop latency %d samples (%.2f ms), compensating %d block(s)",
+            latency,
+            1000.0 * latency / self.sample_rate,
+            self.delay_blocks,
+        )
+        return latency
+
+    def measure_secondary_path(
+        self,
+        duration: float = 2.0,
+        excitation_level: float = 0.2,
+        fir_length: Optional[int] = None,
+        method: str = "wiener",
+    ) -> np.ndarray:
+        """
+        Excite the secondary path (speaker→mic) and estimate an FIR model.
+
+        This sends white noise to the speaker for the requested duration and
+        records the response at the error microphone. The whole blocks of loop
+        latency that the control loop compensates are removed from the
+        recording first, so the model only covers the remaining delay
+        (``uncompensated_latency``, up to ``block_size + LATENCY_GUARD_SAMPLES``
+        samples). ``fir_length`` defaults to that delay plus
+        ``SECONDARY_PATH_TAIL_TAPS``, and at least
+        ``DEFAULT_SECONDARY_PATH_LENGTH``; a ``fir_length`` that does not reach
+        past the delay raises ValueError.
+
+        ``method="wiener"`` (default) feeds each block to a
+        ``SecondaryPathEstimator`` as it arrives and solves the Wiener-Hopf
+        equations once the excitation stops, using O(fir_length) memory.
+        ``method="lstsq"`` records the whole response and solves the dense
+        least-squares problem, which needs ``duration * rate * fir_length``
+        floats.
+
+        With decimation, the excitation is generated at the adaptation rate and
+        passed through the same interpolation and decimation filters as the
+        control loop, so ``fir_length`` taps at the reduced rate include them.
+        """
+        if method not in SECONDARY_PATH_METHODS:
+            raise ValueError(f"Unknown method {method!r}. Choose one of {SECONDARY_PATH_METHODS}.")
+
+        fir_length = self._secondary_path_length(fir_length)
+
+        logging.info("Measuring secondary path for %.2f s", duration)
+        try:
+            if method == "wiener":
+                h = self._estimate_secondary_path_streaming(duration, excitation_level, fir_length)
+            else:
+                h = self._estimate_secondary_path_lstsq(duration, excitation_level, fir_length)
+        finally:
+            self._finish_measurement()
 
-        h, *_ = np.linalg.lstsq(X, y, rcond=None)
         self.secondary_path = h.astype(np.float32)
+        self._secondary_path_known = True
         logging.info("Secondary path updated (length %d)", fir_length)
         return self.secondary_path.copy()
 
+    def _estimate_secondary_path_streaming(
+        self, duration: float, excitation_level: float, fir_length: int
+    ) -> np.ndarray:
+        """Block-by-block excitation feeding a ``SecondaryPathEstimator``."""
+        self._open_streams()
+        estimator = SecondaryPathEstimator(fir_length)
+        if self.decimation > 1:
+            interpolator = _PolyphaseInterpolator(self.decimation)
+            decimator = _PolyphaseDecimator(self.decimation)
+
+        n_blocks = -(-int(duration * self.control_rate) // self.control_block_size)
+        in_flight: deque = deque()
+        silence = np.zeros(self.control_block_size, dtype=np.float32)
+
+        # The last delay_blocks iterations play silence while the responses to
+        # the final excitation blocks come back.
+        for index in range(n_blocks + self.delay_blocks):
+            if index < n_blocks:
+                excitation = np.random.uniform(-1.0, 1.0, size=self.control_block_size)
+                excitation = (excitation * excitation_level).astype(np.float32)
+            else:
+                excitation = silence
+
+            played = interpolator.process(excitation) if self.decimation > 1 else excitation
+            response = self._exchange_block(played)
+            if response is None:
+                raise RuntimeError("Measurement interrupted by stop()")
+            if self.decimation > 1:
+                response = decimator.process(response)
+
+            in_flight.append(excitation)
+            if len(in_flight) > self.delay_blocks:
+                estimator.update(in_flight.popleft(), response)
+
+        return estimator.solve()
+
+    def _estimate_secondary_path_lstsq(
+        self, duration: float, excitation_level: float, fir_length: int
+    ) -> np.ndarray:
+        """Record the full response and solve the dense least-squares problem."""
+        n_samples = int(duration * self.control_rate)
+        excitation = np.random.uniform(-1.0, 1.0, size=n_samples).astype(np.float32)
+        excitation *= excitation_level
+
+        if self.decimation > 1:
+            played = _PolyphaseInterpolator(self.decimation).process(excitation)
+            recorded = self._play_and_record(played)
+            recorded = _PolyphaseDecimator(self.decimation).process(recorded)
+        else:
+            recorded = self._play_and_record(excitation)
+
+        bulk_delay = self.delay_blocks * self.control_block_size
+        n_samples -= bulk_delay
+        recorded = recorded[bulk_delay:]
+
+        # Build Toeplitz matrix for least squares: y = Xh, y[n] = sum_k h[k] x[n - k]
+        X = np.zeros((n_samples - fir_length, fir_length), dtype=np.float32)
+        for k in range(fir_length):
+            X[:, k] = excitation[fir_length - k : n_samples - k]
+        y = recorded[fir_length:]
+
+        h, *_ = np.linalg.lstsq(X, y, rcond=None)
+        return h
+
+
+def _history_windows(extended: np.ndarray, length: int) -> np.ndarray:
+    """
+    Return per-sample history vectors (newest sample first) as a strided view.
+
+    ``extended`` holds ``length`` samples of past history (oldest first)
+    followed by the new block; row ``i`` of the result equals the history
+    buffer after pushing new sample ``i``.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(extended[1:], length)
+    return windows[:, ::-1]
+
 
 def build_arg_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description="Run FxLMS ANC session.")
-    parser.add_argument("reference_path", help="Path to reference noise WAV file")
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run FxLMS ANC session. Use 'bench' as the first argument to benchmark the engines, "
+            "or 'replay' to replay a recorded session offline."
+        )
+    )
+    parser.add_argument(
+        "reference_path",
+        nargs="?",
+        default=None,
+        help="Path to reference noise WAV file (omit with --live-reference-channel)",
+    )
+    parser.add_argument(
+        "--live-reference-channel",
+        type=int,
+        default=None,
+        help="Capture the reference live from this channel of the record device",
+    )
+    parser.add_argument(
+        "--error-channel",
+        type=int,
+        default=0,
+        help="Channel of the record device carrying the error microphone",
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=int,
+        default=None,
+        help="Operating sample rate (defaults to the reference file's rate)",
+    )
+    parser.add_argument(
+        "--reference-channel",
+        type=int,
+        default=0,
+        help="Channel of the reference WAV file to use",
+    )
     parser.add_argument(
         "--filter-length",
         type=int,
@@ -440,8 +2369,9 @@ def build_arg_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--step-size",
         type=float,
-        default=5e-4,
-        help="Base LMS step size",
+        default=None,
+        help=f"Base LMS step size (default {DEFAULT_STEP_SIZE}); ignored by --update-rule rls, "
+        "which adapts at the rate set by --rls-forgetting",
     )
     parser.add_argument(
         "--play-reference",
@@ -466,44 +2396,340 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=None,
         help="Input device index for error microphone",
     )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=DEFAULT_ENGINE,
+        help="DSP engine: per-sample reference loop, vectorized block engine, "
+        "overlap-save frequency-domain engine or harmonic narrowband controller for tonal noise",
+    )
+    parser.add_argument(
+        "--io-mode",
+        choices=IO_MODES,
+        default=DEFAULT_IO_MODE,
+        help="Blocking stream calls or PyAudio callbacks with a DSP thread",
+    )
+    parser.add_argument(
+        "--latency-samples",
+        type=int,
+        default=None,
+        help="Known output-to-input loop latency in samples",
+    )
+    parser.add_argument(
+        "--measure-latency",
+        action="store_true",
+        help="Measure the loop latency before starting the session",
+    )
+    parser.add_argument(
+        "--decimation",
+        type=int,
+        default=1,
+        help="Adapt at sample_rate / DECIMATION (multirate mode for the 20-250 Hz band)",
+    )
+    parser.add_argument(
+        "--fx-cache",
+        action="store_true",
+        help="Precompute the filtered reference once instead of filtering per sample",
+    )
+    parser.add_argument(
+        "--fx-cache-dir",
+        default=None,
+        help="Directory for persisting the filtered-x cache",
+    )
+    parser.add_argument(
+        "--measure-secondary-path",
+        action="store_true",
+        help="Estimate the secondary path before starting the session",
+    )
+    parser.add_argument(
+        "--secondary-path-method",
+        choices=SECONDARY_PATH_METHODS,
+        default="wiener",
+        help="Streaming Wiener-Hopf estimate or dense least squares",
+    )
+    parser.add_argument(
+        "--secondary-path-length",
+        type=int,
+        default=None,
+        help="Taps of the measured secondary-path model (default: the latency left after "
+        f"block compensation plus {SECONDARY_PATH_TAIL_TAPS}, at least {DEFAULT_SECONDARY_PATH_LENGTH})",
+    )
+    parser.add_argument(
+        "--online-secondary-path",
+        action="store_true",
+        help="Keep identifying the secondary path with auxiliary noise while running",
+    )
+    parser.add_argument(
+        "--aux-noise-level",
+        type=float,
+        default=DEFAULT_AUX_NOISE_LEVEL,
+        help="Peak amplitude of the auxiliary modelling noise",
+    )
+    parser.add_argument(
+        "--aux-step-size",
+        type=float,
+        default=DEFAULT_AUX_STEP_SIZE,
+        help="NLMS step of the online secondary-path model (smaller: slower but steadier)",
+    )
+    parser.add_argument(
+        "--update-rule",
+        choices=UPDATE_RULES,
+        default="lms",
+        help="Weight update rule: NLMS, affine projection or block RLS",
+    )
+    parser.add_argument(
+        "--projection-order",
+        type=int,
+        default=DEFAULT_PROJECTION_ORDER,
+        help="Affine projection order",
+    )
+    parser.add_argument(
+        "--rls-forgetting",
+        type=float,
+        default=DEFAULT_RLS_FORGETTING,
+        help="RLS forgetting factor",
+    )
+    parser.add_argument(
+        "--harmonics",
+        type=int,
+        default=DEFAULT_HARMONICS,
+        help="Harmonics tracked by the narrowband engine",
+    )
+    parser.add_argument(
+        "--fundamental-hz",
+        type=float,
+        default=None,
+        help="Initial fundamental for the narrowband engine (estimated if omitted)",
+    )
     parser.add_argument(
         "--duration",
         type=float,
         default=None,
         help="Optional maximum runtime in seconds",
     )
+    parser.add_argument(
+        "--max-blocks",
+        type=int,
+        default=None,
+        help="Optional maximum number of processed blocks",
+    )
+    parser.add_argument(
+        "--instrument",
+        action="store_true",
+        help="Time every stage of the control loop and log a summary at the end",
+    )
+    parser.add_argument(
+        "--weight-store",
+        default=None,
+        help="Directory of stored weights to warm-start from and save to",
+    )
+    parser.add_argument(
+        "--noise-class",
+        default=DEFAULT_NOISE_CLASS,
+        help="Noise class under which --weight-store keeps the weights",
+    )
+    parser.add_argument(
+        "--profiles",
+        default=None,
+        help="JSON file of noise-class profiles to switch between (see profile_switcher.py); "
+        "a streaming YAMNet classifier picks the profile",
+    )
+    parser.add_argument(
+        "--classifier-device",
+        type=int,
+        default=None,
+        help="Input device index the --profiles classifier listens to (default: the reference signal)",
+    )
+    parser.add_argument(
+        "--classifier-tflite",
+        default=None,
+        help="Exported TFLite YAMNet for the --profiles classifier instead of the SavedModel",
+    )
+    parser.add_argument(
+        "--record",
+        default=None,
+        help="Record the reference, anti-noise and error signals of the session to this file",
+    )
+    parser.add_argument(
+        "--record-format",
+        choices=RECORDING_FORMATS,
+        default="wav",
+        help="File format for --record",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Run against a simulated room instead of audio devices",
+    )
+    parser.add_argument(
+        "--sim-primary-path",
+        default=None,
+        help="Simulated noise→error mic impulse response (.npy, default: delta)",
+    )
+    parser.add_argument(
+        "--sim-secondary-path",
+        default=None,
+        help="Simulated speaker→error mic impulse response (.npy, default: delta)",
+    )
+    parser.add_argument(
+        "--sim-delay",
+        type=int,
+        default=0,
+        help="Simulated output-to-input latency in samples",
+    )
+    parser.add_argument(
+        "--sim-noise",
+        type=float,
+        default=0.0,
+        help="Standard deviation of simulated microphone noise",
+    )
+    parser.add_argument(
+        "--sim-seed",
+        type=int,
+        default=None,
+        help="Seed of the simulated microphone noise",
+    )
     return parser
 
 
+def build_classifier_feed(
+    switcher: ProfileSwitcher,
+    sample_rate: int,
+    device_index: Optional[int] = None,
+    tflite_path: Optional[str] = None,
+) -> ClassifierFeed:
+    """
+    Streaming YAMNet classifier whose labels drive ``switcher``.
+
+    It classifies the controller's reference blocks, or ``device_index``.
+    """
+    if CLASSIFIER_DIR not in sys.path:
+        sys.path.insert(0, CLASSIFIER_DIR)
+    from streaming_classifier import StreamingClassifier
+
+    model = class_names = None
+    if tflite_path:
+        from yamnet_tflite import TFLiteYAMNet
+
+        model = TFLiteYAMNet(tflite_path)
+        class_names = model.class_names
+    classifier = StreamingClassifier(
+        model, class_names, input_rate=sample_rate, on_label=switcher.observe
+    )
+    return ClassifierFeed(classifier, device_index=device_index)
+
+
 def main(argv: Optional[Sequence[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == "bench":
+        # Imported here: the benchmark module builds on this one.
+        from benchmark import main as benchmark_main
+
+        return benchmark_main(argv[1:])
+    if argv and argv[0] == "replay":
+        # Imported here: the replay module builds on this one.
+        from session_replay import main as replay_main
+
+        return replay_main(argv[1:])
+
     parser = build_arg_parser()
     args = parser.parse_args(argv)
+    if (args.reference_path is None) == (args.live_reference_channel is None):
+        parser.error("provide either reference_path or --live-reference-channel")
+    if args.simulate and args.reference_path is None:
+        parser.error("--simulate needs reference_path as the simulated noise source")
+    if (args.classifier_device is not None or args.classifier_tflite) and not args.profiles:
+        parser.error("--classifier-device and --classifier-tflite need --profiles")
+    if args.simulate and args.classifier_device is not None:
+        parser.error("--classifier-device needs audio devices; --simulate classifies the reference")
 
     logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.update_rule == "rls" and args.step_size is not None:
+        logging.warning("--step-size is ignored by --update-rule rls; use --rls-forgetting")
+
+    backend = None
+    if args.simulate:
+        primary = np.load(args.sim_primary_path) if args.sim_primary_path else np.ones(1)
+        secondary = np.load(args.sim_secondary_path) if args.sim_secondary_path else np.ones(1)
+        room = SimulatedRoom(
+            primary_path=primary,
+            secondary_path=secondary,
+            # With play_reference the noise comes from a speaker instead.
+            source=None if args.play_reference else WavReference(args.reference_path, args.reference_channel),
+            delay_samples=args.sim_delay,
+            noise_level=args.sim_noise,
+            error_channels=[args.error_channel],
+            seed=args.sim_seed,
+        )
+        backend = SimulatedBackend(room, speed=1.0)
 
     controller = FxLMSANC(
         reference_path=args.reference_path,
+        sample_rate=args.sample_rate,
+        reference_channel=args.reference_channel,
+        live_reference_channel=args.live_reference_channel,
+        error_channel=args.error_channel,
         filter_length=args.filter_length,
         block_size=args.block_size,
-        step_size=args.step_size,
+        step_size=DEFAULT_STEP_SIZE if args.step_size is None else args.step_size,
         play_reference=args.play_reference,
         control_device_index=args.control_device,
         record_device_index=args.record_device,
         reference_device_index=args.reference_device,
+        engine=args.engine,
+        io_mode=args.io_mode,
+        latency_samples=args.latency_samples,
+        decimation=args.decimation,
+        fx_cache=args.fx_cache or bool(args.fx_cache_dir),
+        fx_cache_dir=args.fx_cache_dir,
+        online_secondary_path=args.online_secondary_path,
+        aux_noise_level=args.aux_noise_level,
+        aux_step_size=args.aux_step_size,
+        update_rule=args.update_rule,
+        projection_order=args.projection_order,
+        rls_forgetting=args.rls_forgetting,
+        harmonics=args.harmonics,
+        fundamental_hz=args.fundamental_hz,
+        audio_backend=backend,
+        instrumentation=RunInstrumentation() if args.instrument else None,
+        recorder=SessionRecorder(args.record, format=args.record_format) if args.record else None,
+        weight_store=WeightStore(args.weight_store) if args.weight_store else None,
+        noise_class=args.noise_class,
+        profile_switcher=ProfileSwitcher.from_json(args.profiles) if args.profiles else None,
     )
+    if controller.profile_switcher is not None:
+        controller.classifier_feed = build_classifier_feed(
+            controller.profile_switcher,
+            controller.sample_rate,
+            device_index=args.classifier_device,
+            tflite_path=args.classifier_tflite,
+        )
+
+    if args.measure_latency:
+        controller.measure_loop_latency()
+    if args.measure_secondary_path:
+        controller.measure_secondary_path(
+            fir_length=args.secondary_path_length, method=args.secondary_path_method
+        )
 
     def log_metrics(metrics: AncMetrics) -> None:
         logging.info(
-            "frame=%05d error_rms=%.6f",
+            "frame=%05d error_rms=%.6f latency=%d",
             metrics.frame_index,
             metrics.error_rms,
+            metrics.latency_samples,
         )
 
     controller.run(
-        loop_reference=True if args.duration else False,
+        loop_reference=bool(args.duration or args.max_blocks),
         max_duration=args.duration,
         metrics_callback=log_metrics,
+        max_blocks=args.max_blocks,
     )
+    if controller.instrumentation is not None:
+        logging.info("Run summary: %s", json.dumps(controller.instrumentation.snapshot()))
+    if controller.recorder is not None:
+        logging.info("Session recorded to %s", controller.recorder.path)
 
     return 0
 
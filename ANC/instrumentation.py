@@ -0,0 +1,218 @@
+"""
+Hot-path instrumentation for the ANC control loop.
+
+``RunInstrumentation`` receives one record per block from the DSP thread:
+the ``perf_counter_ns`` timestamps taken between the stages of the control
+loop plus the controller's xrun counters. The record goes into a
+preallocated single-producer/single-consumer ring (no locks, no allocation),
+and a background thread drains the ring into log-spaced histograms.
+``snapshot()`` summarises them as a JSON-friendly dict.
+
+A controller without instrumentation takes no timestamps at all, so the cost
+when disabled is one ``is None`` check per stage.
+
+Stages (``STAGES``):
+
+``reference``  fetching (and decimating) the reference block
+``synthesis``  anti-noise and filtered-x computation, aux noise, interpolation
+``write``      handing the anti-noise to the output stream or ring
+``read``       waiting for and decimating the error block
+``update``     online path model, latency alignment and weight update
+
+``dsp`` is the sum of the compute stages (reference, synthesis, update). A
+block misses its deadline when ``dsp`` exceeds ``block_size / sample_rate``,
+i.e. when the computation alone could not keep up with the device clock. With
+a live reference microphone the reference stage is a capture wait and is
+left out of ``dsp``.
+"""
+
+import threading
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+STAGES = ("reference", "synthesis", "write", "read", "update")
+COMPUTE_STAGES = ("reference", "synthesis", "update")
+DEFAULT_RECORD_CAPACITY = 4096
+DEFAULT_AGGREGATE_INTERVAL = 0.25
+# Histogram bins: 10 per decade from 1 us to 10 s.
+HISTOGRAM_EDGES_US = np.logspace(0, 7, 71)
+SUMMARY_PERCENTILES = (50, 90, 99)
+
+_SERIES = STAGES + ("dsp", "block")
+# Record layout: frame, stage durations, dsp, block total, xrun counters.
+_N_FIELDS = 1 + len(_SERIES) + 3
+
+
+class RunInstrumentation:
+    """
+    Per-stage timing, deadline and xrun accounting for ``FxLMSANC.run()``.
+
+    Parameters
+    ----------
+    capacity:
+        Records held in the ring. When the aggregator falls this far behind,
+        new records are dropped and counted instead of blocking the DSP thread.
+    aggregate_interval:
+        Seconds between drains by the background thread.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_RECORD_CAPACITY,
+        aggregate_interval: float = DEFAULT_AGGREGATE_INTERVAL,
+    ):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.aggregate_interval = aggregate_interval
+        self._records = np.zeros((capacity, _N_FIELDS), dtype=np.int64)
+        self._write_count = 0
+        self._read_count = 0
+        self._row = np.zeros(_N_FIELDS, dtype=np.int64)
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._running = False
+        self._aggregate_lock = threading.Lock()
+        self.deadline_ns = 0
+        self.last_dsp_ns = 0
+        self._compute_indices = [STAGES.index(stage) for stage in COMPUTE_STAGES]
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear the histograms and counters."""
+        with self._aggregate_lock:
+            self._histograms = np.zeros((len(_SERIES), len(HISTOGRAM_EDGES_US) + 1), dtype=np.int64)
+            self._totals_ns = np.zeros(len(_SERIES), dtype=np.float64)
+            self._max_ns = np.zeros(len(_SERIES), dtype=np.int64)
+            self.blocks = 0
+            self.deadline_misses = 0
+            self.dropped_records = 0
+            self._xruns = np.zeros(3, dtype=np.int64)
+        self._read_count = self._write_count
+
+    def start(self, deadline_seconds: float, compute_stages: Sequence[str] = COMPUTE_STAGES) -> None:
+        """Reset and start the aggregator thread for a run with the given block deadline."""
+        self.stop()
+        self.reset()
+        self.deadline_ns = int(deadline_seconds * 1e9)
+        self._compute_indices = [STAGES.index(stage) for stage in compute_stages]
+        self._running = True
+        self._thread = threading.Thread(target=self._aggregate_loop, name="anc-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the aggregator thread after a final drain."""
+        if self._thread is None:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._drain()
+
+    def record(
+        self,
+        frame_index: int,
+        stamps: np.ndarray,
+        input_overflows: int = 0,
+        output_underflows: int = 0,
+        dropped_capture_blocks: int = 0,
+    ) -> bool:
+        """
+        Push one block (producer side, called from the DSP thread).
+
+        ``stamps`` is an int64 array of ``len(STAGES) + 1`` nanosecond
+        timestamps: before the first stage and after each stage. Returns
+        True if the block missed its deadline.
+        """
+        row = self._row
+        row[0] = frame_index
+        durations = row[1 : 1 + len(STAGES)]
+        np.subtract(stamps[1:], stamps[:-1], out=durations)
+        dsp = sum(int(durations[index]) for index in self._compute_indices)
+        row[1 + len(STAGES)] = dsp
+        self.last_dsp_ns = dsp
+        row[2 + len(STAGES)] = stamps[-1] - stamps[0]
+        row[-3:] = (input_overflows, output_underflows, dropped_capture_blocks)
+        missed = dsp > self.deadline_ns > 0
+
+        if self._write_count - self._read_count >= self.capacity:
+            self.dropped_records += 1
+        else:
+            self._records[self._write_count % self.capacity] = row
+            self._write_count += 1
+        return missed
+
+    def _aggregate_loop(self) -> None:
+        while self._running:
+            self._wake.wait(self.aggregate_interval)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self) -> None:
+        """Fold pending records into the histograms (consumer side)."""
+        with self._aggregate_lock:
+            end = self._write_count
+            start = self._read_count
+            if end == start:
+                return
+            indices = np.arange(start, end) % self.capacity
+            batch = self._records[indices]
+            self._read_count = end
+
+            series_ns = batch[:, 1 : 1 + len(_SERIES)]
+            bins = np.searchsorted(HISTOGRAM_EDGES_US, series_ns / 1e3, side="right")
+            for column in range(len(_SERIES)):
+                self._histograms[column] += np.bincount(
+                    bins[:, column], minlength=self._histograms.shape[1]
+                )
+            self._totals_ns += series_ns.sum(axis=0)
+            self._max_ns = np.maximum(self._max_ns, series_ns.max(axis=0))
+            self.blocks += len(batch)
+            if self.deadline_ns > 0:
+                self.deadline_misses += int(np.count_nonzero(series_ns[:, len(STAGES)] > self.deadline_ns))
+            self._xruns = batch[-1, -3:].copy()
+
+    def snapshot(self) -> Dict:
+        """
+        Summary of everything aggregated so far.
+
+        Percentiles are read from the histograms and are therefore upper bin
+        edges, accurate to one bin (about 26 %).
+        """
+        self._drain()
+        with self._aggregate_lock:
+            stages = {}
+            for column, name in enumerate(_SERIES):
+                counts = self._histograms[column]
+                total = int(counts.sum())
+                summary = {"count": total}
+                if total:
+                    cumulative = np.cumsum(counts) / total
+                    summary["mean_us"] = float(self._totals_ns[column] / total / 1e3)
+                    for q in SUMMARY_PERCENTILES:
+                        index = min(int(np.searchsorted(cumulative, q / 100.0)), len(HISTOGRAM_EDGES_US) - 1)
+                        summary[f"p{q}_us"] = float(HISTOGRAM_EDGES_US[index])
+                    summary["max_us"] = float(self._max_ns[column] / 1e3)
+                stages[name] = summary
+            return {
+                "blocks": self.blocks,
+                "deadline_us": self.deadline_ns / 1e3,
+                "deadline_misses": self.deadline_misses,
+                "dropped_records": self.dropped_records,
+                "input_overflows": int(self._xruns[0]),
+                "output_underflows": int(self._xruns[1]),
+                "dropped_capture_blocks": int(self._xruns[2]),
+                "stages": stages,
+            }
+
+    def histogram(self, stage: str) -> Dict:
+        """Raw histogram of one series: bin edges in microseconds and counts."""
+        column = _SERIES.index(stage)
+        self._drain()
+        with self._aggregate_lock:
+            return {
+                "edges_us": HISTOGRAM_EDGES_US.tolist(),
+                "counts": self._histograms[column].tolist(),
+            }
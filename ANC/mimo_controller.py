@@ -0,0 +1,430 @@
+"""
+Multi-channel (MIMO) FxLMS controller.
+
+Drives M control speakers from one noise reference so that the sum of squared
+errors at K error microphones is minimised. The speakers share one
+multi-channel output device and the error microphones are channels of one
+multi-channel input device, so all signals stay sample-aligned.
+
+Notation used throughout:
+
+``M``  number of control outputs (speakers)
+``K``  number of error microphones
+``L``  taps per control filter
+``S``  taps per secondary path
+
+The controller holds an (M, L) weight matrix and a (K, M, S) secondary-path
+matrix, one FIR per speaker/microphone pair. Per block it forms the (K, M, B, L)
+tensor of filtered references, where ``[k, m, i]`` is the reference filtered by
+the path from speaker ``m`` to microphone ``k`` as seen by tap vector ``i``.
+The weight update ``w[m] += mu * sum_k sum_i e[i, k] * fx[k, m, i]`` is then a
+single ``einsum`` for the whole room instead of nested loops over pairs.
+
+Streaming, latency compensation, callback I/O and the live reference mode are
+inherited from ``FxLMSANC``; the block engine with the (normalised) LMS rule is
+the only one supported.
+"""
+
+import argparse
+import logging
+import sys
+from collections import deque
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from audio_backend import AudioBackend
+from fxlms_controller import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_CALLBACK_BUFFER_BLOCKS,
+    DEFAULT_FILTER_LENGTH,
+    DEFAULT_IO_MODE,
+    IO_MODES,
+    NLMS_REGULARIZATION,
+    AncMetrics,
+    FxLMSANC,
+    SecondaryPathEstimator,
+    _history_windows,
+)
+from profile_switcher import AncProfile
+from session_recorder import RECORDING_FORMATS, SessionRecorder
+from weight_store import DEFAULT_NOISE_CLASS, WeightStore
+
+
+class MultichannelFxLMSANC(FxLMSANC):
+    """
+    Filtered-x LMS controller for several speakers and error microphones.
+
+    Parameters
+    ----------
+    reference_path:
+        WAV path for the prerecorded noise reference. Leave as None when
+        ``live_reference_channel`` is set.
+    n_outputs:
+        Number of control speakers M, i.e. channels of the control device.
+    error_channels:
+        Input channels of ``record_device_index`` carrying the K error
+        microphones.
+    secondary_path:
+        (K, M, S) array of FIR models, ``[k, m]`` being the path from speaker
+        ``m`` to error microphone ``k``. A 1-D array is used for every pair.
+        If omitted, a single-sample delta is used for every pair.
+
+    The remaining parameters are those of ``FxLMSANC``.
+    """
+
+    def __init__(
+        self,
+        reference_path: Optional[str],
+        n_outputs: int = 2,
+        error_channels: Sequence[int] = (0,),
+        secondary_path: Optional[np.ndarray] = None,
+        sample_rate: Optional[int] = None,
+        filter_length: int = DEFAULT_FILTER_LENGTH,
+        step_size: float = 5e-4,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        control_device_index: Optional[int] = None,
+        record_device_index: Optional[int] = None,
+        reference_device_index: Optional[int] = None,
+        play_reference: bool = False,
+        reference_channel: int = 0,
+        live_reference_channel: Optional[int] = None,
+        normalize_step: bool = True,
+        io_mode: str = DEFAULT_IO_MODE,
+        callback_buffer_blocks: int = DEFAULT_CALLBACK_BUFFER_BLOCKS,
+        latency_samples: Optional[int] = None,
+        audio_backend: Optional[AudioBackend] = None,
+        recorder: Optional[SessionRecorder] = None,
+        weight_store: Optional[WeightStore] = None,
+        noise_class: str = DEFAULT_NOISE_CLASS,
+    ):
+        error_channels = [int(channel) for channel in error_channels]
+        if n_outputs < 1:
+            raise ValueError("n_outputs must be at least 1")
+        if not error_channels or len(set(error_channels)) != len(error_channels):
+            raise ValueError("error_channels must be a non-empty list of distinct channels")
+        if live_reference_channel in error_channels:
+            raise ValueError("live_reference_channel must not be one of error_channels")
+        if play_reference and reference_device_index is None:
+            raise ValueError("play_reference needs a dedicated reference_device_index")
+
+        # Needed by the secondary_path setter during the base initialisation.
+        self.n_outputs = n_outputs
+        self.n_errors = len(error_channels)
+
+        super().__init__(
+            reference_path=reference_path,
+            sample_rate=sample_rate,
+            filter_length=filter_length,
+            step_size=step_size,
+            block_size=block_size,
+            control_device_index=control_device_index,
+            record_device_index=record_device_index,
+            reference_device_index=reference_device_index,
+            play_reference=play_reference,
+            reference_channel=reference_channel,
+            live_reference_channel=live_reference_channel,
+            error_channel=error_channels[0],
+            normalize_step=normalize_step,
+            engine="block",
+            io_mode=io_mode,
+            callback_buffer_blocks=callback_buffer_blocks,
+            latency_samples=latency_samples,
+            audio_backend=audio_backend,
+            recorder=recorder,
+            weight_store=weight_store,
+            noise_class=noise_class,
+        )
+
+        # Indexing the captured frames with a list yields (block_size, K) errors.
+        self.error_channel = error_channels
+        self.input_channels = max(error_channels + [live_reference_channel or 0]) + 1
+        self.output_channels = n_outputs
+        self._allocate_io_buffers()
+
+        if secondary_path is not None:
+            self.secondary_path = secondary_path
+            self._secondary_path_known = True
+        self._reset_state()
+
+    @property
+    def secondary_path(self) -> np.ndarray:
+        """(K, M, S) FIR estimates of the speaker→error mic paths."""
+        return self._secondary_path
+
+    @secondary_path.setter
+    def secondary_path(self, value: np.ndarray) -> None:
+        value = np.asarray(value, dtype=np.float32)
+        if value.ndim == 1:
+            value = np.broadcast_to(value, (self.n_errors, self.n_outputs, len(value)))
+        if value.ndim != 3 or value.shape[:2] != (self.n_errors, self.n_outputs):
+            raise ValueError(
+                f"secondary_path must have shape ({self.n_errors}, {self.n_outputs}, taps)"
+            )
+        self._secondary_path = np.array(value, dtype=np.float32)
+
+    def _reset_filter_state(self) -> None:
+        """Initialise the weight matrix and the per-pair history buffers."""
+        taps = self.secondary_path.shape[2]
+        self.weights = np.zeros((self.n_outputs, self.filter_length), dtype=np.float32)
+        self.ref_history = np.zeros(self.filter_length, dtype=np.float32)
+        self.sec_history = np.zeros(taps, dtype=np.float32)
+        self.fx_history = np.zeros(
+            (self.n_errors, self.n_outputs, self.filter_length), dtype=np.float32
+        )
+        self._fx_delay_line: deque = deque(maxlen=self.delay_blocks + 1)
+
+    def _synthesize_block(self, ref_block: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute the (block_size, M) anti-noise and the filtered-reference tensor.
+
+        Returns
+        -------
+        anti_noise_block:
+            Array of shape (block_size, M), one column per speaker.
+        fx_vectors:
+            Strided view of shape (K, M, block_size, filter_length).
+        """
+        ref_block = np.asarray(ref_block, dtype=np.float32)
+
+        ref_ext = np.concatenate([self.ref_history[::-1], ref_block])
+        ref_windows = _history_windows(ref_ext, self.filter_length)
+        anti_noise = ref_windows @ self.weights.T
+
+        sec_ext = np.concatenate([self.sec_history[::-1], ref_block])
+        sec_windows = _history_windows(sec_ext, len(self.sec_history))
+        filtered = np.einsum("is,kms->kmi", sec_windows, self.secondary_path)
+
+        fx_ext = np.concatenate([self.fx_history[..., ::-1], filtered], axis=-1)
+        fx_vectors = np.lib.stride_tricks.sliding_window_view(
+            fx_ext[..., 1:], self.filter_length, axis=-1
+        )[..., ::-1]
+
+        self.ref_history = ref_windows[-1].copy()
+        self.sec_history = sec_windows[-1].copy()
+        self.fx_history = fx_vectors[:, :, -1].copy()
+
+        return anti_noise.astype(np.float32, copy=False), fx_vectors
+
+    def _update_weights(self, error_block: np.ndarray, fx_vectors: np.ndarray) -> None:
+        """
+        Multi-channel LMS update for one block.
+
+        ``error_block`` has shape (block_size, K). With ``normalize_step`` each
+        sample's step is divided by the energy of all its filtered-reference
+        vectors, the multi-channel analogue of the NLMS normalisation.
+        """
+        error_block = np.asarray(error_block, dtype=np.float32)
+        if self.normalize_step:
+            energy = np.einsum("kmil,kmil->i", fx_vectors, fx_vectors)
+            taps = fx_vectors.shape[0] * fx_vectors.shape[1] * fx_vectors.shape[3]
+            steps = self.base_step_size / (energy + NLMS_REGULARIZATION * taps)
+        else:
+            steps = np.full(len(error_block), self.base_step_size, dtype=np.float32)
+        delta = np.einsum("kmil,ik->ml", fx_vectors, steps[:, None] * error_block)
+        self._apply_update(delta)
+
+    def apply_profile(self, profile: AncProfile, crossfade_seconds: float = 0.0) -> None:
+        """Switch filter length and step size; only the block engine is supported."""
+        if profile.engine != "block":
+            raise ValueError("MultichannelFxLMSANC profiles must use the 'block' engine")
+        super().apply_profile(profile, crossfade_seconds)
+
+    def _recording_channels(self) -> list:
+        """One recorded channel per speaker and per error microphone."""
+        return (
+            ["reference"]
+            + [f"anti_noise_{m}" for m in range(self.n_outputs)]
+            + [f"error_{k}" for k in range(self.n_errors)]
+        )
+
+    def _play_and_record(self, excitation: np.ndarray, output: int = 0) -> np.ndarray:
+        """Play ``excitation`` on speaker ``output`` and record the first error mic."""
+        self._open_streams()
+
+        n_samples = len(excitation)
+        recorded = np.zeros(n_samples, dtype=np.float32)
+        played = np.zeros((self.block_size, self.n_outputs), dtype=np.float32)
+
+        for ptr in range(0, n_samples, self.block_size):
+            block = excitation[ptr : ptr + self.block_size]
+            played[:] = 0.0
+            played[: len(block), output] = block
+            error_block = self._exchange_block(played)
+            if error_block is None:
+                raise RuntimeError("Measurement interrupted by stop()")
+            recorded[ptr : ptr + len(block)] = error_block[: len(block), 0]
+
+        return recorded
+
+    def measure_secondary_path(
+        self,
+        duration: float = 2.0,
+        excitation_level: float = 0.2,
+        fir_length: Optional[int] = None,
+        method: str = "wiener",
+    ) -> np.ndarray:
+        """
+        Estimate the (K, M, fir_length) secondary-path matrix.
+
+        Each speaker is excited with white noise in turn (``duration`` seconds
+        each) while the others stay silent, and the K error microphones feed
+        one ``SecondaryPathEstimator`` per pair. As in ``FxLMSANC``, the whole
+        blocks of compensated loop latency are removed first, and
+        ``fir_length`` defaults to a model that covers the remaining latency.
+        """
+        if method != "wiener":
+            raise ValueError("The multi-channel controller only supports method='wiener'")
+        fir_length = self._secondary_path_length(fir_length)
+
+        try:
+            self._open_streams()
+            n_blocks = -(-int(duration * self.sample_rate) // self.block_size)
+            paths = np.zeros((self.n_errors, self.n_outputs, fir_length), dtype=np.float32)
+            played = np.zeros((self.block_size, self.n_outputs), dtype=np.float32)
+
+            for output in range(self.n_outputs):
+                logging.info("Measuring secondary paths of speaker %d for %.2f s", output, duration)
+                estimators = [SecondaryPathEstimator(fir_length) for _ in range(self.n_errors)]
+                in_flight: deque = deque()
+                for index in range(n_blocks + self.delay_blocks):
+                    excitation = np.zeros(self.block_size, dtype=np.float32)
+                    if index < n_blocks:
+                        excitation[:] = np.random.uniform(-1.0, 1.0, size=self.block_size)
+                        excitation *= excitation_level
+                    played[:] = 0.0
+                    played[:, output] = excitation
+                    response = self._exchange_block(played)
+                    if response is None:
+                        raise RuntimeError("Measurement interrupted by stop()")
+
+                    in_flight.append(excitation)
+                    if len(in_flight) > self.delay_blocks:
+                        sent = in_flight.popleft()
+                        for k, estimator in enumerate(estimators):
+                            estimator.update(sent, response[:, k])
+                for k, estimator in enumerate(estimators):
+                    paths[k, output] = estimator.solve()
+        finally:
+            self._finish_measurement()
+
+        self.secondary_path = paths
+        self._secondary_path_known = True
+        self._reset_state()
+        logging.info("Secondary path matrix updated (shape %s)", paths.shape)
+        return self.secondary_path.copy()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run a multi-channel FxLMS ANC session.")
+    parser.add_argument(
+        "reference_path",
+        nargs="?",
+        help="Path to the reference WAV (omit with --live-reference-channel)",
+    )
+    parser.add_argument(
+        "--live-reference-channel",
+        type=int,
+        default=None,
+        help="Input channel of the record device carrying a reference microphone",
+    )
+    parser.add_argument("--outputs", type=int, default=2, help="Number of control speakers")
+    parser.add_argument(
+        "--error-channels",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="Input channels of the record device carrying the error microphones",
+    )
+    parser.add_argument("--sample-rate", type=int, default=None, help="Operating sample rate")
+    parser.add_argument("--filter-length", type=int, default=DEFAULT_FILTER_LENGTH)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--step-size", type=float, default=5e-4)
+    parser.add_argument("--control-device", type=int, default=None, help="Multi-channel output device")
+    parser.add_argument("--record-device", type=int, default=None, help="Multi-channel input device")
+    parser.add_argument("--io-mode", choices=IO_MODES, default=DEFAULT_IO_MODE)
+    parser.add_argument("--latency-samples", type=int, default=None)
+    parser.add_argument(
+        "--measure-latency",
+        action="store_true",
+        help="Measure the loop latency (speaker 0 to the first error mic) before running",
+    )
+    parser.add_argument(
+        "--measure-secondary-path",
+        action="store_true",
+        help="Measure every speaker/mic path before running",
+    )
+    parser.add_argument(
+        "--secondary-path-length",
+        type=int,
+        default=None,
+        help="Taps per measured path (default: covers the latency left after block compensation)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Optional run duration in seconds (loops reference)",
+    )
+    parser.add_argument(
+        "--record",
+        default=None,
+        help="Record the reference, anti-noise and error signals of the session to this file",
+    )
+    parser.add_argument(
+        "--record-format",
+        choices=RECORDING_FORMATS,
+        default="wav",
+        help="File format for --record",
+    )
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if (args.reference_path is None) == (args.live_reference_channel is None):
+        parser.error("provide either reference_path or --live-reference-channel")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    controller = MultichannelFxLMSANC(
+        reference_path=args.reference_path,
+        n_outputs=args.outputs,
+        error_channels=args.error_channels,
+        sample_rate=args.sample_rate,
+        live_reference_channel=args.live_reference_channel,
+        filter_length=args.filter_length,
+        block_size=args.block_size,
+        step_size=args.step_size,
+        control_device_index=args.control_device,
+        record_device_index=args.record_device,
+        io_mode=args.io_mode,
+        latency_samples=args.latency_samples,
+        recorder=SessionRecorder(args.record, format=args.record_format) if args.record else None,
+    )
+
+    if args.measure_latency:
+        controller.measure_loop_latency()
+    if args.measure_secondary_path:
+        controller.measure_secondary_path(fir_length=args.secondary_path_length)
+
+    def log_metrics(metrics: AncMetrics) -> None:
+        logging.info(
+            "frame=%05d error_rms=%.6f latency=%d",
+            metrics.frame_index,
+            metrics.error_rms,
+            metrics.latency_samples,
+        )
+
+    controller.run(
+        loop_reference=True if args.duration else False,
+        max_duration=args.duration,
+        metrics_callback=log_metrics,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Noise-class driven switching of controller profiles.
+
+A sound classifier labels the ambient noise; ``ProfileSwitcher`` turns those
+labels into profile changes of a running ``FxLMSANC`` without reopening its
+streams. A profile (``AncProfile``) fixes the engine (narrowband for tonal
+hum, a broadband engine otherwise), filter length and step size; its cached
+weights are the controller's ``weight_store`` entry for the profile's noise
+class, so a switch back to a known class resumes from converged weights.
+
+Labels arrive on the classifier's thread through ``observe``; the DSP thread
+asks ``poll`` at the start of every block whether to switch. Switching is
+bounded in three ways so that a hesitating classifier cannot make the
+controller thrash:
+
+``confirm_observations``
+    A new class must be reported this many times in a row, each with at
+    least ``min_confidence``.
+``min_dwell_seconds``
+    Minimum time between two switches.
+``max_switches`` per ``switch_window_seconds``
+    Hard budget; further switches are suppressed and counted.
+
+Times are stream times (blocks processed times block duration), so
+simulated sessions switch at the same blocks on every run. The controller
+cross-fades from the old to the new filter over ``crossfade_seconds``.
+
+``ClassifierFeed`` runs the classifier next to ``FxLMSANC.run()``: the DSP
+thread hands it the reference blocks (or it reads a microphone of its own),
+and its thread pushes them into e.g. classification_model's
+``StreamingClassifier(on_label=switcher.observe)``.
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MIN_CONFIDENCE = 0.3
+DEFAULT_CONFIRM_OBSERVATIONS = 3
+DEFAULT_MIN_DWELL_SECONDS = 5.0
+DEFAULT_MAX_SWITCHES = 6
+DEFAULT_SWITCH_WINDOW_SECONDS = 60.0
+DEFAULT_CROSSFADE_SECONDS = 0.25
+DEFAULT_FEED_CAPACITY_BLOCKS = 256
+DEFAULT_FEED_POLL_INTERVAL = 0.05
+
+
+@dataclass
+class AncProfile:
+    """
+    Controller settings for one noise class.
+
+    ``harmonics`` and ``fundamental_hz`` only matter for the narrowband
+    engine; None keeps the controller's current value. Without a
+    fundamental, a switch to narrowband spends the acquisition time silent.
+    """
+
+    name: str
+    engine: str
+    filter_length: int
+    step_size: float
+    harmonics: Optional[int] = None
+    fundamental_hz: Optional[float] = None
+
+
+class ProfileSwitcher:
+    """
+    Switching policy between ``AncProfile`` objects, keyed by noise class.
+
+    Parameters
+    ----------
+    profiles:
+        Available profiles; ``name`` is the noise class.
+    labels:
+        Optional mapping from classifier labels to profile names, e.g.
+        ``{"Vacuum cleaner": "vacuum"}``. Labels that are neither mapped nor
+        a profile name select ``fallback``, or are ignored without one.
+    fallback:
+        Profile for unrecognised labels.
+
+    The remaining parameters are described in the module docstring.
+    """
+
+    def __init__(
+        self,
+        profiles: Sequence[AncProfile],
+        labels: Optional[Dict[str, str]] = None,
+        fallback: Optional[str] = None,
+        min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+        confirm_observations: int = DEFAULT_CONFIRM_OBSERVATIONS,
+        min_dwell_seconds: float = DEFAULT_MIN_DWELL_SECONDS,
+        max_switches: int = DEFAULT_MAX_SWITCHES,
+        switch_window_seconds: float = DEFAULT_SWITCH_WINDOW_SECONDS,
+        crossfade_seconds: float = DEFAULT_CROSSFADE_SECONDS,
+    ):
+        self.profiles = {profile.name: profile for profile in profiles}
+        if not self.profiles:
+            raise ValueError("at least one profile is required")
+        self.labels = dict(labels or {})
+        unknown = {name for name in self.labels.values() if name not in self.profiles}
+        if fallback is not None and fallback not in self.profiles:
+            unknown.add(fallback)
+        if unknown:
+            raise ValueError(f"labels refer to unknown profiles {sorted(unknown)}")
+        if confirm_observations < 1 or max_switches < 0:
+            raise ValueError("confirm_observations must be >= 1 and max_switches >= 0")
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self.confirm_observations = confirm_observations
+        self.min_dwell_seconds = min_dwell_seconds
+        self.max_switches = max_switches
+        self.switch_window_seconds = switch_window_seconds
+        self.crossfade_seconds = crossfade_seconds
+        self.start(None)
+
+    @classmethod
+    def from_json(cls, path: str, **kwargs) -> "ProfileSwitcher":
+        """
+        Build a switcher from a JSON file.
+
+        The file holds ``{"profiles": [{...AncProfile fields...}], "labels":
+        {...}, "fallback": ...}`` plus any of the keyword parameters;
+        ``kwargs`` override the file.
+        """
+        with open(path) as handle:
+            config = json.load(handle)
+        profiles = [AncProfile(**profile) for profile in config.pop("profiles")]
+        config.update(kwargs)
+        return cls(profiles, **config)
+
+    def start(self, current: Optional[str]) -> None:
+        """Reset for a new session whose controller runs the ``current`` class."""
+        self.current = current
+        self.switches = 0
+        self.suppressed_switches = 0
+        self.history: List[Tuple[float, str]] = []
+        self._switch_times: Deque[float] = deque()
+        self._streak_name: Optional[str] = None
+        self._streak = 0
+        self._candidate: Optional[str] = None
+        self._last_suppressed: Optional[str] = None
+
+    def resolve(self, label: str) -> Optional[str]:
+        """Profile name for a classifier label (None if it has none)."""
+        if label in self.labels:
+            return self.labels[label]
+        if label in self.profiles:
+            return label
+        return self.fallback
+
+    def observe(self, label: str, confidence: float = 1.0) -> None:
+        """
+        Report one classification (classifier side).
+
+        Low-confidence and unmapped labels break the current streak.
+        """
+        name = self.resolve(label) if confidence >= self.min_confidence else None
+        if name is None or name != self._streak_name:
+            self._streak_name = name
+            self._streak = 0
+        if name is None:
+            return
+        self._streak += 1
+        if self._streak >= self.confirm_observations:
+            # A single reference store, read by ``poll`` on the DSP thread.
+            self._candidate = name
+
+    def poll(self, now: float) -> Optional[AncProfile]:
+        """
+        Profile to switch to at stream time ``now`` in seconds, or None (DSP side).
+
+        Returns a profile at most once per switch; the caller is expected to
+        apply it.
+        """
+        candidate = self._candidate
+        if candidate is None or candidate == self.current:
+            return None
+        if self.history and now - self.history[-1][0] < self.min_dwell_seconds:
+            return None
+        while self._switch_times and now - self._switch_times[0] >= self.switch_window_seconds:
+            self._switch_times.popleft()
+        if len(self._switch_times) >= self.max_switches:
+            if candidate != self._last_suppressed:
+                self.suppressed_switches += 1
+                self._last_suppressed = candidate
+            return None
+
+        self._switch_times.append(now)
+        self.history.append((now, candidate))
+        self.switches += 1
+        self.current = candidate
+        self._last_suppressed = None
+        return self.profiles[candidate]
+
+    def summary(self) -> Dict:
+        """Switch counts and history, JSON-friendly."""
+        return {
+            "current": self.current,
+            "switches": self.switches,
+            "suppressed_switches": self.suppressed_switches,
+            "history": [{"time": time, "profile": name} for time, name in self.history],
+            "profiles": [asdict(profile) for profile in self.profiles.values()],
+        }
+
+
+class ClassifierFeed:
+    """
+    Audio feed of a streaming classifier during ``FxLMSANC.run()``.
+
+    The classifier runs on the feed's own thread, never on the DSP thread.
+    By default the controller copies every reference block into a ring of
+    block slots (``push_block``, no locks or allocation); when the classifier
+    falls behind and the ring is full, blocks are dropped and counted. With
+    ``device_index`` the feed instead opens that input device through the
+    controller's audio backend and classifies what it captures.
+
+    Parameters
+    ----------
+    classifier:
+        Object whose ``push(samples)`` takes mono float32 blocks at the
+        controller's sample rate, e.g. ``StreamingClassifier`` with
+        ``input_rate`` set to it and ``on_label=switcher.observe``.
+    device_index:
+        Input device to classify instead of the reference blocks.
+    capacity_blocks:
+        Ring size in blocks.
+    poll_interval:
+        Seconds between passes of the feed thread over the ring.
+    """
+
+    def __init__(
+        self,
+        classifier,
+        device_index: Optional[int] = None,
+        capacity_blocks: int = DEFAULT_FEED_CAPACITY_BLOCKS,
+        poll_interval: float = DEFAULT_FEED_POLL_INTERVAL,
+    ):
+        if capacity_blocks < 2:
+            raise ValueError("capacity_blocks must be at least 2")
+        self.classifier = classifier
+        self.device_index = device_index
+        self.capacity_blocks = capacity_blocks
+        self.poll_interval = poll_interval
+        self.dropped_blocks = 0
+        self.blocks_classified = 0
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._wake = threading.Event()
+
+    def start(self, sample_rate: int, block_size: int, audio_backend=None) -> None:
+        """Allocate the ring and start the feed thread (the device stream opens there)."""
+        self.stop()
+        if self.device_index is not None and audio_backend is None:
+            raise ValueError("device_index needs the controller's audio_backend")
+        self.sample_rate = int(sample_rate)
+        self.block_size = int(block_size)
+        self._blocks = np.zeros((self.capacity_blocks, self.block_size), dtype=np.float32)
+        self._write_count = 0
+        self._read_count = 0
+        self.dropped_blocks = 0
+        self.blocks_classified = 0
+        self._running = True
+        target = self._device_loop if self.device_index is not None else self._ring_loop
+        self._thread = threading.Thread(
+            target=target, args=(audio_backend,), name="anc-classifier", daemon=True
+        )
+        self._thread.start()
+
+    def push_block(self, block: np.ndarray) -> bool:
+        """
+        Copy one reference block into the ring (producer side, DSP thread).
+
+        Returns False if the block was dropped. Ignored with ``device_index``.
+        """
+        if self.device_index is not None:
+            return True
+        if self._write_count - self._read_count >= self.capacity_blocks:
+            self.dropped_blocks += 1
+            return False
+        self._blocks[self._write_count % self.capacity_blocks] = block
+        # Publish only after the slot is complete.
+        self._write_count += 1
+        return True
+
+    def stop(self) -> None:
+        """Classify what is still queued and stop the feed thread."""
+        if self._thread is None:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+    def _drain(self) -> None:
+        while self._read_count < self._write_count:
+            self.classifier.push(self._blocks[self._read_count % self.capacity_blocks].copy())
+            self._read_count += 1
+            self.blocks_classified += 1
+
+    def _ring_loop(self, audio_backend) -> None:
+        try:
+            while self._running:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                self._drain()
+            self._drain()
+        except Exception:
+            logging.exception("Classifier failed; profiles will no longer switch")
+
+    def _device_loop(self, audio_backend) -> None:
+        stream = audio_backend.open_input(
+            channels=1,
+            rate=self.sample_rate,
+            frames_per_buffer=self.block_size,
+            device_index=self.device_index,
+        )
+        try:
+            while self._running:
+                samples, _ = stream.read(self.block_size)
+                self.classifier.push(samples)
+                self.blocks_classified += 1
+        except Exception:
+            logging.exception("Classifier failed; profiles will no longer switch")
+        finally:
+            stream.close()
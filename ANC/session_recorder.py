@@ -0,0 +1,351 @@
+"""
+Asynchronous recorder for ANC sessions.
+
+``SessionRecorder`` captures the reference, anti-noise and error signals of
+every block of ``FxLMSANC.run()`` together with its ``AncMetrics``, for
+offline step-size tuning and replay. The DSP thread only copies each block
+into a preallocated ring of block slots (no locks, no allocation, no I/O);
+a background writer thread polls the ring and does all file work. If the
+writer falls behind and the ring is full, blocks are dropped and counted,
+never waited for.
+
+Output files for ``path``:
+
+``path``
+    The signals. ``format="wav"`` writes a multichannel 32-bit float WAV, one
+    channel per signal, readable with ``WavReference`` (memory-mapped).
+    ``format="chunked"`` writes a compact binary file: a header, then one
+    chunk per block with int16 samples and a float32 scale per channel (half
+    the size of float WAV, ~90 dB dynamic range per block).
+``path.metrics.jsonl``
+    One JSON object of ``AncMetrics`` fields per recorded block.
+``path.json``
+    Session metadata: rate, block size, channel names, blocks written and
+    the frame indices of dropped blocks.
+
+Dropped blocks are written as silence so the signals stay time-aligned.
+``load_session`` reads either format back.
+"""
+
+import json
+import os
+import struct
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+RECORDING_FORMATS = ("wav", "chunked")
+DEFAULT_RECORDER_CAPACITY_BLOCKS = 256
+DEFAULT_RECORDER_POLL_INTERVAL = 0.05
+CHUNKED_MAGIC = b"ANCR"
+CHUNKED_VERSION = 1
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+
+
+class SessionRecorder:
+    """
+    Opt-in block recorder for ``FxLMSANC.run()``.
+
+    Parameters
+    ----------
+    path:
+        Output file for the signals; sidecars are written next to it.
+    format:
+        One of ``RECORDING_FORMATS``.
+    capacity_blocks:
+        Ring size in blocks. It bounds how long the disk may stall before
+        blocks are dropped.
+    poll_interval:
+        Seconds between writer passes over the ring.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: str = "wav",
+        capacity_blocks: int = DEFAULT_RECORDER_CAPACITY_BLOCKS,
+        poll_interval: float = DEFAULT_RECORDER_POLL_INTERVAL,
+    ):
+        if format not in RECORDING_FORMATS:
+            raise ValueError(f"Unknown format {format!r}. Choose one of {RECORDING_FORMATS}.")
+        if capacity_blocks < 2:
+            raise ValueError("capacity_blocks must be at least 2")
+        self.path = path
+        self.format = format
+        self.capacity_blocks = capacity_blocks
+        self.poll_interval = poll_interval
+        self.dropped_blocks = 0
+        self.blocks_written = 0
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._wake = threading.Event()
+
+    def start(
+        self,
+        sample_rate: int,
+        block_size: int,
+        channel_names: Sequence[str],
+        metric_names: Sequence[str] = (),
+    ) -> None:
+        """Allocate the ring, open the files and start the writer thread."""
+        self.stop()
+        self.sample_rate = int(sample_rate)
+        self.block_size = int(block_size)
+        self.channel_names = list(channel_names)
+        self.metric_names = list(metric_names)
+        n_channels = len(self.channel_names)
+
+        self._signals = np.zeros((self.capacity_blocks, self.block_size, n_channels), dtype=np.float32)
+        self._metrics = np.zeros((self.capacity_blocks, len(self.metric_names)), dtype=np.float64)
+        self._frames = np.zeros(self.capacity_blocks, dtype=np.int64)
+        self._has_metrics = np.zeros(self.capacity_blocks, dtype=bool)
+        self._write_count = 0
+        self._read_count = 0
+        self.dropped_blocks = 0
+        self.blocks_written = 0
+        self._dropped_frames: List[int] = []
+        self._next_frame: Optional[int] = None
+        self._last_frame = -1
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._signal_file = open(self.path, "wb")
+        self._metrics_file = open(self.path + ".metrics.jsonl", "w")
+        if self.format == "wav":
+            self._signal_file.write(_float_wav_header(self.sample_rate, n_channels, 0))
+        else:
+            self._signal_file.write(_chunked_header(self.sample_rate, self.block_size, self.channel_names))
+
+        self._running = True
+        self._thread = threading.Thread(target=self._writer_loop, name="anc-recorder", daemon=True)
+        self._thread.start()
+
+    def record_block(
+        self,
+        frame_index: int,
+        signals: Sequence[np.ndarray],
+        metrics: Optional[Sequence[float]] = None,
+    ) -> bool:
+        """
+        Copy one block into the ring (producer side, called from the DSP thread).
+
+        ``signals`` are (block_size,) or (block_size, n) arrays whose columns
+        fill ``channel_names`` in order. Returns False if the block was
+        dropped because the ring is full.
+        """
+        self._last_frame = frame_index
+        if self._write_count - self._read_count >= self.capacity_blocks:
+            self.dropped_blocks += 1
+            return False
+
+        slot = self._write_count % self.capacity_blocks
+        column = 0
+        for signal in signals:
+            signal = np.asarray(signal).reshape(self.block_size, -1)
+            width = signal.shape[1]
+            self._signals[slot, :, column : column + width] = signal
+            column += width
+        self._frames[slot] = frame_index
+        self._has_metrics[slot] = metrics is not None
+        if metrics is not None:
+            self._metrics[slot] = metrics
+        # Publish only after the slot is complete.
+        self._write_count += 1
+        return True
+
+    def stop(self) -> None:
+        """Flush everything queued, close the files and write the metadata."""
+        if self._thread is None:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._flush()
+        if self._next_frame is not None:
+            # Blocks dropped after the last written one.
+            self._pad(self._last_frame + 1)
+
+        if self.format == "wav":
+            # Patch the RIFF and data sizes now that the length is known.
+            data_size = self._signal_file.tell() - len(_float_wav_header(1, 1, 0))
+            self._signal_file.seek(0)
+            self._signal_file.write(
+                _float_wav_header(self.sample_rate, len(self.channel_names), data_size)
+            )
+        self._signal_file.close()
+        self._metrics_file.close()
+
+        metadata = {
+            "format": self.format,
+            "sample_rate": self.sample_rate,
+            "block_size": self.block_size,
+            "channels": self.channel_names,
+            "metrics": self.metric_names,
+            "blocks_written": self.blocks_written,
+            "dropped_blocks": self.dropped_blocks,
+            "dropped_frames": self._dropped_frames,
+        }
+        with open(self.path + ".json", "w") as handle:
+            json.dump(metadata, handle, indent=2)
+
+    def _writer_loop(self) -> None:
+        while self._running:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write every published slot (consumer side)."""
+        end = self._write_count
+        while self._read_count < end:
+            slot = self._read_count % self.capacity_blocks
+            frame_index = int(self._frames[slot])
+            if self._next_frame is not None:
+                self._pad(frame_index)
+            self._write_signals(frame_index, self._signals[slot])
+            if self._has_metrics[slot]:
+                values = dict(zip(self.metric_names, self._metrics[slot].tolist()))
+                self._metrics_file.write(json.dumps(values) + "\n")
+            self._next_frame = frame_index + 1
+            self.blocks_written += 1
+            self._read_count += 1
+        self._signal_file.flush()
+        self._metrics_file.flush()
+
+    def _pad(self, frame_index: int) -> None:
+        """Account for the blocks dropped before ``frame_index``, keeping the signals aligned."""
+        missing = range(self._next_frame, frame_index)
+        self._dropped_frames.extend(missing)
+        for _ in missing:
+            self._write_signals(None, None)
+        self._next_frame = max(self._next_frame, frame_index)
+
+    def _write_signals(self, frame_index: Optional[int], block: Optional[np.ndarray]) -> None:
+        n_channels = len(self.channel_names)
+        if block is None:
+            block = np.zeros((self.block_size, n_channels), dtype=np.float32)
+        if self.format == "wav":
+            self._signal_file.write(block.astype("<f4").tobytes())
+            return
+        if frame_index is None:
+            # The chunked format records frame indices, so gaps need no padding.
+            return
+        peak = np.max(np.abs(block), axis=0)
+        scale = np.where(peak > 0, peak / 32767.0, 1.0).astype("<f4")
+        quantized = np.round(block / scale).astype("<i2")
+        self._signal_file.write(struct.pack("<QI", frame_index, self.block_size))
+        self._signal_file.write(scale.tobytes())
+        self._signal_file.write(quantized.tobytes())
+
+
+def _float_wav_header(sample_rate: int, channels: int, data_size: int) -> bytes:
+    """RIFF header of a 32-bit IEEE float WAV with ``data_size`` bytes of samples."""
+    block_align = 4 * channels
+    fmt = struct.pack(
+        "<HHIIHH", _WAVE_FORMAT_IEEE_FLOAT, channels, sample_rate, sample_rate * block_align, block_align, 32
+    )
+    return (
+        struct.pack("<4sI4s", b"RIFF", 4 + 8 + len(fmt) + 8 + data_size, b"WAVE")
+        + struct.pack("<4sI", b"fmt ", len(fmt))
+        + fmt
+        + struct.pack("<4sI", b"data", data_size)
+    )
+
+
+def _chunked_header(sample_rate: int, block_size: int, channel_names: Sequence[str]) -> bytes:
+    names = b"".join(
+        struct.pack("<H", len(name.encode())) + name.encode() for name in channel_names
+    )
+    return (
+        CHUNKED_MAGIC
+        + struct.pack("<HHII", CHUNKED_VERSION, len(channel_names), sample_rate, block_size)
+        + names
+    )
+
+
+@dataclass
+class SessionRecording:
+    """A recorded session as returned by ``load_session``."""
+
+    sample_rate: int
+    block_size: int
+    channels: Dict[str, np.ndarray]
+    metrics: List[Dict[str, float]] = field(default_factory=list)
+    dropped_frames: List[int] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.channels.values()))) if self.channels else 0
+
+
+def load_session(path: str) -> SessionRecording:
+    """
+    Read a recording made by ``SessionRecorder``.
+
+    WAV recordings are memory-mapped (each channel is a ``WavReference``);
+    chunked recordings are decoded into float32 arrays with dropped blocks
+    filled with silence.
+    """
+    with open(path + ".json") as handle:
+        metadata = json.load(handle)
+    metrics = []
+    metrics_path = path + ".metrics.jsonl"
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as handle:
+            metrics = [json.loads(line) for line in handle if line.strip()]
+
+    if metadata["format"] == "wav":
+        # Imported here: fxlms_controller imports this module.
+        from fxlms_controller import WavReference
+
+        channels = {
+            name: WavReference(path, channel=index) for index, name in enumerate(metadata["channels"])
+        }
+    else:
+        channels = _read_chunked(path)
+
+    return SessionRecording(
+        sample_rate=metadata["sample_rate"],
+        block_size=metadata["block_size"],
+        channels=channels,
+        metrics=metrics,
+        dropped_frames=metadata.get("dropped_frames", []),
+    )
+
+
+def _read_chunked(path: str) -> Dict[str, np.ndarray]:
+    with open(path, "rb") as handle:
+        data = handle.read()
+    if data[:4] != CHUNKED_MAGIC:
+        raise ValueError(f"Not a chunked ANC recording: {path}")
+    version, n_channels, _, block_size = struct.unpack_from("<HHII", data, 4)
+    if version != CHUNKED_VERSION:
+        raise ValueError(f"Unsupported chunked recording version {version}")
+    offset = 4 + 12
+    names = []
+    for _ in range(n_channels):
+        (length,) = struct.unpack_from("<H", data, offset)
+        names.append(data[offset + 2 : offset + 2 + length].decode())
+        offset += 2 + length
+
+    blocks = {}
+    while offset < len(data):
+        frame_index, frames = struct.unpack_from("<QI", data, offset)
+        offset += 12
+        scale = np.frombuffer(data, dtype="<f4", count=n_channels, offset=offset)
+        offset += 4 * n_channels
+        samples = np.frombuffer(data, dtype="<i2", count=frames * n_channels, offset=offset)
+        offset += 2 * frames * n_channels
+        blocks[frame_index] = samples.reshape(frames, n_channels) * scale
+
+    if not blocks:
+        signals = np.zeros((0, n_channels), dtype=np.float32)
+    else:
+        first = min(blocks)
+        signals = np.zeros(((max(blocks) - first + 1) * block_size, n_channels), dtype=np.float32)
+        for frame_index, block in blocks.items():
+            start = (frame_index - first) * block_size
+            signals[start : start + len(block)] = block
+    return {name: signals[:, index] for index, name in enumerate(names)}
@@ -0,0 +1,359 @@
+"""
+Offline replay of recorded ANC sessions and parameter sweeps.
+
+A ``SessionRecorder`` recording holds the reference, the anti-noise that was
+played and the resulting error. Given a model of the plant (the secondary
+path the anti-noise travelled through), the disturbance the error microphone
+heard without control is recovered as
+
+    d = e - s * a        (``a`` delayed by ``delay_samples``)
+
+``prepare_replay`` writes the reference and ``d`` into a two-channel float
+WAV. ``replay`` then runs a controller against a ``SimulatedRoom`` whose
+source is ``d`` and whose secondary path is the plant, with the reference
+read from the same file, so any configuration can be evaluated on the
+recorded noise. The blocking simulated backend has no clock and no sensor
+noise here, so a replay is bit-reproducible.
+
+``sweep`` replays every combination of ``step_size``, ``filter_length``,
+``block_size`` and ``normalize_step`` in a process pool, one configuration
+per task. Workers open the prepared file memory-mapped, so the recording is
+shared through the page cache instead of being copied to each process.
+
+Each result reports:
+
+``steady_state_attenuation_db``
+    ``10 log10(sum d**2 / sum e**2)`` over the last ``STEADY_STATE_FRACTION``
+    of the replay.
+``convergence_seconds``
+    Time after which the attenuation, smoothed over
+    ``CONVERGENCE_WINDOW_SECONDS``, stays within ``CONVERGENCE_TOLERANCE_DB``
+    of the steady state. None if the configuration does not attenuate.
+
+Run it as ``python fxlms_controller.py replay ...`` or ``python session_replay.py ...``.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from audio_backend import SimulatedBackend, SimulatedRoom, _BlockConvolver
+from fxlms_controller import (
+    DEFAULT_BLOCK_SIZE,
+    ENGINES,
+    FX_CACHE_CHUNK,
+    LATENCY_GUARD_SAMPLES,
+    UPDATE_RULES,
+    FxLMSANC,
+    WavReference,
+)
+from session_recorder import _float_wav_header, load_session
+
+STEADY_STATE_FRACTION = 0.2
+CONVERGENCE_WINDOW_SECONDS = 0.1
+CONVERGENCE_TOLERANCE_DB = 3.0
+# Prepared replay file layout.
+REPLAY_REFERENCE_CHANNEL = 0
+REPLAY_DISTURBANCE_CHANNEL = 1
+NORMALIZE_MODES = {"on": (True,), "off": (False,), "both": (True, False)}
+
+
+def prepare_replay(
+    recording_path: str,
+    output_path: str,
+    plant_path: np.ndarray,
+    delay_samples: int = 0,
+) -> None:
+    """
+    Write the reference and the reconstructed disturbance of a recording.
+
+    Parameters
+    ----------
+    recording_path:
+        Single-channel recording made by ``SessionRecorder``.
+    output_path:
+        Two-channel 32-bit float WAV to create (reference, disturbance).
+    plant_path:
+        FIR from the anti-noise output to the error microphone, 1-D.
+    delay_samples:
+        Output-to-input latency not already contained in ``plant_path``.
+    """
+    session = load_session(recording_path)
+    missing = [name for name in ("reference", "anti_noise", "error") if name not in session.channels]
+    if missing:
+        raise ValueError(f"Recording lacks channel(s) {missing}; only single-channel sessions replay")
+    plant_path = np.asarray(plant_path, dtype=np.float64)
+    if plant_path.ndim != 1:
+        raise ValueError("plant_path must be a 1-D array")
+    if delay_samples < 0:
+        raise ValueError("delay_samples must be non-negative")
+    if session.dropped_frames:
+        logging.warning(
+            "Recording has %d dropped block(s); the disturbance is wrong there",
+            len(session.dropped_frames),
+        )
+
+    reference = session.channels["reference"]
+    anti_noise = session.channels["anti_noise"]
+    error = session.channels["error"]
+    n_samples = len(error)
+    convolver = _BlockConvolver(plant_path[None, None, :])
+    # The speaker output starts after ``delay_samples`` of silence.
+    pending = np.zeros(delay_samples)
+
+    with open(output_path, "wb") as handle:
+        handle.write(_float_wav_header(session.sample_rate, 2, n_samples * 8))
+        for start in range(0, n_samples, FX_CACHE_CHUNK):
+            stop = min(start + FX_CACHE_CHUNK, n_samples)
+            # The controller clips the anti-noise before writing it.
+            played = np.clip(np.asarray(anti_noise[start:stop], dtype=np.float64), -1.0, 1.0)
+            delayed = np.concatenate([pending, played])
+            pending = delayed[stop - start :]
+            secondary = convolver.process(delayed[: stop - start, None])[:, 0]
+            frames = np.empty((stop - start, 2), dtype="<f4")
+            frames[:, REPLAY_REFERENCE_CHANNEL] = reference[start:stop]
+            frames[:, REPLAY_DISTURBANCE_CHANNEL] = np.asarray(error[start:stop]) - secondary
+            handle.write(frames.tobytes())
+
+
+def replay(
+    replay_path: str,
+    plant_path: np.ndarray,
+    delay_samples: int = 0,
+    return_trace: bool = False,
+    **controller_kwargs,
+) -> Dict:
+    """
+    Run one controller configuration over a prepared replay file.
+
+    ``controller_kwargs`` are passed to ``FxLMSANC``. Unless given there,
+    ``latency_samples`` defaults to ``delay_samples``, ``secondary_path`` to
+    the plant preceded by the part of the delay that whole-block latency
+    compensation leaves over, and ``aux_noise_seed`` to 0, so the run is
+    reproducible. With ``return_trace`` the result also holds the per-block
+    error and disturbance RMS.
+    """
+    plant_path = np.asarray(plant_path, dtype=np.float64)
+    controller_kwargs.setdefault("latency_samples", delay_samples)
+    if "secondary_path" not in controller_kwargs:
+        if controller_kwargs.get("decimation", 1) > 1:
+            raise ValueError("Pass secondary_path at the reduced rate when replaying with decimation")
+        block_size = controller_kwargs.get("block_size", DEFAULT_BLOCK_SIZE)
+        latency = controller_kwargs["latency_samples"]
+        compensated = max(0, latency - LATENCY_GUARD_SAMPLES) // block_size * block_size
+        residual = max(0, delay_samples - compensated)
+        controller_kwargs["secondary_path"] = np.concatenate([np.zeros(residual), plant_path])
+    controller_kwargs.setdefault("aux_noise_seed", 0)
+    disturbance = WavReference(replay_path, channel=REPLAY_DISTURBANCE_CHANNEL)
+    room = SimulatedRoom(
+        np.ones(1), plant_path, source=disturbance, loop_source=False, delay_samples=delay_samples
+    )
+    controller = FxLMSANC(
+        replay_path,
+        reference_channel=REPLAY_REFERENCE_CHANNEL,
+        audio_backend=SimulatedBackend(room),
+        **controller_kwargs,
+    )
+
+    error_rms: List[float] = []
+    controller.run(metrics_callback=lambda metrics: error_rms.append(metrics.error_rms))
+
+    block_size = controller.block_size
+    n_blocks = len(error_rms)
+    padded = np.zeros(n_blocks * block_size, dtype=np.float64)
+    available = min(len(disturbance), len(padded))
+    padded[:available] = disturbance[:available]
+    disturbance_power = np.mean(padded.reshape(n_blocks, block_size) ** 2, axis=1)
+    error_power = np.asarray(error_rms, dtype=np.float64) ** 2
+
+    result = dict(
+        config=_describe(controller_kwargs),
+        blocks=n_blocks,
+        **summarize_attenuation(disturbance_power, error_power, block_size / controller.sample_rate),
+    )
+    if return_trace:
+        result["error_rms"] = error_rms
+        result["disturbance_rms"] = np.sqrt(disturbance_power).tolist()
+    return result
+
+
+def summarize_attenuation(
+    disturbance_power: np.ndarray, error_power: np.ndarray, block_seconds: float
+) -> Dict:
+    """Steady-state attenuation and convergence time from per-block powers."""
+    n_blocks = len(error_power)
+    if n_blocks == 0:
+        return {"steady_state_attenuation_db": None, "convergence_seconds": None}
+    tail = max(1, int(n_blocks * STEADY_STATE_FRACTION))
+    steady = 10.0 * np.log10(
+        (disturbance_power[-tail:].sum() + 1e-20) / (error_power[-tail:].sum() + 1e-20)
+    )
+
+    window = max(1, int(round(CONVERGENCE_WINDOW_SECONDS / block_seconds)))
+    kernel = np.ones(window)
+    smoothed = 10.0 * np.log10(
+        (np.convolve(disturbance_power, kernel)[:n_blocks] + 1e-20)
+        / (np.convolve(error_power, kernel)[:n_blocks] + 1e-20)
+    )
+    convergence = None
+    if steady > 0.0:
+        below = np.flatnonzero(smoothed < steady - CONVERGENCE_TOLERANCE_DB)
+        convergence = (int(below[-1]) + 1 if len(below) else 0) * block_seconds
+
+    return {
+        "steady_state_attenuation_db": float(steady),
+        "convergence_seconds": convergence,
+        "final_error_rms": float(np.sqrt(error_power[-tail:].mean())),
+    }
+
+
+def _describe(controller_kwargs: Dict) -> Dict:
+    """JSON-friendly copy of a configuration (arrays are left out)."""
+    return {
+        key: value
+        for key, value in controller_kwargs.items()
+        if not isinstance(value, np.ndarray) and key != "aux_noise_seed"
+    }
+
+
+def _replay_job(job) -> Dict:
+    replay_path, plant_path, delay_samples, config = job
+    try:
+        return replay(replay_path, plant_path, delay_samples, **config)
+    except ValueError as exc:
+        return {"config": _describe(config), "skipped": str(exc)}
+
+
+def sweep(
+    replay_path: str,
+    plant_path: np.ndarray,
+    delay_samples: int = 0,
+    step_sizes: Iterable[float] = (5e-4,),
+    filter_lengths: Iterable[int] = (128,),
+    block_sizes: Iterable[int] = (128,),
+    normalize_modes: Iterable[bool] = (True,),
+    workers: Optional[int] = None,
+    **controller_kwargs,
+) -> List[Dict]:
+    """
+    Replay every combination of the swept parameters, one per pool task.
+
+    ``controller_kwargs`` apply to all configurations. Combinations the
+    controller rejects are listed with the reason. Results keep the sweep
+    order, whatever the number of workers.
+    """
+    jobs = []
+    grid = itertools.product(step_sizes, filter_lengths, block_sizes, normalize_modes)
+    for step_size, filter_length, block_size, normalize_step in grid:
+        config = dict(
+            controller_kwargs,
+            step_size=step_size,
+            filter_length=filter_length,
+            block_size=block_size,
+            normalize_step=normalize_step,
+        )
+        jobs.append((replay_path, plant_path, delay_samples, config))
+
+    if workers == 1:
+        return [_replay_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_replay_job, jobs))
+
+
+def build_replay_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="fxlms_controller.py replay",
+        description="Replay a recorded ANC session offline and sweep controller parameters.",
+    )
+    parser.add_argument("recording", help="Session recorded with --record")
+    parser.add_argument(
+        "--plant-path",
+        default=None,
+        help="1-D .npy FIR from the anti-noise output to the error mic (default: delta)",
+    )
+    parser.add_argument(
+        "--delay-samples",
+        type=int,
+        default=0,
+        help="Output-to-input latency not contained in the plant path",
+    )
+    parser.add_argument(
+        "--secondary-path",
+        default=None,
+        help="1-D .npy secondary-path model for the controller (default: derived from the plant path)",
+    )
+    parser.add_argument("--step-sizes", type=float, nargs="+", default=[5e-4], help="Step sizes to sweep")
+    parser.add_argument(
+        "--filter-lengths", type=int, nargs="+", default=[128], help="Filter lengths to sweep"
+    )
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[128], help="Block sizes to sweep")
+    parser.add_argument(
+        "--normalize",
+        choices=sorted(NORMALIZE_MODES),
+        default="on",
+        help="NLMS normalisation: on, off, or both to sweep it",
+    )
+    parser.add_argument("--engine", choices=ENGINES, default="block", help="Controller engine for all runs")
+    parser.add_argument(
+        "--update-rule", choices=UPDATE_RULES, default="lms", help="Weight update rule for all runs"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all CPUs)")
+    parser.add_argument(
+        "--replay-file",
+        default=None,
+        help="Keep the prepared reference/disturbance WAV here (default: temporary)",
+    )
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_replay_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    plant_path = np.load(args.plant_path) if args.plant_path else np.ones(1)
+    controller_kwargs = {"engine": args.engine, "update_rule": args.update_rule}
+    if args.secondary_path:
+        controller_kwargs["secondary_path"] = np.load(args.secondary_path)
+
+    with tempfile.TemporaryDirectory(prefix="anc-replay-") as workdir:
+        replay_path = args.replay_file or os.path.join(workdir, "replay.wav")
+        prepare_replay(args.recording, replay_path, plant_path, args.delay_samples)
+        results = sweep(
+            replay_path,
+            plant_path,
+            args.delay_samples,
+            step_sizes=args.step_sizes,
+            filter_lengths=args.filter_lengths,
+            block_sizes=args.block_sizes,
+            normalize_modes=NORMALIZE_MODES[args.normalize],
+            workers=args.workers,
+            **controller_kwargs,
+        )
+
+    ranked = [result for result in results if result.get("steady_state_attenuation_db") is not None]
+    report = {
+        "recording": args.recording,
+        "results": results,
+        "best": max(ranked, key=lambda result: result["steady_state_attenuation_db"], default=None),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(text + "\n")
+        logging.info("Replay report written to %s", args.output)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Shared fixtures for the ANC tests; the modules are imported flat, as the scripts do.
+
+classification_model is on the path too, for the classifier that drives the profiles.
+"""
+
+import os
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+ANC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ANC_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(ANC_DIR), "classification_model"))
+
+SAMPLE_RATE = 16_000
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    """Write a mono 16-bit WAV file."""
+    with wave.open(str(path), "wb") as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(sample_rate)
+        handle.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return str(path)
+
+
+@pytest.fixture
+def tonal_reference(tmp_path):
+    """Two seconds of a 100 Hz + 180 Hz hum with a little broadband noise."""
+    t = np.arange(2 * SAMPLE_RATE) / SAMPLE_RATE
+    noise = np.random.default_rng(0).standard_normal(len(t))
+    samples = 0.3 * np.sin(2 * np.pi * 100 * t) + 0.1 * np.sin(2 * np.pi * 180 * t) + 0.01 * noise
+    return write_wav(tmp_path / "reference.wav", samples)
+
+
+@pytest.fixture
+def noise_reference(tmp_path):
+    """One second of white noise."""
+    samples = np.random.default_rng(1).uniform(-0.5, 0.5, SAMPLE_RATE)
+    return write_wav(tmp_path / "noise.wav", samples)
+
+
+@pytest.fixture
+def paths():
+    """Primary and secondary impulse responses of a small simulated room."""
+    primary = np.zeros(32)
+    primary[5], primary[9] = 0.8, 0.3
+    secondary = np.zeros(24)
+    secondary[3], secondary[6] = 0.6, 0.25
+    return primary, secondary
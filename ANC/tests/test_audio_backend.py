@@ -0,0 +1,77 @@
+import types
+
+import numpy as np
+import pytest
+
+import audio_backend
+from audio_backend import AudioBackend, SimulatedRoom, _PyAudioInputStream
+
+
+# PortAudio's error codes, so the tests need no PyAudio install.
+_PA_CODES = types.SimpleNamespace(paInputOverflowed=-9981, paTimedOut=-9987)
+
+
+class _FakeStream:
+    """PyAudio blocking input stream that fails its reads with ``error``."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.reads = []
+
+    def read(self, frames, exception_on_overflow=True):
+        self.reads.append(exception_on_overflow)
+        if self.error is not None:
+            raise IOError(self.error, "stream error")
+        return np.full(frames, 16384, dtype=np.int16).tobytes()
+
+
+def test_input_overflow_comes_from_portaudio(monkeypatch):
+    monkeypatch.setattr(audio_backend, "pyaudio", _PA_CODES)
+
+    stream = _FakeStream()
+    samples, overflowed = _PyAudioInputStream(stream, 2).read(128)
+    assert not overflowed
+    assert stream.reads == [True]
+    assert np.allclose(samples, 0.5)
+
+    # The overflowed block is lost in PyAudio; one silent block takes its place.
+    stream = _FakeStream(_PA_CODES.paInputOverflowed)
+    samples, overflowed = _PyAudioInputStream(stream, 2).read(128)
+    assert overflowed
+    assert stream.reads == [True]
+    assert samples.shape == (256,) and not samples.any()
+
+    with pytest.raises(IOError):
+        _PyAudioInputStream(_FakeStream(_PA_CODES.paTimedOut), 2).read(128)
+
+
+def test_backends_must_open_both_stream_kinds():
+    class OutputOnly(AudioBackend):
+        def open_output(self, *args, **kwargs):
+            return None
+
+    with pytest.raises(TypeError):
+        AudioBackend()
+    with pytest.raises(TypeError):
+        OutputOnly()
+
+
+@pytest.mark.parametrize("delay", [100, 200])
+def test_room_latency_survives_underruns(delay):
+    room = SimulatedRoom(np.ones(1), np.ones(1), source=None, delay_samples=delay)
+    impulse = np.zeros(128)
+    impulse[0] = 0.5
+
+    def heard_after_write():
+        written = room.clock
+        room.play_control(impulse)
+        captured = np.concatenate([room.capture(128, 1) for _ in range(4)])
+        return room.clock - len(captured) + int(np.argmax(captured)) - written
+
+    # Read first, as live mode does, so the queue runs down before the write.
+    room.capture(128, 1)
+    assert heard_after_write() == delay
+    # Nothing written for a while; a delay below the block underruns every read.
+    for _ in range(5):
+        room.capture(128, 1)
+    assert heard_after_write() == delay
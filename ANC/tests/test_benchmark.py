@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+
+import fxlms_controller
+from audio_backend import SimulatedBackend, SimulatedRoom
+from benchmark import _process_blocks, run_benchmark
+from fxlms_controller import FxLMSANC
+
+SWEEP = dict(filter_lengths=[32], block_sizes=[64], n_blocks=5, warmup_blocks=1)
+
+
+def test_sweep_measures_each_combination_and_skips_rejected_ones():
+    report = run_benchmark(engines=["block", "frequency"], update_rules=["lms", "rls"], **SWEEP)
+    results = {(r["config"]["engine"], r["config"]["update_rule"]): r for r in report["results"]}
+    assert sorted(results) == [("block", "lms"), ("block", "rls"), ("frequency", "lms"), ("frequency", "rls")]
+
+    skipped = results["frequency", "rls"]
+    assert "update_rule='rls'" in skipped["skipped"]
+    assert "samples_per_second" not in skipped
+
+    for key in [("block", "lms"), ("block", "rls"), ("frequency", "lms")]:
+        result = results[key]
+        assert result["blocks"] == 5
+        assert result["samples_per_second"] > 0 and result["real_time_factor"] > 0
+        assert result["block_deadline_us"] == 64 / 16_000 * 1e6
+        assert set(result["block_latency_us"]) == {"p50", "p90", "p99", "max"}
+        assert result["peak_memory_bytes"] > 0
+    assert report["environment"]["numpy"] == np.__version__
+
+
+def test_benchmark_runs_the_controllers_dsp_step(noise_reference):
+    controller = FxLMSANC(
+        noise_reference,
+        engine="block",
+        filter_length=32,
+        step_size=1e-2,
+        latency_samples=0,
+        audio_backend=SimulatedBackend(SimulatedRoom(np.ones(1), np.ones(1))),
+    )
+    durations = _process_blocks(controller, 10)
+    assert len(durations) == 10 and np.all(durations > 0)
+    assert controller.frame_index == 10
+    # The synthetic error (a scaled reference) drives the real update.
+    assert np.any(controller.weights != 0)
+
+
+def test_bench_subcommand_writes_the_report(tmp_path):
+    output = tmp_path / "bench.json"
+    argv = ["bench", "--filter-lengths", "32", "--block-sizes", "64", "--engines", "loop"]
+    argv += ["--blocks", "3", "--warmup-blocks", "0", "--output", str(output)]
+    assert fxlms_controller.main(argv) == 0
+    report = json.loads(output.read_text())
+    assert [r["config"]["engine"] for r in report["results"]] == ["loop"]
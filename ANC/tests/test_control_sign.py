@@ -0,0 +1,65 @@
+import wave
+
+import numpy as np
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import FxLMSANC
+
+SAMPLE_RATE = 16_000
+
+
+def _reference(tmp_path):
+    samples = np.random.default_rng(0).uniform(-0.5, 0.5, SAMPLE_RATE)
+    path = str(tmp_path / "noise.wav")
+    with wave.open(path, "wb") as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(SAMPLE_RATE)
+        handle.writeframes((samples * 32767).astype("<i2").tobytes())
+    return path
+
+
+def _controller(reference, secondary, step_size):
+    primary = np.zeros(16)
+    primary[4] = 0.5
+    # The controller plays the reference into the room, so the disturbance
+    # and the filter see the same samples.
+    room = SimulatedRoom(primary, secondary, delay_samples=0)
+    return FxLMSANC(
+        reference,
+        reference_device_index=1,
+        play_reference=True,
+        filter_length=16,
+        block_size=64,
+        step_size=step_size,
+        secondary_path=secondary,
+        latency_samples=0,
+        audio_backend=SimulatedBackend(room),
+    )
+
+
+def test_speaker_plays_the_negated_filter_output(tmp_path):
+    # With s = delta and w = the primary path, y equals the disturbance; playing
+    # -y cancels it exactly, playing +y would double it.
+    secondary = np.zeros(8)
+    secondary[0] = 1.0
+    controller = _controller(_reference(tmp_path), secondary, 0.0)
+    reset_state = controller._reset_state
+
+    def warm_start():
+        reset_state()
+        controller.weights[4] = 0.5
+
+    controller._reset_state = warm_start
+    errors = []
+    controller.run(max_blocks=20, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert max(errors) < 1e-3
+
+
+def test_update_descends_the_error_surface(tmp_path):
+    secondary = np.zeros(8)
+    secondary[2], secondary[5] = 0.6, 0.25
+    controller = _controller(_reference(tmp_path), secondary, 0.005)
+    errors = []
+    controller.run(max_blocks=200, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert np.mean(errors[-20:]) < 0.1 * np.mean(errors[:5])
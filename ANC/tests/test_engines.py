@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import BLOCK_ENGINE_ATOL, BLOCK_ENGINE_RTOL, UPDATE_RULES, FxLMSANC, WavReference
+from weight_store import WeightStore
+
+FILTER_LENGTH = 64
+BLOCK_SIZE = 64
+TOLERANCE = {"rtol": BLOCK_ENGINE_RTOL, "atol": BLOCK_ENGINE_ATOL}
+
+
+def _session(reference, paths, engine, step_size, max_blocks, weights=None, store_dir=None, **kwargs):
+    """Run a controller on the simulated room; returns (error rms per block, final weights)."""
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(reference), delay_samples=0)
+    store = None
+    if weights is not None:
+        # Warm start, so that a zero step still produces anti-noise.
+        store = WeightStore(str(store_dir))
+        store.save("default", "default", "default", weights, secondary, 16_000, "fir", 0)
+    controller = FxLMSANC(
+        reference,
+        engine=engine,
+        filter_length=FILTER_LENGTH,
+        block_size=BLOCK_SIZE,
+        step_size=step_size,
+        secondary_path=secondary,
+        latency_samples=0,
+        weight_store=store,
+        audio_backend=SimulatedBackend(room),
+        **kwargs,
+    )
+    errors = []
+    controller.run(max_blocks=max_blocks, metrics_callback=lambda m: errors.append(m.error_rms))
+    return np.array(errors), controller.weights.copy()
+
+
+@pytest.mark.parametrize("fx_cache", [False, True])
+@pytest.mark.parametrize("engine", ["block", "frequency"])
+def test_engines_filter_like_the_loop_engine(tonal_reference, paths, tmp_path, engine, fx_cache):
+    weights = 0.05 * np.random.default_rng(3).standard_normal(FILTER_LENGTH).astype(np.float32)
+    expected, _ = _session(tonal_reference, paths, "loop", 0.0, 30, weights, tmp_path / "loop")
+    errors, _ = _session(
+        tonal_reference, paths, engine, 0.0, 30, weights, tmp_path / engine, fx_cache=fx_cache
+    )
+    np.testing.assert_allclose(errors, expected, **TOLERANCE)
+
+
+@pytest.mark.parametrize("fx_cache", [False, True])
+def test_block_engine_adapts_like_the_loop_engine(tonal_reference, paths, fx_cache):
+    expected_errors, expected_weights = _session(tonal_reference, paths, "loop", 1e-3, 40)
+    errors, weights = _session(tonal_reference, paths, "block", 1e-3, 40, fx_cache=fx_cache)
+    np.testing.assert_allclose(errors, expected_errors, **TOLERANCE)
+    np.testing.assert_allclose(weights, expected_weights, **TOLERANCE)
+
+
+def test_loop_engine_fx_cache_matches_direct_filtering(tonal_reference, paths):
+    expected_errors, expected_weights = _session(tonal_reference, paths, "loop", 1e-3, 20)
+    errors, weights = _session(tonal_reference, paths, "loop", 1e-3, 20, fx_cache=True)
+    np.testing.assert_allclose(errors, expected_errors, **TOLERANCE)
+    np.testing.assert_allclose(weights, expected_weights, **TOLERANCE)
+
+
+@pytest.mark.parametrize(
+    "update_rule, step_size, kwargs",
+    [
+        ("lms", 5e-3, {}),
+        ("apa", 0.05, {"projection_order": 4}),
+        ("rls", 0.0, {"rls_forgetting": 0.999}),
+    ],
+)
+def test_update_rules_converge_in_closed_loop(tonal_reference, paths, update_rule, step_size, kwargs):
+    assert update_rule in UPDATE_RULES
+    errors, weights = _session(
+        tonal_reference, paths, "block", step_size, 400, update_rule=update_rule, **kwargs
+    )
+    assert np.all(np.isfinite(weights))
+    assert np.mean(errors[-50:]) < 0.1 * np.mean(errors[:5])
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import FxLMSANC, WavReference
+from instrumentation import STAGES, RunInstrumentation
+
+
+def _stamps(stage_us):
+    """Timestamps (ns) before the first stage and after each of ``STAGES``."""
+    return np.concatenate([[0], np.cumsum(np.array(stage_us) * 1000)]).astype(np.int64)
+
+
+def test_deadline_counts_only_the_compute_stages():
+    probe = RunInstrumentation()
+    probe.deadline_ns = 1_000_000  # 1 ms, set as start() would, without the thread
+    # reference, synthesis, write, read, update in microseconds.
+    assert not probe.record(0, _stamps([100, 300, 50, 5000, 200]), 0, 0, 0)
+    assert probe.last_dsp_ns == 600_000
+    assert probe.record(1, _stamps([100, 800, 10, 10, 200]), 1, 2, 3)
+
+    summary = probe.snapshot()
+    assert summary["blocks"] == 2
+    assert summary["deadline_misses"] == 1
+    # Counters are cumulative in the controller; the last record holds them.
+    xruns = [summary[key] for key in ("input_overflows", "output_underflows", "dropped_capture_blocks")]
+    assert xruns == [1, 2, 3]
+    read = summary["stages"]["read"]
+    assert read["count"] == 2
+    assert read["mean_us"] == pytest.approx(2505.0)
+    assert read["max_us"] == pytest.approx(5000.0)
+    # Percentiles are upper bin edges, within one bin (26 %) of the value.
+    assert 5000.0 <= read["p99_us"] <= 5000.0 * 1.26
+    assert summary["stages"]["dsp"]["max_us"] == pytest.approx(1100.0)
+    assert summary["stages"]["block"]["max_us"] == pytest.approx(5650.0)
+    assert sum(probe.histogram("synthesis")["counts"]) == 2
+
+
+def test_full_ring_drops_records_instead_of_blocking():
+    probe = RunInstrumentation(capacity=2)
+    for frame in range(3):
+        probe.record(frame, _stamps([1] * len(STAGES)))
+    assert probe.dropped_records == 1
+    assert probe.snapshot()["blocks"] == 2
+    # Drained, so there is room again.
+    probe.record(3, _stamps([1] * len(STAGES)))
+    assert probe.snapshot()["blocks"] == 3
+
+
+def test_controller_records_every_block(tonal_reference, paths):
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        secondary_path=secondary,
+        latency_samples=0,
+        instrumentation=RunInstrumentation(aggregate_interval=0.01),
+        audio_backend=SimulatedBackend(room),
+    )
+    dsp_times = []
+    controller.run(max_blocks=50, metrics_callback=lambda m: dsp_times.append(m.dsp_time))
+
+    summary = controller.instrumentation.snapshot()
+    assert summary["blocks"] == 50
+    assert summary["deadline_us"] == pytest.approx(128 / 16_000 * 1e6)
+    assert all(summary["stages"][stage]["count"] == 50 for stage in STAGES)
+    assert all(time > 0 for time in dsp_times)
+    assert summary["stages"]["dsp"]["max_us"] <= summary["stages"]["block"]["max_us"]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import FxLMSANC, WavReference
+from mimo_controller import MultichannelFxLMSANC
+
+
+@pytest.mark.parametrize("method", ["wiener", "lstsq"])
+def test_live_mode_measures_the_path_that_run_sees(tonal_reference, paths, method):
+    primary, secondary = paths
+    # The reference microphone (input channel 1) hears the noise source directly.
+    room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), reference_channel=1)
+    controller = FxLMSANC(
+        None,
+        live_reference_channel=1,
+        error_channel=0,
+        engine="block",
+        filter_length=128,
+        step_size=3e-3,
+        audio_backend=SimulatedBackend(room),
+    )
+    np.random.seed(0)
+    controller.measure_loop_latency()
+    # Captured before the write, so a response is at least a block late.
+    assert controller.latency_samples >= controller.block_size
+    assert controller.delay_blocks == 1
+
+    model = controller.measure_secondary_path(duration=1.0, method=method)
+    # The latency runs up to the main tap, so that tap lands on the residual.
+    assert np.argmax(np.abs(model)) == controller.uncompensated_latency
+    assert np.abs(model).max() == pytest.approx(secondary.max(), abs=0.05)
+
+    errors = []
+    controller.run(max_blocks=400, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert np.mean(errors[-50:]) < 0.1 * np.mean(errors[:10])
+
+
+def test_multichannel_live_mode_measures_latency_in_run_order(tonal_reference, paths):
+    primary, secondary = paths
+    room = SimulatedRoom(
+        primary, secondary, source=WavReference(tonal_reference), error_channels=(0, 1), reference_channel=2
+    )
+    controller = MultichannelFxLMSANC(
+        None,
+        n_outputs=1,
+        error_channels=(0, 1),
+        live_reference_channel=2,
+        audio_backend=SimulatedBackend(room),
+    )
+    controller.measure_loop_latency()
+    # One block for the capture before the write, then the path's main tap.
+    assert controller.latency_samples == controller.block_size + np.argmax(secondary)
+    assert controller.delay_blocks == 1
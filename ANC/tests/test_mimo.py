@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import BLOCK_ENGINE_ATOL, BLOCK_ENGINE_RTOL, FxLMSANC, WavReference
+from mimo_controller import MultichannelFxLMSANC
+from profile_switcher import AncProfile
+
+
+@pytest.fixture
+def room_paths():
+    """Primary paths to two error mics and the 2x2 secondary-path matrix."""
+    primary = np.zeros((2, 32))
+    primary[0, 5], primary[0, 9] = 0.8, 0.3
+    primary[1, 7], primary[1, 12] = 0.6, 0.4
+    secondary = np.zeros((2, 2, 24))
+    secondary[0, 0, 3], secondary[0, 1, 5] = 0.6, 0.3
+    secondary[1, 0, 6], secondary[1, 1, 2] = 0.25, 0.5
+    return primary, secondary
+
+
+def test_two_speakers_cancel_at_two_mics(tonal_reference, room_paths):
+    np.random.seed(0)
+    primary, secondary = room_paths
+    # The noise comes from a reference speaker (output device 2), so the
+    # measurement runs in silence.
+    room = SimulatedRoom(primary, secondary, source=None, error_channels=(0, 1), delay_samples=0)
+    controller = MultichannelFxLMSANC(
+        tonal_reference,
+        n_outputs=2,
+        error_channels=(0, 1),
+        filter_length=64,
+        step_size=5e-3,
+        latency_samples=0,
+        play_reference=True,
+        reference_device_index=2,
+        audio_backend=SimulatedBackend(room),
+    )
+
+    model = controller.measure_secondary_path(duration=1.0)
+    assert model.shape == (2, 2, 64)
+    np.testing.assert_allclose(model[:, :, :24], secondary, atol=0.01)
+
+    errors = []
+    controller.run(loop_reference=True, max_blocks=400, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert controller.weights.shape == (2, 64)
+    assert np.mean(errors[-50:]) < 0.15 * np.mean(errors[:10])
+
+
+def test_one_by_one_matches_the_single_channel_block_engine(tonal_reference, paths):
+    primary, secondary = paths
+
+    def session(controller_class, **kwargs):
+        room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+        controller = controller_class(
+            tonal_reference,
+            filter_length=64,
+            step_size=1e-3,
+            secondary_path=secondary,
+            latency_samples=0,
+            audio_backend=SimulatedBackend(room),
+            **kwargs,
+        )
+        errors = []
+        controller.run(max_blocks=60, metrics_callback=lambda m: errors.append(m.error_rms))
+        return np.array(errors), controller.weights
+
+    expected_errors, expected_weights = session(FxLMSANC, engine="block")
+    errors, weights = session(MultichannelFxLMSANC, n_outputs=1, error_channels=(0,))
+    np.testing.assert_allclose(errors, expected_errors, rtol=BLOCK_ENGINE_RTOL, atol=BLOCK_ENGINE_ATOL)
+    np.testing.assert_allclose(weights[0], expected_weights, rtol=BLOCK_ENGINE_RTOL, atol=BLOCK_ENGINE_ATOL)
+
+
+def test_invalid_configurations_are_rejected(tonal_reference, room_paths):
+    _, secondary = room_paths
+    backend = SimulatedBackend(SimulatedRoom(np.ones(1), np.ones(1), error_channels=(0, 1)))
+    with pytest.raises(ValueError, match="distinct"):
+        MultichannelFxLMSANC(tonal_reference, error_channels=(0, 0), audio_backend=backend)
+    with pytest.raises(ValueError, match="shape"):
+        MultichannelFxLMSANC(
+            tonal_reference,
+            n_outputs=3,
+            error_channels=(0, 1),
+            secondary_path=secondary,
+            audio_backend=backend,
+        )
+    controller = MultichannelFxLMSANC(tonal_reference, error_channels=(0, 1), audio_backend=backend)
+    with pytest.raises(ValueError, match="block"):
+        controller.apply_profile(AncProfile(name="hum", engine="narrowband", filter_length=8, step_size=1e-3))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import FxLMSANC, _PolyphaseDecimator, _PolyphaseInterpolator
+
+RATE = 16_000
+FACTOR = 4
+
+
+def _amplitude(signal):
+    return np.sqrt(2.0 * np.mean(signal**2))
+
+
+@pytest.mark.parametrize("frequency, gain", [(100, 1.0), (250, 1.0), (3000, 0.0), (3500, 0.0)])
+def test_decimator_keeps_the_band_and_rejects_aliases(frequency, gain):
+    tone = np.sin(2 * np.pi * frequency * np.arange(RATE) / RATE).astype(np.float32)
+    decimator = _PolyphaseDecimator(FACTOR)
+    out = np.concatenate([decimator.process(tone[i : i + 128]) for i in range(0, RATE, 128)])
+    assert len(out) == RATE // FACTOR
+    # Past the filter's start-up; 3 kHz and up would alias into the ANC band.
+    assert _amplitude(out[200:]) == pytest.approx(gain, abs=1e-3)
+
+
+def test_interpolator_restores_the_rate_without_images():
+    low_rate = RATE // FACTOR
+    tone = np.sin(2 * np.pi * 100 * np.arange(low_rate) / low_rate).astype(np.float32)
+    interpolator = _PolyphaseInterpolator(FACTOR)
+    out = np.concatenate([interpolator.process(tone[i : i + 32]) for i in range(0, low_rate, 32)])
+    assert len(out) == RATE
+    assert _amplitude(out[1000:]) == pytest.approx(1.0, abs=1e-3)
+
+    spectrum = np.abs(np.fft.rfft(out[4000:] * np.hanning(len(out) - 4000)))
+    frequencies = np.fft.rfftfreq(len(out) - 4000, 1.0 / RATE)
+    # The images at 3.9 kHz, 4.1 kHz, ... are gone.
+    assert spectrum[frequencies > 2000].max() < 1e-3 * spectrum.max()
+
+
+def test_decimated_controller_cancels_at_the_reduced_rate(tonal_reference, paths):
+    np.random.seed(0)
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=None, delay_samples=0)
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        decimation=FACTOR,
+        filter_length=32,
+        step_size=2e-2,
+        latency_samples=0,
+        play_reference=True,
+        reference_device_index=1,
+        audio_backend=SimulatedBackend(room),
+    )
+    assert controller.control_rate == RATE / FACTOR
+    assert controller.control_block_size == controller.block_size // FACTOR
+
+    # The model is identified through the resampling filters, at the reduced
+    # rate: each of the two delays by half its length, about 8 samples here.
+    model = controller.measure_secondary_path(duration=1.0)
+    resampling_delay = len(_PolyphaseDecimator(FACTOR).taps) // FACTOR
+    assert resampling_delay <= np.argmax(np.abs(model)) <= resampling_delay + 2
+
+    errors = []
+    controller.run(loop_reference=True, max_blocks=400, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert np.mean(errors[-50:]) < 0.1 * np.mean(errors[:10])
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from conftest import SAMPLE_RATE, write_wav
+from fxlms_controller import NARROWBAND_ACQUISITION_SECONDS, FxLMSANC, WavReference
+
+HUM_HZ = 60.0
+
+
+@pytest.fixture
+def hum_reference(tmp_path):
+    """Three seconds of a 60 Hz hum with its second and third harmonic."""
+    t = np.arange(3 * SAMPLE_RATE) / SAMPLE_RATE
+    noise = np.random.default_rng(0).standard_normal(len(t))
+    samples = (
+        0.3 * np.sin(2 * np.pi * HUM_HZ * t)
+        + 0.15 * np.sin(2 * np.pi * 2 * HUM_HZ * t + 0.5)
+        + 0.05 * np.sin(2 * np.pi * 3 * HUM_HZ * t + 1.0)
+        + 0.005 * noise
+    )
+    return write_wav(tmp_path / "hum.wav", samples)
+
+
+def _session(reference, paths, fundamental_hz):
+    """Run the narrowband engine; returns (error rms, tracked fundamental) per block."""
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(reference), delay_samples=0)
+    controller = FxLMSANC(
+        reference,
+        engine="narrowband",
+        harmonics=3,
+        fundamental_hz=fundamental_hz,
+        step_size=5e-3,
+        secondary_path=secondary,
+        latency_samples=0,
+        audio_backend=SimulatedBackend(room),
+    )
+    errors, frequencies = [], []
+
+    def collect(metrics):
+        errors.append(metrics.error_rms)
+        frequencies.append(controller.tracked_frequency)
+
+    controller.run(max_blocks=300, metrics_callback=collect)
+    assert controller.weights.shape == (6,)
+    return np.array(errors), frequencies
+
+
+def test_fundamental_is_acquired_before_cancelling(hum_reference, paths):
+    errors, frequencies = _session(hum_reference, paths, fundamental_hz=None)
+    acquisition_blocks = int(NARROWBAND_ACQUISITION_SECONDS * SAMPLE_RATE) // 128
+    # Silent while collecting the reference, then locked onto the hum.
+    assert frequencies[acquisition_blocks - 2] is None
+    assert frequencies[acquisition_blocks] == pytest.approx(HUM_HZ, abs=0.5)
+    half = acquisition_blocks // 2
+    assert np.mean(errors[half : 2 * half]) == pytest.approx(np.mean(errors[:half]), rel=0.05)
+    assert np.mean(errors[-50:]) < 0.05 * np.mean(errors[:10])
+
+
+def test_drifted_fundamental_is_tracked(hum_reference, paths):
+    errors, frequencies = _session(hum_reference, paths, fundamental_hz=HUM_HZ + 1.0)
+    assert frequencies[0] == HUM_HZ + 1.0
+    assert frequencies[-1] == pytest.approx(HUM_HZ, abs=0.5)
+    assert np.mean(errors[-50:]) < 0.05 * np.mean(errors[:10])
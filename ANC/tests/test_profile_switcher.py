@@ -0,0 +1,234 @@
+import time
+
+import numpy as np
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import FxLMSANC, WavReference
+from profile_switcher import AncProfile, ClassifierFeed, ProfileSwitcher
+from streaming_classifier import WINDOW_SAMPLES, StreamingClassifier
+from weight_store import WeightStore
+
+PROFILES = [
+    AncProfile(name="vacuum", engine="block", filter_length=64, step_size=1e-3),
+    AncProfile(name="fridge", engine="block", filter_length=32, step_size=5e-3),
+]
+
+
+def test_switch_needs_a_confident_streak():
+    switcher = ProfileSwitcher(PROFILES, labels={"Hum": "fridge"}, min_dwell_seconds=0.0)
+    switcher.start("vacuum")
+    switcher.observe("Hum")
+    switcher.observe("Hum")
+    switcher.observe("Speech")  # unmapped without a fallback: breaks the streak
+    switcher.observe("Hum")
+    switcher.observe("Hum", confidence=0.1)  # below min_confidence: breaks it too
+    assert switcher.poll(1.0) is None
+    for _ in range(3):
+        switcher.observe("Hum")
+    assert switcher.poll(2.0) is PROFILES[1]
+    # Reported once; the controller now runs it.
+    assert switcher.poll(2.1) is None
+
+
+def test_dwell_time_between_switches():
+    switcher = ProfileSwitcher(PROFILES, confirm_observations=1, min_dwell_seconds=5.0)
+    switcher.start("vacuum")
+    switcher.observe("fridge")
+    assert switcher.poll(0.0).name == "fridge"
+    switcher.observe("vacuum")
+    assert switcher.poll(4.9) is None
+    assert switcher.poll(5.0).name == "vacuum"
+
+
+def test_switch_budget_suppresses_thrashing():
+    switcher = ProfileSwitcher(
+        PROFILES, confirm_observations=1, min_dwell_seconds=0.0, max_switches=2, switch_window_seconds=10.0
+    )
+    switcher.start("vacuum")
+    for now, name in enumerate(["fridge", "vacuum", "fridge"]):
+        switcher.observe(name)
+        switcher.poll(float(now))
+    assert switcher.current == "vacuum"
+    assert (switcher.switches, switcher.suppressed_switches) == (2, 1)
+    # Polling the same candidate again is not another suppression.
+    assert switcher.poll(3.0) is None
+    assert switcher.suppressed_switches == 1
+    # Once the first switch leaves the window, the budget frees up.
+    assert switcher.poll(10.0).name == "fridge"
+    assert [name for _, name in switcher.history] == ["fridge", "vacuum", "fridge"]
+
+
+def test_switch_crossfades_from_a_copy_of_the_old_filter(tonal_reference, paths, tmp_path):
+    primary, secondary = paths
+    store = WeightStore(str(tmp_path))
+    fridge_path = np.array([0.0, 0.0, 0.5, 0.2], dtype=np.float32)
+    store.save(
+        "default", "default", "fridge",
+        weights=np.zeros(32, dtype=np.float32),
+        secondary_path=fridge_path,
+        control_rate=16_000,
+        engine_kind="fir",
+        compensated_latency=0,
+    )
+    room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        filter_length=64,
+        secondary_path=secondary,
+        latency_samples=0,
+        online_secondary_path=True,
+        weight_store=store,
+        audio_backend=SimulatedBackend(room),
+        noise_class="vacuum",
+    )
+    controller.run(loop_reference=True, max_blocks=50)
+    weights = controller.weights.copy()
+    ref_history = controller.ref_history.copy()
+    old_path = controller.secondary_path
+
+    controller.apply_profile(PROFILES[1], crossfade_seconds=0.05)
+
+    # The online model restarts from the path stored for the new class.
+    np.testing.assert_array_equal(controller._online_path, fridge_path)
+    assert not controller._aux_history.any() and len(controller._aux_history) == len(fridge_path)
+
+    shadow = controller._crossfade[0]
+    np.testing.assert_array_equal(shadow.weights, weights)
+    assert shadow.secondary_path is old_path
+    assert not {"_input_stream", "weight_store", "profile_switcher"} & set(vars(shadow))
+    controller.ref_history[:] = 0.0
+    silence = np.zeros(controller.block_size, np.float32)
+    controller._crossfade_block(silence, controller.reference_signal[: controller.block_size])
+    # The frozen filter advanced its own history, not the controller's.
+    assert not controller.ref_history.any()
+    assert not np.array_equal(shadow.ref_history, ref_history)
+
+
+class _HumClassifier:
+    """Stands in for a streaming classifier: every ``window`` samples are a hum."""
+
+    def __init__(self, on_label, window):
+        self.on_label = on_label
+        self.window = window
+        self._pending = 0
+
+    def push(self, samples):
+        self._pending += len(samples)
+        while self._pending >= self.window:
+            self._pending -= self.window
+            self.on_label("Hum", 0.9)
+
+
+class _HumModel:
+    """Stands in for YAMNet: every window is a hum."""
+
+    def __call__(self, waveform):
+        return np.array([[0.9, 0.1]], dtype=np.float32), None, None
+
+
+def test_classifier_labels_switch_the_running_controller(tonal_reference, paths):
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+    switcher = ProfileSwitcher(PROFILES, labels={"Hum": "fridge"}, min_dwell_seconds=0.0)
+    classifier = _HumClassifier(switcher.observe, window=4000)
+    feed = ClassifierFeed(classifier, poll_interval=0.001)
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        filter_length=64,
+        secondary_path=secondary,
+        latency_samples=0,
+        audio_backend=SimulatedBackend(room),
+        noise_class="vacuum",
+        profile_switcher=switcher,
+        classifier_feed=feed,
+    )
+
+    def wait_for_classifier(metrics):
+        # The simulated loop outruns real time; keep the classifier in step.
+        while feed.blocks_classified <= metrics.frame_index:
+            time.sleep(0.0005)
+
+    controller.run(loop_reference=True, max_blocks=200, metrics_callback=wait_for_classifier)
+
+    assert [name for _, name in switcher.history] == ["fridge"]
+    assert controller.noise_class == "fridge"
+    assert controller.filter_length == 32
+    # Three confirming labels, one per window.
+    switch_time = switcher.history[0][0]
+    third_window = 3 * classifier.window / 16_000
+    assert third_window <= switch_time <= third_window + 2 * controller.block_size / 16_000
+    assert feed.dropped_blocks == 0
+
+
+def test_streaming_classifier_drives_the_switcher(tonal_reference, paths):
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+    switcher = ProfileSwitcher(PROFILES, labels={"Hum": "fridge"}, min_dwell_seconds=0.0)
+    classifier = StreamingClassifier(
+        _HumModel(), ["Hum", "Vacuum cleaner"], input_rate=16_000, on_label=switcher.observe
+    )
+    feed = ClassifierFeed(classifier, poll_interval=0.001)
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        filter_length=64,
+        secondary_path=secondary,
+        latency_samples=0,
+        audio_backend=SimulatedBackend(room),
+        noise_class="vacuum",
+        profile_switcher=switcher,
+        classifier_feed=feed,
+    )
+
+    def wait_for_classifier(metrics):
+        while feed.blocks_classified <= metrics.frame_index:
+            time.sleep(0.0005)
+
+    controller.run(loop_reference=True, max_blocks=400, metrics_callback=wait_for_classifier)
+
+    assert [name for _, name in switcher.history] == ["fridge"]
+    # Three confirming windows: the first after WINDOW_SAMPLES, then one per hop.
+    switch_time = switcher.history[0][0]
+    third_window = (WINDOW_SAMPLES + 2 * classifier.hop) / 16_000
+    assert third_window <= switch_time <= third_window + 2 * controller.block_size / 16_000
+    assert feed.dropped_blocks == 0
+
+
+class _LevelModel:
+    """Stands in for YAMNet: a loud window is a hum, a quiet one silence."""
+
+    def __call__(self, waveform):
+        hum = float(np.sqrt(np.mean(waveform**2)) > 0.05)
+        return np.array([[hum, 1.0 - hum]], dtype=np.float32), None, None
+
+
+def test_gated_classifier_confirms_a_steady_noise_at_the_hop_rate():
+    from energy_gate import LowFrequencyGate
+
+    rate = 16_000
+    t = np.arange(9 * rate) / rate
+    audio = 0.001 * np.random.default_rng(2).standard_normal(len(t))
+    # Back-to-back windows, the hum starting exactly with the fourth one.
+    onset = 3 * WINDOW_SAMPLES
+    audio[onset:] += 0.3 * np.sin(2 * np.pi * 100 * t[onset:])
+
+    switcher = ProfileSwitcher(PROFILES, labels={"Hum": "fridge"}, min_dwell_seconds=0.0)
+    switcher.start("vacuum")
+    classifier = StreamingClassifier(
+        _LevelModel(),
+        ["Hum", "Silence"],
+        hop_seconds=WINDOW_SAMPLES / rate,
+        smoothing=1.0,
+        on_label=switcher.observe,
+        gate=LowFrequencyGate(),
+    )
+    for start in range(0, len(audio), 1024):
+        classifier.push(audio[start : start + 1024].astype(np.float32))
+
+    # Only the onset window of the hum is classified. The skipped windows
+    # after it repeat its label, so the switch does not wait up to
+    # max_skip_seconds for a gate refresh.
+    assert classifier.stats()["gate_reasons"] == {"onset": 1, "change": 0, "refresh": 1}
+    assert switcher.poll(len(audio) / rate) is PROFILES[1]
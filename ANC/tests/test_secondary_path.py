@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import SECONDARY_PATH_TAIL_TAPS, FxLMSANC
+
+
+def _controller(reference, secondary, delay, **kwargs):
+    # The noise comes from a reference speaker, so measurements run in silence.
+    room = SimulatedRoom(np.ones(1), secondary, source=None, delay_samples=delay)
+    return FxLMSANC(
+        reference,
+        engine="block",
+        play_reference=True,
+        reference_device_index=1,
+        latency_samples=delay,
+        audio_backend=SimulatedBackend(room),
+        **kwargs,
+    )
+
+
+def test_model_covers_latency_left_after_block_compensation(tonal_reference, paths):
+    _, secondary = paths
+    # 133 samples at block 128 leave no whole block to compensate.
+    controller = _controller(tonal_reference, secondary, 133, step_size=1e-3)
+    assert controller.delay_blocks == 0
+    assert controller.uncompensated_latency == 133
+
+    with pytest.raises(ValueError, match="uncompensated latency"):
+        controller.measure_secondary_path(duration=0.5, fir_length=64)
+
+    model = controller.measure_secondary_path(duration=1.0)
+    assert len(model) == 133 + SECONDARY_PATH_TAIL_TAPS
+    assert np.argmax(np.abs(model)) == 133 + np.argmax(np.abs(secondary))
+
+    errors = []
+    controller.run(loop_reference=True, max_blocks=400, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert np.mean(errors[-50:]) < 0.25 * np.mean(errors[:10])
+
+
+def test_cli_secondary_path_length(tonal_reference):
+    from fxlms_controller import main
+
+    common = [tonal_reference, "--simulate", "--sim-delay", "133", "--latency-samples", "133",
+              "--measure-secondary-path", "--max-blocks", "5"]
+    with pytest.raises(ValueError, match="uncompensated latency"):
+        main(common + ["--secondary-path-length", "64"])
+    assert main(common + ["--secondary-path-length", "200"]) == 0
+
+
+def test_online_secondary_path_converges_with_default_settings(tonal_reference, paths):
+    _, secondary = paths
+    room = SimulatedRoom(np.ones(1), secondary, source=None, delay_samples=0)
+    # Start from a plain unit delay; the auxiliary noise has to find the path.
+    initial = np.zeros(40)
+    initial[0] = 1.0
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        step_size=1e-3,
+        play_reference=True,
+        reference_device_index=1,
+        latency_samples=0,
+        secondary_path=initial,
+        online_secondary_path=True,
+        aux_noise_seed=0,
+        audio_backend=SimulatedBackend(room),
+    )
+    errors = []
+    controller.run(loop_reference=True, max_blocks=600, metrics_callback=lambda m: errors.append(m.error_rms))
+
+    true_path = np.zeros(40)
+    true_path[: len(secondary)] = secondary
+    misalignment = np.linalg.norm(controller.secondary_path - true_path) / np.linalg.norm(true_path)
+    assert misalignment < 0.1
+    # What remains is about the auxiliary noise itself.
+    aux_floor = controller.aux_noise_level / np.sqrt(3) * np.linalg.norm(secondary)
+    assert np.mean(errors[-50:]) < 2 * aux_floor
@@ -0,0 +1,90 @@
+import json
+from dataclasses import fields
+
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import AncMetrics, FxLMSANC, WavReference
+from session_recorder import RECORDING_FORMATS, SessionRecorder, load_session
+
+BLOCK = 32
+
+
+def _blocks(n_blocks, seed=0):
+    """Reference and two-speaker anti-noise test blocks."""
+    rng = np.random.default_rng(seed)
+    return [(rng.uniform(-0.5, 0.5, BLOCK), rng.uniform(-0.1, 0.1, (BLOCK, 2))) for _ in range(n_blocks)]
+
+
+@pytest.mark.parametrize("format", RECORDING_FORMATS)
+def test_round_trip_keeps_signals_and_metrics(tmp_path, format):
+    path = str(tmp_path / "session.rec")
+    recorder = SessionRecorder(path, format=format, poll_interval=0.001)
+    recorder.start(16_000, BLOCK, ["reference", "anti_noise_0", "anti_noise_1"], ["frame", "rms"])
+    blocks = _blocks(5)
+    for frame, (reference, anti_noise) in enumerate(blocks):
+        assert recorder.record_block(frame, (reference, anti_noise), (frame, float(np.std(reference))))
+    recorder.stop()
+
+    session = load_session(path)
+    assert (session.sample_rate, session.block_size, len(session)) == (16_000, BLOCK, 5 * BLOCK)
+    assert session.dropped_frames == []
+    expected = np.concatenate([np.column_stack(block) for block in blocks])
+    # The chunked format stores int16 with one scale per block and channel.
+    atol = 0.0 if format == "wav" else 0.5 / 32767
+    for index, name in enumerate(["reference", "anti_noise_0", "anti_noise_1"]):
+        np.testing.assert_allclose(session.channels[name][:], expected[:, index], rtol=1e-6, atol=atol)
+    assert [m["frame"] for m in session.metrics] == [0, 1, 2, 3, 4]
+    assert session.metrics[2]["rms"] == pytest.approx(np.std(blocks[2][0]))
+
+
+@pytest.mark.parametrize("format", RECORDING_FORMATS)
+def test_missing_blocks_stay_time_aligned(tmp_path, format):
+    path = str(tmp_path / "session.rec")
+    # The writer only runs at stop(), so the ring fills deterministically.
+    recorder = SessionRecorder(path, format=format, capacity_blocks=3, poll_interval=60.0)
+    recorder.start(16_000, BLOCK, ["reference", "anti_noise_0", "anti_noise_1"])
+    blocks = _blocks(5)
+    # Frame 1 never reaches the recorder; frames 4 and 5 find the ring full.
+    accepted = [recorder.record_block(frame, blocks[i]) for i, frame in enumerate([0, 2, 3, 4, 5])]
+    assert accepted == [True, True, True, False, False]
+    recorder.stop()
+
+    with open(path + ".json") as handle:
+        metadata = json.load(handle)
+    assert (metadata["blocks_written"], metadata["dropped_blocks"]) == (3, 2)
+    session = load_session(path)
+    assert session.dropped_frames == [1, 4, 5]
+    reference = session.channels["reference"][:]
+    # Frame 1 is silence and frame 2 still starts at its own position.
+    assert not reference[BLOCK : 2 * BLOCK].any()
+    np.testing.assert_allclose(reference[2 * BLOCK : 3 * BLOCK], blocks[1][0], atol=0.5 / 32767)
+    # WAV pads the trailing drops too; the chunked file ends with the last block it has.
+    assert len(session) == (6 if format == "wav" else 4) * BLOCK
+
+
+def test_controller_records_its_run(tonal_reference, paths, tmp_path):
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+    path = str(tmp_path / "run.wav")
+    controller = FxLMSANC(
+        tonal_reference,
+        engine="block",
+        secondary_path=secondary,
+        latency_samples=0,
+        recorder=SessionRecorder(path, poll_interval=0.001),
+        audio_backend=SimulatedBackend(room),
+    )
+    errors = []
+    controller.run(max_blocks=20, metrics_callback=lambda m: errors.append(m.error_rms))
+
+    session = load_session(path)
+    assert sorted(session.channels) == ["anti_noise", "error", "reference"]
+    assert len(session) == 20 * controller.block_size
+    assert list(session.metrics[0]) == [field.name for field in fields(AncMetrics)]
+    assert [m["error_rms"] for m in session.metrics] == pytest.approx(errors)
+    np.testing.assert_allclose(
+        session.channels["reference"][: controller.block_size],
+        WavReference(tonal_reference)[: controller.block_size],
+    )
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import LATENCY_GUARD_SAMPLES, FxLMSANC, WavReference
+from session_recorder import SessionRecorder
+from session_replay import REPLAY_DISTURBANCE_CHANNEL, prepare_replay, replay, sweep
+
+CONFIG = dict(engine="block", filter_length=64, step_size=5e-3)
+
+
+def _record(reference, paths, delay, path):
+    """Record a controlled session; returns the error rms per block."""
+    primary, secondary = paths
+    room = SimulatedRoom(primary, secondary, source=WavReference(reference), delay_samples=delay)
+    # The model replay() builds by default: the plant behind the uncompensated latency.
+    residual = delay - max(0, delay - LATENCY_GUARD_SAMPLES) // 128 * 128
+    controller = FxLMSANC(
+        reference,
+        secondary_path=np.concatenate([np.zeros(residual), secondary]),
+        latency_samples=delay,
+        recorder=SessionRecorder(path, poll_interval=0.001),
+        audio_backend=SimulatedBackend(room),
+        **CONFIG,
+    )
+    errors = []
+    controller.run(max_blocks=150, metrics_callback=lambda m: errors.append(m.error_rms))
+    return np.array(errors)
+
+
+@pytest.mark.parametrize("delay", [0, 150])
+def test_replay_reconstructs_the_disturbance_and_the_run(tonal_reference, paths, tmp_path, delay):
+    primary, secondary = paths
+    recording, prepared = str(tmp_path / "session.wav"), str(tmp_path / "replay.wav")
+    recorded_errors = _record(tonal_reference, paths, delay, recording)
+
+    prepare_replay(recording, prepared, secondary, delay)
+    # d = e - s*a is what the error mic heard without control: the primary path's output.
+    disturbance = WavReference(prepared, channel=REPLAY_DISTURBANCE_CHANNEL)[:]
+    uncontrolled = np.convolve(WavReference(tonal_reference)[:], primary)[: len(disturbance)]
+    np.testing.assert_allclose(disturbance, uncontrolled, atol=1e-6)
+
+    # The recorded configuration, replayed, gives the recorded errors again.
+    result = replay(prepared, secondary, delay, return_trace=True, **CONFIG)
+    np.testing.assert_allclose(result["error_rms"], recorded_errors, rtol=1e-5, atol=1e-7)
+    assert result["steady_state_attenuation_db"] > 6.0
+    assert result == replay(prepared, secondary, delay, return_trace=True, **CONFIG)
+
+
+def test_sweep_keeps_order_and_lists_rejected_configurations(tonal_reference, paths, tmp_path):
+    _, secondary = paths
+    recording, prepared = str(tmp_path / "session.wav"), str(tmp_path / "replay.wav")
+    _record(tonal_reference, paths, 0, recording)
+    prepare_replay(recording, prepared, secondary)
+
+    results = sweep(
+        prepared,
+        secondary,
+        step_sizes=(0.0, 1e-2),
+        filter_lengths=(64, 3000),
+        workers=1,
+        engine="block",
+        update_rule="rls",
+    )
+    assert [(r["config"]["step_size"], r["config"]["filter_length"]) for r in results] == [
+        (0.0, 64), (0.0, 3000), (1e-2, 64), (1e-2, 3000)
+    ]
+    assert results[0]["steady_state_attenuation_db"] > 6.0
+    assert "skipped" not in results[2]
+    # RLS is limited to moderate filter lengths.
+    assert "at most" in results[1]["skipped"] and "at most" in results[3]["skipped"]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import NLMS_REGULARIZATION, FxLMSANC
+
+FILTER_LENGTH = 128
+
+
+def _controller(reference, secondary, engine, delay=133):
+    # The noise comes from a reference speaker, so measurements run in silence.
+    room = SimulatedRoom(np.ones(1), secondary, source=None, delay_samples=delay)
+    return FxLMSANC(
+        reference,
+        engine=engine,
+        filter_length=FILTER_LENGTH,
+        step_size=1e-3,
+        play_reference=True,
+        reference_device_index=1,
+        latency_samples=delay,
+        audio_backend=SimulatedBackend(room),
+    )
+
+
+def test_nearly_empty_fx_window_is_not_normalized_up(tonal_reference, paths):
+    controller = _controller(tonal_reference, paths[1], "loop")
+    fx = np.zeros(FILTER_LENGTH, dtype=np.float32)
+    fx[0] = 1e-4
+    expected = 1e-3 / (1e-8 + NLMS_REGULARIZATION * FILTER_LENGTH)
+    assert controller._compute_step(fx) == pytest.approx(expected, rel=1e-4)
+    # A full window at a normal level is still normalized by its energy.
+    fx[:] = 0.3
+    assert controller._compute_step(fx) == pytest.approx(1e-3 / float(fx @ fx), rel=1e-3)
+
+
+@pytest.mark.parametrize("engine", ["loop", "block"])
+def test_measured_model_with_a_long_silent_head_converges(tonal_reference, paths, engine):
+    # Nothing of the 133 samples is compensated at block 128, so the model's
+    # first 133 taps are the measurement's noise floor. After the reset the fx
+    # window holds only those values; normalized by their energy alone, the
+    # first updates were huge and the filter diverged.
+    controller = _controller(tonal_reference, paths[1], engine)
+    np.random.seed(0)
+    controller.measure_secondary_path(duration=1.0, fir_length=181)
+    errors = []
+    controller.run(loop_reference=True, max_blocks=400, metrics_callback=lambda m: errors.append(m.error_rms))
+    assert np.mean(errors[-50:]) < 0.25 * np.mean(errors[:10])
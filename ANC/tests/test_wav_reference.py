@@ -0,0 +1,94 @@
+import struct
+
+import numpy as np
+import pytest
+
+from fxlms_controller import WavReference, read_mono_wav
+
+PCM, IEEE_FLOAT, EXTENSIBLE = 0x0001, 0x0003, 0xFFFE
+
+
+def _write(path, data, format_tag, bits, channels, extra_chunks=b"", data_size=None, sub_format=None):
+    """Write a RIFF/WAVE file by hand, so every header variant can be produced."""
+    block_align = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", format_tag, channels, 16_000, 16_000 * block_align, block_align, bits)
+    if sub_format is not None:
+        # cbSize, valid bits, channel mask, then the GUID whose first two bytes are the tag.
+        fmt += struct.pack("<HHIH14s", 22, bits, 0, sub_format, b"\x00" * 14)
+    body = b"WAVE" + struct.pack("<4sI", b"fmt ", len(fmt)) + fmt + extra_chunks
+    body += struct.pack("<4sI", b"data", len(data) if data_size is None else data_size) + data
+    with open(path, "wb") as handle:
+        handle.write(struct.pack("<4sI", b"RIFF", len(body)) + body)
+    return str(path)
+
+
+def test_24_bit_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    values = rng.integers(-(2**23), 2**23, size=(1000, 2))
+    values[:2] = [[-(2**23), 2**23 - 1], [2**23 - 1, -(2**23)]]
+    data = values.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    path = _write(tmp_path / "24.wav", data, PCM, 24, channels=2)
+
+    for channel in (0, 1):
+        reference = WavReference(path, channel=channel)
+        assert (len(reference), reference.sample_width, reference.channels) == (1000, 3, 2)
+        np.testing.assert_array_equal(reference[:], values[:, channel] / 2**23)
+        np.testing.assert_array_equal(reference[10:20], values[10:20, channel] / 2**23)
+        assert reference.raw_view(0, 5).shape == (5, 3)
+
+
+@pytest.mark.parametrize(
+    "format_tag, bits, dtype, scale, sub_format",
+    [
+        (PCM, 16, "<i2", 2**15, None),
+        (PCM, 32, "<i4", 2**31, None),
+        (IEEE_FLOAT, 32, "<f4", 1, None),
+        (EXTENSIBLE, 32, "<f4", 1, IEEE_FLOAT),
+        (EXTENSIBLE, 16, "<i2", 2**15, PCM),
+    ],
+)
+def test_sample_formats(tmp_path, format_tag, bits, dtype, scale, sub_format):
+    samples = np.linspace(-1.0, 0.999, 64)
+    stored = (samples * scale).astype(dtype)
+    path = _write(tmp_path / "ref.wav", stored.tobytes(), format_tag, bits, 1, sub_format=sub_format)
+    reference = WavReference(path)
+    np.testing.assert_allclose(reference[:], stored / scale, rtol=0, atol=1e-7)
+    # raw_view maps the file; nothing is decoded or copied.
+    view = reference.raw_view(0, 64)
+    assert view.dtype == np.dtype(dtype) and not view.flags.owndata
+
+
+def test_chunks_padding_and_unset_data_size(tmp_path):
+    stored = np.arange(-50, 50, dtype="<i2") * 300
+    # An odd-sized chunk is followed by a pad byte before the data chunk.
+    extra = struct.pack("<4sI", b"LIST", 3) + b"abc\x00"
+    path = _write(tmp_path / "ref.wav", stored.tobytes(), PCM, 16, 1, extra, data_size=0xFFFFFFFF)
+    samples, rate = read_mono_wav(path)
+    assert rate == 16_000
+    np.testing.assert_array_equal(samples, stored / 32768.0)
+
+
+def test_reading_into_a_buffer_and_slicing(tmp_path):
+    stored = np.arange(100, dtype="<i2") * 100
+    reference = WavReference(_write(tmp_path / "ref.wav", stored.tobytes(), PCM, 16, 1))
+    out = np.full(10, np.nan, dtype=np.float32)
+    reference.read_into(95, out[:5])
+    np.testing.assert_array_equal(out[:5], stored[95:] / 32768.0)
+    assert np.isnan(out[5:]).all()
+    assert len(reference[90:200]) == 10
+    with pytest.raises(ValueError, match="contiguous"):
+        reference[::2]
+    with pytest.raises(TypeError):
+        reference[3]
+
+
+def test_unsupported_files_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported sample format"):
+        WavReference(_write(tmp_path / "8bit.wav", bytes(64), PCM, 8, 1))
+    with pytest.raises(ValueError, match="out of range"):
+        WavReference(_write(tmp_path / "mono.wav", bytes(64), PCM, 16, 1), channel=1)
+    (tmp_path / "not.wav").write_bytes(b"RIFX" + bytes(40))
+    with pytest.raises(ValueError, match="Not a RIFF/WAVE file"):
+        WavReference(str(tmp_path / "not.wav"))
+    with pytest.raises(FileNotFoundError):
+        WavReference(str(tmp_path / "missing.wav"))
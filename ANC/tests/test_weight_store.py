@@ -0,0 +1,74 @@
+import numpy as np
+
+from audio_backend import SimulatedBackend, SimulatedRoom
+from fxlms_controller import FxLMSANC, WavReference
+from weight_store import StoredWeights, WeightStore
+
+
+def _save(store, **overrides):
+    entry = {
+        "weights": np.linspace(-1.0, 1.0, 32, dtype=np.float32),
+        "secondary_path": np.array([0.0, 0.6, 0.25], dtype=np.float32),
+        "control_rate": 16_000,
+        "engine_kind": "fir",
+        "compensated_latency": 128,
+        "metadata": {"engine": "block"},
+    }
+    entry.update(overrides)
+    return store.save(3, "usb-mic", "vacuum", **entry)
+
+
+def test_round_trip_and_revisions(tmp_path):
+    store = WeightStore(str(tmp_path))
+    saved = _save(store)
+    loaded = store.load(3, "usb-mic", "vacuum", control_rate=16_000, filter_length=32, engine_kind="fir")
+    np.testing.assert_array_equal(loaded.weights, saved.weights)
+    np.testing.assert_array_equal(loaded.secondary_path, saved.secondary_path)
+    assert (loaded.compensated_latency, loaded.revision) == (128, 1)
+    assert loaded.metadata["engine"] == "block"
+
+    assert _save(store, weights=np.zeros(32, dtype=np.float32)).revision == 2
+    assert store.load(3, "usb-mic", "vacuum").revision == 2
+    assert [entry["noise_class"] for entry in store.entries()] == ["vacuum"]
+
+    restored = StoredWeights.from_json(loaded.to_json())
+    np.testing.assert_array_equal(restored.weights, loaded.weights)
+    assert restored.engine_kind == "fir"
+
+
+def test_incompatible_or_damaged_entries_are_cold_starts(tmp_path):
+    store = WeightStore(str(tmp_path))
+    _save(store)
+    assert store.load(3, "usb-mic", "fridge") is None
+    assert store.load(3, "usb-mic", "vacuum", control_rate=8_000) is None
+    assert store.load(3, "usb-mic", "vacuum", filter_length=64) is None
+    assert store.load(3, "usb-mic", "vacuum", engine_kind="narrowband") is None
+
+    with open(store.path_for(3, "usb-mic", "vacuum"), "wb") as handle:
+        handle.write(b"not an npz file")
+    assert store.load(3, "usb-mic", "vacuum") is None
+
+
+def test_controller_warm_starts_from_its_last_session(tonal_reference, paths, tmp_path):
+    primary, secondary = paths
+
+    def session():
+        room = SimulatedRoom(primary, secondary, source=WavReference(tonal_reference), delay_samples=0)
+        controller = FxLMSANC(
+            tonal_reference,
+            engine="block",
+            filter_length=64,
+            step_size=5e-3,
+            secondary_path=secondary,
+            latency_samples=0,
+            weight_store=WeightStore(str(tmp_path)),
+            audio_backend=SimulatedBackend(room),
+        )
+        errors = []
+        controller.run(max_blocks=200, metrics_callback=lambda m: errors.append(m.error_rms))
+        return np.array(errors)
+
+    cold = session()
+    warm = session()
+    # The second session starts where the first one ended.
+    assert np.mean(warm[:10]) < 0.25 * np.mean(cold[:10])
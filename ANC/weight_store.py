@@ -0,0 +1,238 @@
+"""
+Persistent warm-start store for converged controller weights.
+
+``FxLMSANC.run()`` starts from zero weights. With a ``WeightStore`` the
+controller instead loads the weights and secondary-path model it converged to
+the last time the same control device, error device and noise class were
+used, and saves them again when the session ends, so a known setup
+attenuates within a few blocks.
+
+Entries are ``.npz`` files in one directory, one per
+(control device, error device, noise class) key, written atomically. Each
+carries the store format version, a per-key revision counter and the
+settings that the weights depend on:
+
+``control_rate``
+    Adaptation rate (sample rate divided by decimation); tap ``i`` is a delay
+    of ``i / control_rate`` seconds.
+``engine_kind``
+    ``"fir"`` for the time/frequency engines, ``"narrowband"`` for harmonic
+    weights, which are not interchangeable.
+``compensated_latency``
+    Samples of loop latency handled by whole-block delay compensation. The
+    secondary-path model only covers the remaining delay, so it is reused
+    only when this matches.
+
+``load`` returns None for missing, unreadable, outdated or incompatible
+entries, so a mismatch costs a cold start, never a wrong filter.
+``StoredWeights.to_json`` gives a JSON string suitable for the backend's
+``Device.calibration_data``.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+WEIGHT_STORE_VERSION = 1
+DEFAULT_NOISE_CLASS = "default"
+
+
+@dataclass
+class StoredWeights:
+    """One warm-start entry."""
+
+    weights: np.ndarray
+    secondary_path: np.ndarray
+    control_rate: int
+    engine_kind: str
+    compensated_latency: int
+    revision: int = 0
+    metadata: Dict = field(default_factory=dict)
+
+    @property
+    def filter_length(self) -> int:
+        return int(self.weights.shape[-1])
+
+    def to_json(self) -> str:
+        """Serialise the entry, e.g. for ``Device.calibration_data``."""
+        return json.dumps(
+            {
+                "version": WEIGHT_STORE_VERSION,
+                "weights": self.weights.tolist(),
+                "secondary_path": self.secondary_path.tolist(),
+                "control_rate": self.control_rate,
+                "engine_kind": self.engine_kind,
+                "compensated_latency": self.compensated_latency,
+                "revision": self.revision,
+                "metadata": self.metadata,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "StoredWeights":
+        data = json.loads(text)
+        if data.get("version") != WEIGHT_STORE_VERSION:
+            raise ValueError(f"Unsupported weight store version {data.get('version')!r}")
+        return cls(
+            weights=np.asarray(data["weights"], dtype=np.float32),
+            secondary_path=np.asarray(data["secondary_path"], dtype=np.float32),
+            control_rate=int(data["control_rate"]),
+            engine_kind=data["engine_kind"],
+            compensated_latency=int(data["compensated_latency"]),
+            revision=int(data.get("revision", 0)),
+            metadata=data.get("metadata", {}),
+        )
+
+
+class WeightStore:
+    """
+    Directory of warm-start entries keyed by device pair and noise class.
+
+    Parameters
+    ----------
+    directory:
+        Where the entries live; created on first save.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, control_device, error_device, noise_class: str = DEFAULT_NOISE_CLASS) -> str:
+        """File of the entry for a key. Key parts may be device indices or ids."""
+        parts = [str(control_device), str(error_device), str(noise_class)]
+        slug = "_".join(re.sub(r"[^A-Za-z0-9.-]+", "-", part) for part in parts)
+        digest = hashlib.sha1("\0".join(parts).encode()).hexdigest()[:8]
+        return os.path.join(self.directory, f"{slug}_{digest}.npz")
+
+    def load(
+        self,
+        control_device,
+        error_device,
+        noise_class: str = DEFAULT_NOISE_CLASS,
+        control_rate: Optional[int] = None,
+        filter_length: Optional[int] = None,
+        engine_kind: Optional[str] = None,
+    ) -> Optional[StoredWeights]:
+        """
+        Return the entry for a key, or None if there is no usable one.
+
+        ``control_rate``, ``filter_length`` and ``engine_kind``, when given,
+        must match the stored entry.
+        """
+        path = self.path_for(control_device, error_device, noise_class)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                header = json.loads(str(data["header"]))
+                entry = StoredWeights(
+                    weights=data["weights"].astype(np.float32),
+                    secondary_path=data["secondary_path"].astype(np.float32),
+                    control_rate=int(header["control_rate"]),
+                    engine_kind=header["engine_kind"],
+                    compensated_latency=int(header["compensated_latency"]),
+                    revision=int(header["revision"]),
+                    metadata=header.get("metadata", {}),
+                )
+        except (OSError, ValueError, KeyError) as exc:
+            logging.warning("Ignoring unreadable weight store entry %s: %s", path, exc)
+            return None
+
+        expected = {
+            "version": (header.get("version"), WEIGHT_STORE_VERSION),
+            "control_rate": (entry.control_rate, control_rate),
+            "filter_length": (entry.filter_length, filter_length),
+            "engine_kind": (entry.engine_kind, engine_kind),
+        }
+        for name, (stored, wanted) in expected.items():
+            if wanted is not None and stored != wanted:
+                logging.info("Stored weights in %s have %s=%s, need %s", path, name, stored, wanted)
+                return None
+        if not (np.all(np.isfinite(entry.weights)) and np.all(np.isfinite(entry.secondary_path))):
+            logging.warning("Ignoring weight store entry %s with non-finite values", path)
+            return None
+        return entry
+
+    def save(
+        self,
+        control_device,
+        error_device,
+        noise_class: str,
+        weights: np.ndarray,
+        secondary_path: np.ndarray,
+        control_rate: int,
+        engine_kind: str,
+        compensated_latency: int,
+        metadata: Optional[Dict] = None,
+    ) -> StoredWeights:
+        """Write (or replace) the entry for a key, bumping its revision."""
+        weights = np.asarray(weights, dtype=np.float32)
+        secondary_path = np.asarray(secondary_path, dtype=np.float32)
+        if not (np.all(np.isfinite(weights)) and np.all(np.isfinite(secondary_path))):
+            raise ValueError("Refusing to store non-finite weights")
+
+        path = self.path_for(control_device, error_device, noise_class)
+        previous = self.load(control_device, error_device, noise_class)
+        entry = StoredWeights(
+            weights=weights,
+            secondary_path=secondary_path,
+            control_rate=int(control_rate),
+            engine_kind=engine_kind,
+            compensated_latency=int(compensated_latency),
+            revision=previous.revision + 1 if previous is not None else 1,
+            metadata=dict(metadata or {}, saved_at=time.time()),
+        )
+        header = {
+            "version": WEIGHT_STORE_VERSION,
+            "control_device": str(control_device),
+            "error_device": str(error_device),
+            "noise_class": str(noise_class),
+            "control_rate": entry.control_rate,
+            "engine_kind": entry.engine_kind,
+            "compensated_latency": entry.compensated_latency,
+            "revision": entry.revision,
+            "metadata": entry.metadata,
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Write next to the target and rename, so readers never see a partial file.
+        handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as output:
+                np.savez(output, weights=weights, secondary_path=secondary_path, header=json.dumps(header))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return entry
+
+    def delete(self, control_device, error_device, noise_class: str = DEFAULT_NOISE_CLASS) -> bool:
+        """Remove the entry for a key; returns False if there was none."""
+        path = self.path_for(control_device, error_device, noise_class)
+        if not os.path.exists(path):
+            return False
+        os.unlink(path)
+        return True
+
+    def entries(self) -> List[Dict]:
+        """Headers of all stored entries."""
+        if not os.path.isdir(self.directory):
+            return []
+        headers = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                with np.load(os.path.join(self.directory, name), allow_pickle=False) as data:
+                    headers.append(json.loads(str(data["header"])))
+            except (OSError, ValueError, KeyError):
+                continue
+        return headers
@@ -1,29 +1,49 @@
-import tensorflow as tf
-import tensorflow_hub as hub
-import numpy as np
-import librosa
+"""YAMNet sound classification.
+
+Nothing heavy happens at import time: TensorFlow and the SavedModel are
+loaded by the first YAMNetClassifier call that needs them, and the class map
+is read straight from the model's assets, so the class names are available
+without loading the model at all.
+
+  classifier = YAMNetClassifier()
+  classifier.warmup()  # off the request path, e.g. at service start
+  label, scores = classifier.classify(waveform)
+  print(classifier.timings)
+
+The module attributes model and class_names still work; they load the
+shared default_classifier() on first access.
+"""
+
 import csv
+import os
+import threading
+import time
+
+import numpy as np
 
 #from scipy.io import wavfile
 #from scipy import signal
 
-# Load the model.
-model = hub.load('./yamnet_1')
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yamnet_1')
+# YAMNet expects mono float32 audio at 16 kHz in [-1, 1].
+MODEL_SAMPLE_RATE = 16000
+# One YAMNet patch (0.96 s); the window length of the streaming classifier.
+DEFAULT_INPUT_SAMPLES = 15600
 
+_class_map_cache = {}
 
 
 # Find the name of the class with the top score when mean-aggregated across frames.
 def class_names_from_csv(class_map_csv_text):
   """Returns list of class names corresponding to score vector."""
-  class_names = []
-  with tf.io.gfile.GFile(class_map_csv_text) as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-      class_names.append(row['display_name'])
-  return class_names
-
-class_map_path = model.class_map_path().numpy()
-class_names = class_names_from_csv(class_map_path)
+  if class_map_csv_text not in _class_map_cache:
+    class_names = []
+    with open(class_map_csv_text, newline='') as csvfile:
+      reader = csv.DictReader(csvfile)
+      for row in reader:
+        class_names.append(row['display_name'])
+    _class_map_cache[class_map_csv_text] = class_names
+  return _class_map_cache[class_map_csv_text]
 
 
 
@@ -36,41 +56,143 @@ class_names = class_names_from_csv(class_map_path)
 #   return desired_sample_rate, waveform
 
 
+class YAMNetClassifier:
+  """YAMNet with lazy loading, a cached class map and explicit warmup.
+
+  Calling the object runs the model on a 1-D 16 kHz float waveform and
+  returns (scores, embeddings, spectrogram) like the hub model, so it can be
+  passed wherever a model is expected. timings holds, in seconds:
+  import_tf (importing TensorFlow), load (hub.load), trace (tracing the
+  warmup graph) and first_inference (the first model run after loading).
+  """
+
+  def __init__(self, model_dir=MODEL_DIR):
+    self.model_dir = model_dir
+    self.timings = {}
+    self._model = None
+    self._traced = {}  # input length -> concrete function
+    self._lock = threading.Lock()
+
+  @property
+  def class_names(self):
+    """Class names of the score vector, read from the model assets without loading it."""
+    path = os.path.join(self.model_dir, 'assets', 'yamnet_class_map.csv')
+    if not os.path.exists(path):
+      return class_names_from_csv(self.model.class_map_path().numpy().decode())
+    return class_names_from_csv(path)
+
+  @property
+  def loaded(self):
+    return self._model is not None
+
+  @property
+  def model(self):
+    """The hub model, loaded on first use."""
+    if self._model is None:
+      with self._lock:
+        if self._model is None:
+          start = time.perf_counter()
+          import tensorflow_hub as hub
+          self.timings['import_tf'] = time.perf_counter() - start
+
+          start = time.perf_counter()
+          model = hub.load(self.model_dir)
+          self.timings['load'] = time.perf_counter() - start
+          self._model = model
+    return self._model
+
+  def warmup(self, input_samples=DEFAULT_INPUT_SAMPLES):
+    """Loads the model, traces it for input_samples long waveforms and runs it once.
+
+    Later calls with exactly that length use the traced graph. Returns timings.
+    """
+    import tensorflow as tf
+
+    model = self.model
+    if input_samples not in self._traced:
+      start = time.perf_counter()
+      self._traced[input_samples] = tf.function(lambda waveform: model(waveform)).get_concrete_function(
+          tf.TensorSpec([input_samples], tf.float32))
+      self.timings['trace'] = time.perf_counter() - start
+    self(np.zeros(input_samples, dtype=np.float32))
+    return dict(self.timings)
+
+  def __call__(self, waveform):
+    import tensorflow as tf
+
+    model = self.model
+    waveform = tf.cast(waveform, tf.float32)
+    traced = self._traced.get(int(waveform.shape[0]))
+    start = time.perf_counter()
+    outputs = traced(waveform) if traced is not None else model(waveform)
+    if 'first_inference' not in self.timings:
+      self.timings['first_inference'] = time.perf_counter() - start
+    return outputs
+
+  def classify(self, waveform):
+    """Returns (class name, per-frame scores) for a 16 kHz mono waveform."""
+    scores, embeddings, spectrogram = self(waveform)
+    scores_np = scores.numpy()
+    return self.class_names[scores_np.mean(axis=0).argmax()], scores_np
 
-# wav_file_name = 'speech_whistling2.wav'
-# 이따가 파일이 들어갈 경로를 저기다가 해야함
-wav_file_name = 'vibration.mp3'
 
-try:
-    
-    wav_data, sample_rate = librosa.load(wav_file_name, sr=16000, mono=True)
-    # sample_rate, wav_data = ensure_sample_rate(sample_rate, wav_data)
+_default_classifier = None
 
-    # Show some basic information about the audio.
-    duration = len(wav_data)/sample_rate
-    print(f'Sample rate: {sample_rate} Hz')
-    print(f'Total duration: {duration:.2f}s')
-    print(f'Size of the input: {len(wav_data)}')
 
-    # if wav_data.ndim != 1:  #dimension 1차원으로 통일?
-    #   wav_data = np.mean(wav_data, axis=1)
-      
-    waveform = wav_data
-    waveform = tf.cast(waveform, tf.float32)
+def default_classifier():
+  """The classifier shared by this module's helpers (not loaded until used)."""
+  global _default_classifier
+  if _default_classifier is None:
+    _default_classifier = YAMNetClassifier()
+  return _default_classifier
 
-    # Run the model, check the output.
-    scores, embeddings, spectrogram = model(waveform)
 
+def __getattr__(name):
+  # Keeps `from YAMNet_classification import model, class_names` working, lazily.
+  if name == 'model':
+    return default_classifier().model
+  if name == 'class_names':
+    return default_classifier().class_names
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-    scores_np = scores.numpy()
-    spectrogram_np = spectrogram.numpy()
-    infered_class = class_names[scores_np.mean(axis=0).argmax()]
-    print(f'The main sound is: {infered_class}')
-
-except FileNotFoundError:
-    print(f"에러 : {wav_file_name}을 찾을 수 없습니다.")
-    print(f"파일을 다운로드하거나, {wav_file_name}의 경로를 확인하세요.")
-except Exception as e:
-    print(f"에러발생 : {e}")
-    
-    
\ No newline at end of file
+
+def classify_waveform(waveform):
+  """Returns (class name, per-frame scores) for a 16 kHz mono waveform."""
+  return default_classifier().classify(waveform)
+
+
+def main(wav_file_name):
+  import librosa
+
+  try:
+
+      wav_data, sample_rate = librosa.load(wav_file_name, sr=MODEL_SAMPLE_RATE, mono=True)
+      # sample_rate, wav_data = ensure_sample_rate(sample_rate, wav_data)
+
+      # Show some basic information about the audio.
+      duration = len(wav_data)/sample_rate
+      print(f'Sample rate: {sample_rate} Hz')
+      print(f'Total duration: {duration:.2f}s')
+      print(f'Size of the input: {len(wav_data)}')
+
+      # if wav_data.ndim != 1:  #dimension 1차원으로 통일?
+      #   wav_data = np.mean(wav_data, axis=1)
+
+      # Run the model, check the output.
+      infered_class, scores_np = classify_waveform(wav_data)
+      print(f'The main sound is: {infered_class}')
+      print('Timings: ' + ', '.join(f'{k} {v * 1e3:.0f} ms' for k, v in default_classifier().timings.items()))
+
+  except FileNotFoundError:
+      print(f"에러 : {wav_file_name}을 찾을 수 없습니다.")
+      print(f"파일을 다운로드하거나, {wav_file_name}의 경로를 확인하세요.")
+  except Exception as e:
+      print(f"에러발생 : {e}")
+
+
+if __name__ == '__main__':
+  import sys
+
+  # wav_file_name = 'speech_whistling2.wav'
+  # 이따가 파일이 들어갈 경로를 저기다가 해야함
+  main(sys.argv[1] if len(sys.argv) > 1 else 'vibration.mp3')
@@ -0,0 +1,210 @@
+"""Batch YAMNet classification of audio files.
+
+  python batch_classify.py recordings/ 'more/*.mp3' --format csv --output labels.csv
+
+Directories are searched recursively for AUDIO_EXTENSIONS; globs and plain
+files are taken as given. Files are decoded and resampled to 16 kHz in a
+thread (or process) pool while the model runs, so decoding overlaps with
+inference. Decoded waveforms are packed into batches: each waveform is
+zero-padded to a whole number of YAMNet patch hops, the batch is classified
+in one model call and the patch scores are split back per file. Patches
+that straddle two files are dropped. A result line is written per file as
+soon as its batch is done, with the top-k classes of the mean scores, the
+decode time and the file's share of the batch inference time.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+
+MODEL_SAMPLE_RATE = 16000
+# YAMNet patches: 0.96 s of frames (15600 samples) every 0.48 s.
+PATCH_SAMPLES = 15600
+PATCH_HOP_SAMPLES = 7680
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.m4a')
+DEFAULT_TOP_K = 3
+DEFAULT_BATCH_SECONDS = 120.0
+# Decoded files waiting for the model, per decoding worker; bounds memory.
+PREFETCH_PER_WORKER = 2
+CSV_FIELDS = ('path', 'duration', 'label', 'score', 'top_k', 'decode_ms', 'inference_ms', 'error')
+
+
+def expand_inputs(inputs, extensions=AUDIO_EXTENSIONS):
+  """Returns the sorted, de-duplicated files named by paths, directories and globs."""
+  files = []
+  for item in inputs:
+    if os.path.isdir(item):
+      for root, _, names in os.walk(item):
+        files.extend(os.path.join(root, name) for name in names if name.lower().endswith(extensions))
+    elif os.path.isfile(item):
+      files.append(item)
+    else:
+      files.extend(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+  return sorted(set(files))
+
+
+def decode(path):
+  """Loads one file as 16 kHz mono float32; returns (path, waveform, seconds taken)."""
+  import librosa
+
+  start = time.perf_counter()
+  waveform, _ = librosa.load(path, sr=MODEL_SAMPLE_RATE, mono=True)
+  return path, waveform.astype(np.float32), time.perf_counter() - start
+
+
+def padded_length(n_samples):
+  """Length of a batch segment: at least one patch, ending on a patch hop."""
+  n_samples = max(n_samples, PATCH_SAMPLES)
+  hops = -(-(n_samples - PATCH_SAMPLES) // PATCH_HOP_SAMPLES)
+  return PATCH_SAMPLES + hops * PATCH_HOP_SAMPLES
+
+
+def classify_batch(model, waveforms):
+  """Runs one model call over several waveforms; returns their mean scores and the call time."""
+  lengths = [padded_length(len(waveform)) for waveform in waveforms]
+  # Segments start on patch boundaries so patches line up with each file.
+  offsets = np.cumsum([0] + [-(-length // PATCH_HOP_SAMPLES) * PATCH_HOP_SAMPLES for length in lengths])
+  batch = np.zeros(offsets[-1], dtype=np.float32)
+  for offset, waveform in zip(offsets, waveforms):
+    batch[offset:offset + len(waveform)] = waveform
+
+  start = time.perf_counter()
+  scores = np.asarray(model(batch)[0])
+  elapsed = time.perf_counter() - start
+
+  means = []
+  for offset, length in zip(offsets, lengths):
+    first = offset // PATCH_HOP_SAMPLES
+    count = (length - PATCH_SAMPLES) // PATCH_HOP_SAMPLES + 1
+    means.append(scores[first:first + count].mean(axis=0))
+  return means, elapsed
+
+
+class ResultWriter:
+  """Streams results as JSONL or CSV."""
+
+  def __init__(self, handle, fmt):
+    self.handle = handle
+    self.fmt = fmt
+    if fmt == 'csv':
+      self._csv = csv.DictWriter(handle, fieldnames=CSV_FIELDS)
+      self._csv.writeheader()
+
+  def write(self, result):
+    if self.fmt == 'jsonl':
+      self.handle.write(json.dumps(result) + '\n')
+    else:
+      row = dict(result)
+      row['top_k'] = ';'.join(f"{item['label']}:{item['score']:.4f}" for item in result.get('top_k', []))
+      self._csv.writerow({field: row.get(field, '') for field in CSV_FIELDS})
+    self.handle.flush()
+
+
+def classify_files(files, model, class_names, writer, top_k=DEFAULT_TOP_K, workers=None,
+                   processes=False, batch_seconds=DEFAULT_BATCH_SECONDS):
+  """Decodes files in a pool and classifies them in batches; returns a summary dict."""
+  pool_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+  batch_limit = int(batch_seconds * MODEL_SAMPLE_RATE)
+  pending = []  # (path, waveform, decode seconds)
+  summary = {'files': 0, 'failed': 0, 'audio_seconds': 0.0, 'model_calls': 0}
+  started = time.perf_counter()
+
+  def flush():
+    means, elapsed = classify_batch(model, [waveform for _, waveform, _ in pending])
+    summary['model_calls'] += 1
+    total = sum(len(waveform) for _, waveform, _ in pending)
+    for (path, waveform, decode_seconds), mean in zip(pending, means):
+      order = np.argsort(mean)[::-1][:top_k]
+      writer.write({
+          'path': path,
+          'duration': len(waveform) / MODEL_SAMPLE_RATE,
+          'label': class_names[order[0]],
+          'score': float(mean[order[0]]),
+          'top_k': [{'label': class_names[i], 'score': float(mean[i])} for i in order],
+          'decode_ms': decode_seconds * 1e3,
+          'inference_ms': elapsed * 1e3 * len(waveform) / max(total, 1),
+      })
+      summary['files'] += 1
+      summary['audio_seconds'] += len(waveform) / MODEL_SAMPLE_RATE
+    pending.clear()
+
+  workers = workers or os.cpu_count() or 1
+  in_flight_limit = PREFETCH_PER_WORKER * workers
+  queue = iter(files)
+  with pool_type(max_workers=workers) as pool:
+    futures = {}
+    while True:
+      for path in queue:
+        futures[pool.submit(decode, path)] = path
+        if len(futures) >= in_flight_limit:
+          break
+      if not futures:
+        break
+      done, _ = wait(futures, return_when=FIRST_COMPLETED)
+      for future in done:
+        path = futures.pop(future)
+        try:
+          pending.append(future.result())
+        except Exception as e:
+          writer.write({'path': path, 'error': str(e)})
+          summary['failed'] += 1
+      if sum(len(waveform) for _, waveform, _ in pending) >= batch_limit:
+        flush()
+    if pending:
+      flush()
+
+  summary['wall_seconds'] = time.perf_counter() - started
+  return summary
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(description='Classify many audio files with YAMNet.')
+  parser.add_argument('inputs', nargs='+', help='Files, directories or glob patterns')
+  parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+  parser.add_argument('--output', default=None, help='Result file (default: stdout)')
+  parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+  parser.add_argument('--workers', type=int, default=None, help='Decoding workers')
+  parser.add_argument('--processes', action='store_true', help='Decode in processes instead of threads')
+  parser.add_argument('--batch-seconds', type=float, default=DEFAULT_BATCH_SECONDS,
+                      help='Audio per model call')
+  parser.add_argument('--tflite', default=None, help='Exported TFLite model to use instead of the SavedModel')
+  parser.add_argument('--threads', type=int, default=1, help='TFLite interpreter threads')
+  return parser
+
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+  files = expand_inputs(args.inputs)
+  if not files:
+    print('에러 : 분류할 오디오 파일이 없습니다.', file=sys.stderr)
+    return 1
+
+  if args.tflite:
+    from yamnet_tflite import TFLiteYAMNet
+    model = TFLiteYAMNet(args.tflite, num_threads=args.threads)
+  else:
+    from YAMNet_classification import default_classifier
+    model = default_classifier()
+  class_names = model.class_names
+
+  handle = open(args.output, 'w', newline='') if args.output else sys.stdout
+  try:
+    summary = classify_files(
+        files, model, class_names, ResultWriter(handle, args.format), top_k=args.top_k,
+        workers=args.workers, processes=args.processes, batch_seconds=args.batch_seconds)
+  finally:
+    if args.output:
+      handle.close()
+  print(json.dumps(summary), file=sys.stderr)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,125 @@
+"""Low-frequency energy gate in front of the classifier.
+
+GOYO only cancels noise in the ANC band (20-250 Hz), and most of the time
+that band is quiet or steady. LowFrequencyGate looks at the band spectrum of
+each window (one windowed FFT, negligible next to a YAMNet run) and lets the
+window through to the model only when
+
+  * the band level is more than margin_db above the adaptive noise floor
+    and the window is the first loud one after a quiet stretch,
+  * the band spectrum changed by more than change_db in any sub-band since
+    the last window that was classified, counting only levels above the
+    threshold so that the room's own noise does not trigger it, or
+  * max_skip_seconds passed since the last classification (and for the very
+    first window), so a steady noise or a noise the floor has adapted to is
+    still re-checked now and then.
+
+The noise floor follows the band level down at once and creeps up by
+floor_rise_db_per_second, so it settles on the quiet level of the room.
+
+  gate = LowFrequencyGate()
+  classifier = StreamingClassifier(input_rate=44100, gate=gate)
+  ...
+  print(classifier.stats())
+"""
+
+import numpy as np
+
+ANC_BAND_HZ = (20.0, 250.0)
+DEFAULT_SUB_BANDS = 6
+DEFAULT_MARGIN_DB = 6.0
+DEFAULT_CHANGE_DB = 6.0
+DEFAULT_FLOOR_RISE_DB_PER_SECOND = 0.5
+DEFAULT_MAX_SKIP_SECONDS = 10.0
+# Level of digital silence, so log10 never sees zero.
+LEVEL_FLOOR_DB = -120.0
+
+
+class LowFrequencyGate:
+  """Decides per window whether the classifier needs to run."""
+
+  def __init__(self, sample_rate=16000, band=ANC_BAND_HZ, sub_bands=DEFAULT_SUB_BANDS,
+               margin_db=DEFAULT_MARGIN_DB, change_db=DEFAULT_CHANGE_DB,
+               floor_rise_db_per_second=DEFAULT_FLOOR_RISE_DB_PER_SECOND,
+               max_skip_seconds=DEFAULT_MAX_SKIP_SECONDS):
+    low, high = band
+    if not 0.0 <= low < high <= sample_rate / 2:
+      raise ValueError('band must satisfy 0 <= low < high <= sample_rate / 2')
+    self.sample_rate = sample_rate
+    self.band = (low, high)
+    # Log-spaced sub-band edges, so a hum at 60 Hz is not averaged away by 200 Hz.
+    self.edges = np.geomspace(max(low, 1.0), high, sub_bands + 1)
+    self.margin_db = margin_db
+    self.change_db = change_db
+    self.floor_rise_db_per_second = floor_rise_db_per_second
+    self.max_skip_seconds = max_skip_seconds
+    self._bins = {}  # window length -> (hann window, sub-band index of each rfft bin)
+    self.reset()
+
+  def reset(self):
+    self.floor_db = None
+    self.level_db = LEVEL_FLOOR_DB
+    self._time = None
+    self._active = False
+    self._last_spectrum = None  # sub-band levels of the last classified window
+    self._last_classified = None
+    self.windows = 0
+    self.passed = 0
+    self.reasons = {'onset': 0, 'change': 0, 'refresh': 0}
+
+  def _layout(self, n):
+    if n not in self._bins:
+      freqs = np.fft.rfftfreq(n, 1.0 / self.sample_rate)
+      index = np.searchsorted(self.edges, freqs, side='right') - 1
+      index[freqs == self.edges[-1]] = len(self.edges) - 2
+      index[index >= len(self.edges) - 1] = -1
+      self._bins[n] = (np.hanning(n).astype(np.float32), index)
+    return self._bins[n]
+
+  def band_levels(self, window):
+    """Mean power per sub-band of the window, in dB."""
+    hann, index = self._layout(len(window))
+    power = np.abs(np.fft.rfft(window * hann)) ** 2 / len(window)
+    inside = index >= 0
+    sums = np.bincount(index[inside], weights=power[inside], minlength=len(self.edges) - 1)
+    counts = np.maximum(np.bincount(index[inside], minlength=len(self.edges) - 1), 1)
+    return np.maximum(10.0 * np.log10(np.maximum(sums / counts, 1e-30)), LEVEL_FLOOR_DB)
+
+  def decide(self, window, time):
+    """True if the window at stream time (seconds) should be classified."""
+    spectrum = self.band_levels(np.asarray(window, dtype=np.float32))
+    level = float(10.0 * np.log10(np.mean(10.0 ** (spectrum / 10.0))))
+    elapsed = 0.0 if self._time is None else time - self._time
+    self._time = time
+    self.level_db = level
+    if self.floor_db is None or level < self.floor_db:
+      self.floor_db = level
+    else:
+      self.floor_db = min(level, self.floor_db + self.floor_rise_db_per_second * elapsed)
+    self.windows += 1
+
+    was_active = self._active
+    threshold = self.floor_db + self.margin_db
+    self._active = level > threshold
+    reason = None
+    if self._active and not was_active:
+      reason = 'onset'
+    elif (self._last_spectrum is not None
+          and np.max(np.abs(np.maximum(spectrum, threshold) - np.maximum(self._last_spectrum, threshold)))
+          > self.change_db):
+      reason = 'change'
+    elif self._last_classified is None or time - self._last_classified >= self.max_skip_seconds:
+      reason = 'refresh'
+    if reason is None:
+      return False
+
+    self.reasons[reason] += 1
+    self.passed += 1
+    self._last_spectrum = spectrum
+    self._last_classified = time
+    return True
+
+  @property
+  def gating_ratio(self):
+    """Fraction of windows kept from the model."""
+    return 1.0 - self.passed / self.windows if self.windows else 0.0
@@ -0,0 +1,267 @@
+"""Streaming YAMNet classification of live audio blocks.
+
+StreamingClassifier takes audio in arbitrary blocks (for example the int16
+chunks of AudioDeviceManager.read_audio_chunk at 44.1 kHz), resamples it to
+16 kHz on the fly and classifies a sliding window of one YAMNet patch
+(0.96 s of spectrogram frames, WINDOW_SAMPLES of audio) every hop_seconds.
+
+The window lives in a fixed ring: a hop only appends hop samples and runs the
+model on one window, so the work per hop is bounded no matter how long the
+stream is. Scores are smoothed across windows with an exponential moving
+average before picking the label, which keeps a single noisy window from
+flipping the result. Each window yields a WindowLabel; an optional on_label
+callback receives (label, score), e.g. ProfileSwitcher.observe of the ANC
+controller. With a gate (energy_gate.LowFrequencyGate) only the windows the
+gate passes are classified; the others yield nothing and leave the smoothed
+scores as they are. A skipped window means the band did not change, so
+on_label still receives the last smoothed label for it: a listener that
+counts consecutive labels (ProfileSwitcher needs confirm_observations in a
+row) keeps counting at the hop rate instead of waiting for gate refreshes,
+up to max_skip_seconds apart.
+
+  classifier = StreamingClassifier(input_rate=44100, hop_seconds=0.48)
+  while True:
+    for result in classifier.push(audio_manager.read_audio_chunk(stream)):
+      print(result.time, result.label, result.score)
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+from math import gcd
+from typing import Callable, List, Optional
+
+import numpy as np
+
+MODEL_SAMPLE_RATE = 16000
+# One YAMNet patch: 96 frames with a 10 ms hop and a 25 ms window.
+WINDOW_SAMPLES = 15600
+DEFAULT_HOP_SECONDS = 0.48
+# Weight of the newest window in the score average (1.0 disables smoothing).
+DEFAULT_SMOOTHING = 0.5
+# Anti-alias filter of the resampler: taps per polyphase branch and passband
+# edge as a fraction of the lower Nyquist frequency.
+RESAMPLER_TAPS_PER_PHASE = 24
+RESAMPLER_CUTOFF = 0.9
+
+
+@dataclass
+class WindowLabel:
+  """Classification of one window."""
+  time: float  # stream time of the window end, in seconds
+  label: str  # top class of the smoothed scores
+  score: float
+  raw_label: str  # top class of this window alone
+  raw_score: float
+
+
+class StreamingResampler:
+  """Rational polyphase resampler that keeps its state between blocks."""
+
+  def __init__(self, input_rate, output_rate=MODEL_SAMPLE_RATE,
+               taps_per_phase=RESAMPLER_TAPS_PER_PHASE):
+    common = gcd(int(input_rate), int(output_rate))
+    self.up = int(output_rate) // common
+    self.down = int(input_rate) // common
+    self.taps_per_phase = taps_per_phase
+    # Low-pass at the up-sampled rate, split into one branch per phase.
+    length = self.up * taps_per_phase
+    cutoff = RESAMPLER_CUTOFF / max(self.up, self.down)
+    n = np.arange(length) - (length - 1) / 2.0
+    prototype = self.up * cutoff * np.sinc(cutoff * n) * np.kaiser(length, 8.0)
+    self._branches = prototype.reshape(taps_per_phase, self.up).T[:, ::-1].astype(np.float32)
+    self.reset()
+
+  def reset(self):
+    self._history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+    self._next_output = 0  # index of the next output sample
+    self._consumed = 0  # input samples dropped from the front of the history
+
+  def process(self, samples):
+    """Returns the output samples that the new input completes."""
+    if self.up == self.down:
+      return np.asarray(samples, dtype=np.float32)
+    buffer = np.concatenate([self._history, np.asarray(samples, dtype=np.float32)])
+    # Output m sits at input position m * down / up; it needs input up to there.
+    available = self._consumed + len(buffer) - (self.taps_per_phase - 1)
+    count = max(0, (available * self.up - 1) // self.down + 1 - self._next_output)
+    positions = (self._next_output + np.arange(count)) * self.down
+    starts = positions // self.up - self._consumed
+    phases = positions % self.up
+    windows = buffer[starts[:, None] + np.arange(self.taps_per_phase)]
+    out = np.einsum('ij,ij->i', windows, self._branches[phases])
+    self._next_output += count
+
+    keep = self.taps_per_phase - 1
+    first_needed = (self._next_output * self.down) // self.up - self._consumed
+    first_needed = min(first_needed, len(buffer) - keep)
+    self._history = buffer[first_needed:]
+    self._consumed += first_needed
+    return out.astype(np.float32)
+
+
+class StreamingClassifier:
+  """Sliding-window YAMNet classifier fed with audio blocks.
+
+  model and class_names default to YAMNet_classification's shared
+  classifier, warmed up for the window length; pass them to reuse an already
+  loaded model. model is called with a 1-D float32 16 kHz waveform and
+  returns (scores, embeddings, spectrogram).
+  """
+
+  def __init__(self, model=None, class_names=None, input_rate=MODEL_SAMPLE_RATE,
+               hop_seconds=DEFAULT_HOP_SECONDS, smoothing=DEFAULT_SMOOTHING,
+               on_label: Optional[Callable[[str, float], None]] = None, gate=None):
+    if model is None or class_names is None:
+      import YAMNet_classification
+      if model is None:
+        model = YAMNet_classification.default_classifier()
+        model.warmup(WINDOW_SAMPLES)
+      class_names = class_names or YAMNet_classification.default_classifier().class_names
+    if not 0.0 < smoothing <= 1.0:
+      raise ValueError('smoothing must be in (0, 1]')
+    self.hop = int(round(hop_seconds * MODEL_SAMPLE_RATE))
+    if not 0 < self.hop <= WINDOW_SAMPLES:
+      raise ValueError(f'hop_seconds must be in (0, {WINDOW_SAMPLES / MODEL_SAMPLE_RATE}]')
+    self.model = model
+    self.class_names = list(class_names)
+    self.input_rate = input_rate
+    self.smoothing = smoothing
+    self.on_label = on_label
+    self.gate = gate
+    self._resampler = StreamingResampler(input_rate)
+    self.reset()
+
+  def reset(self):
+    """Forgets the stream, e.g. when the microphone changes."""
+    self._resampler.reset()
+    # The ring holds twice the window so every window is one contiguous slice.
+    self._ring = np.zeros(2 * WINDOW_SAMPLES, dtype=np.float32)
+    self._filled = 0  # samples received at 16 kHz
+    self._next_window = WINDOW_SAMPLES  # sample count at which the next window ends
+    self._smoothed = None
+    self._last_label = None  # (label, score) re-sent for windows the gate skips
+    self.windows = 0
+    self.classified = 0
+    self.model_seconds = 0.0
+    if self.gate is not None:
+      self.gate.reset()
+
+  def push(self, samples) -> List[WindowLabel]:
+    """Adds one block of mono audio; returns a label per completed window.
+
+    int16 blocks are scaled to [-1, 1]; float blocks are used as they are.
+    """
+    samples = np.asarray(samples)
+    if samples.dtype == np.int16:
+      samples = samples.astype(np.float32) / 32768.0
+    resampled = self._resampler.process(samples.reshape(-1))
+
+    results = []
+    pos = 0
+    while pos < len(resampled):
+      take = min(len(resampled) - pos, self._next_window - self._filled)
+      self._write(resampled[pos:pos + take])
+      pos += take
+      if self._filled == self._next_window:
+        result = self._classify_window()
+        if result is not None:
+          results.append(result)
+        self._next_window += self.hop
+    return results
+
+  def _write(self, block):
+    """Appends to the ring, mirroring it so the last window stays contiguous."""
+    size = WINDOW_SAMPLES
+    for offset in range(0, len(block), size):
+      chunk = block[offset:offset + size]
+      start = self._filled % size
+      first = min(len(chunk), size - start)
+      for base in (0, size):
+        self._ring[base + start:base + start + first] = chunk[:first]
+        self._ring[base:base + len(chunk) - first] = chunk[first:]
+      self._filled += len(chunk)
+
+  def _classify_window(self):
+    start = self._filled % WINDOW_SAMPLES
+    window = self._ring[start:start + WINDOW_SAMPLES]
+    self.windows += 1
+    if self.gate is not None and not self.gate.decide(window, self._filled / MODEL_SAMPLE_RATE):
+      if self.on_label is not None and self._last_label is not None:
+        self.on_label(*self._last_label)
+      return None
+    started = time.perf_counter()
+    scores = np.asarray(self.model(window)[0]).mean(axis=0)
+    self.model_seconds += time.perf_counter() - started
+    self.classified += 1
+    if self._smoothed is None:
+      self._smoothed = scores
+    else:
+      self._smoothed = self.smoothing * scores + (1.0 - self.smoothing) * self._smoothed
+
+    top = int(self._smoothed.argmax())
+    raw_top = int(scores.argmax())
+    result = WindowLabel(
+        time=self._filled / MODEL_SAMPLE_RATE,
+        label=self.class_names[top],
+        score=float(self._smoothed[top]),
+        raw_label=self.class_names[raw_top],
+        raw_score=float(scores[raw_top]))
+    self._last_label = (result.label, result.score)
+    if self.on_label is not None:
+      self.on_label(result.label, result.score)
+    return result
+
+  def stats(self):
+    """Window counts, the gating ratio and the model time the gate saved (estimated)."""
+    skipped = self.windows - self.classified
+    per_window = self.model_seconds / self.classified if self.classified else 0.0
+    stats = {
+        'windows': self.windows,
+        'classified': self.classified,
+        'skipped': skipped,
+        'gating_ratio': skipped / self.windows if self.windows else 0.0,
+        'model_seconds': self.model_seconds,
+        'saved_model_seconds': skipped * per_window,
+    }
+    if self.gate is not None:
+      stats['gate_reasons'] = dict(self.gate.reasons)
+    return stats
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Classify an audio file as a stream of blocks.')
+  parser.add_argument('path', help='Audio file (wav, mp3, ...)')
+  parser.add_argument('--hop', type=float, default=DEFAULT_HOP_SECONDS, help='Hop between windows in seconds')
+  parser.add_argument('--smoothing', type=float, default=DEFAULT_SMOOTHING)
+  parser.add_argument('--chunk', type=int, default=1024, help='Samples per pushed block')
+  parser.add_argument('--tflite', default=None, help='Exported TFLite model to use instead of the SavedModel')
+  parser.add_argument('--threads', type=int, default=1, help='TFLite interpreter threads')
+  parser.add_argument('--gate', action='store_true', help='Classify only on 20-250 Hz energy onsets and changes')
+  parser.add_argument('--gate-margin', type=float, default=6.0, help='Gate threshold above the noise floor in dB')
+  args = parser.parse_args(argv)
+
+  import librosa
+
+  model = class_names = None
+  if args.tflite:
+    from yamnet_tflite import TFLiteYAMNet
+    model = TFLiteYAMNet(args.tflite, num_threads=args.threads)
+    class_names = model.class_names
+  audio, rate = librosa.load(args.path, sr=None, mono=True)
+  gate = None
+  if args.gate:
+    from energy_gate import LowFrequencyGate
+    gate = LowFrequencyGate(margin_db=args.gate_margin)
+  classifier = StreamingClassifier(model, class_names, input_rate=rate, hop_seconds=args.hop,
+                                   smoothing=args.smoothing, gate=gate)
+  for start in range(0, len(audio), args.chunk):
+    for result in classifier.push(audio[start:start + args.chunk]):
+      print(f'{result.time:7.2f}s  {result.label} ({result.score:.2f})  [{result.raw_label}]')
+  print(classifier.stats())
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
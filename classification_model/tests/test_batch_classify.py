@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+
+import numpy as np
+import pytest
+
+import batch_classify
+from batch_classify import (
+    PATCH_HOP_SAMPLES, PATCH_SAMPLES, ResultWriter, classify_batch, classify_files, expand_inputs,
+    padded_length)
+
+CLASS_NAMES = ['silence', 'one', 'two', 'three']
+
+
+class _PeakModel:
+  """Stands in for YAMNet: each patch scores 1 for the class given by its peak level * 10."""
+
+  def __init__(self):
+    self.calls = 0
+
+  def __call__(self, waveform):
+    self.calls += 1
+    n_patches = 1 + (len(waveform) - PATCH_SAMPLES) // PATCH_HOP_SAMPLES
+    scores = np.zeros((n_patches, len(CLASS_NAMES)), dtype=np.float32)
+    for index in range(n_patches):
+      patch = waveform[index * PATCH_HOP_SAMPLES:index * PATCH_HOP_SAMPLES + PATCH_SAMPLES]
+      scores[index, int(round(np.abs(patch).max() * 10))] = 1.0
+    return scores, None, None
+
+
+def _level(path):
+  """Level and length encoded in the fake file names, e.g. 'two_1.5s.wav'."""
+  name = path.rsplit('/', 1)[-1]
+  label, seconds = name.rsplit('.', 1)[0].split('_')
+  return CLASS_NAMES.index(label) / 10, float(seconds[:-1])
+
+
+def _fake_decode(path):
+  if 'broken' in path:
+    raise ValueError('cannot decode')
+  level, seconds = _level(path)
+  return path, np.full(int(seconds * 16000), level, dtype=np.float32), 0.001
+
+
+def test_padded_length_ends_on_a_patch_hop():
+  assert padded_length(100) == PATCH_SAMPLES
+  assert padded_length(PATCH_SAMPLES) == PATCH_SAMPLES
+  assert padded_length(PATCH_SAMPLES + 1) == PATCH_SAMPLES + PATCH_HOP_SAMPLES
+
+
+def test_batch_scores_stay_with_their_file():
+  model = _PeakModel()
+  # Adjacent files at different levels: a patch across a boundary would mix them.
+  sizes = [(16000, 0.1), (50000, 0.3), (4000, 0.2)]
+  waveforms = [np.full(n, level, dtype=np.float32) for n, level in sizes]
+  means, elapsed = classify_batch(model, waveforms)
+  assert model.calls == 1 and elapsed >= 0
+  assert [int(np.argmax(mean)) for mean in means] == [1, 3, 2]
+  assert all(mean.max() == 1.0 for mean in means)
+
+
+def test_inputs_are_expanded_and_deduplicated(tmp_path):
+  (tmp_path / 'a' / 'deep').mkdir(parents=True)
+  for name in ['a/one_1s.wav', 'a/deep/two_1s.MP3', 'a/notes.txt', 'three_1s.flac']:
+    (tmp_path / name).write_bytes(b'')
+  files = expand_inputs([str(tmp_path / 'a'), str(tmp_path / '*.flac'), str(tmp_path / 'a/one_1s.wav')])
+  assert files == sorted([str(tmp_path / 'a/one_1s.wav'), str(tmp_path / 'a/deep/two_1s.MP3'),
+                          str(tmp_path / 'three_1s.flac')])
+
+
+def test_files_are_batched_and_failures_reported(monkeypatch):
+  monkeypatch.setattr(batch_classify, 'decode', _fake_decode)
+  files = ['one_2s.wav', 'broken_1s.wav', 'two_0.5s.wav', 'three_3s.wav', 'one_1s.wav']
+  model = _PeakModel()
+  output = io.StringIO()
+  summary = classify_files(files, model, CLASS_NAMES, ResultWriter(output, 'jsonl'), top_k=2,
+                           workers=2, batch_seconds=60.0)
+
+  results = {result['path']: result for result in map(json.loads, output.getvalue().splitlines())}
+  assert sorted(results) == sorted(files)
+  assert results['broken_1s.wav']['error'] == 'cannot decode'
+  for path in files:
+    if path != 'broken_1s.wav':
+      assert results[path]['label'] == path.split('_')[0]
+      assert len(results[path]['top_k']) == 2
+      assert results[path]['duration'] == pytest.approx(_level(path)[1])
+  assert (summary['files'], summary['failed']) == (4, 1)
+  assert summary['audio_seconds'] == pytest.approx(6.5)
+  # All 6.5 s fit in one batch, so the four files share a single model call.
+  assert summary['model_calls'] == model.calls == 1
+
+
+def test_csv_rows_flatten_the_top_k():
+  output = io.StringIO()
+  writer = ResultWriter(output, 'csv')
+  writer.write({'path': 'a.wav', 'label': 'one', 'score': 0.9,
+                'top_k': [{'label': 'one', 'score': 0.9}, {'label': 'two', 'score': 0.05}]})
+  writer.write({'path': 'b.wav', 'error': 'cannot decode'})
+  rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+  assert rows[0]['top_k'] == 'one:0.9000;two:0.0500'
+  assert rows[1]['error'] == 'cannot decode' and rows[1]['label'] == ''
+
+
+def test_no_input_files_is_an_error(tmp_path, capsys):
+  assert batch_classify.main([str(tmp_path / '*.wav')]) == 1
+  assert '에러' in capsys.readouterr().err
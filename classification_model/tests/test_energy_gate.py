@@ -0,0 +1,63 @@
+import numpy as np
+
+from energy_gate import LowFrequencyGate
+
+RATE = 16_000
+WINDOW = 15_600
+HOP = 7_680
+
+
+def _tone(frequency, level, seconds, seed=0):
+  t = np.arange(int(seconds * RATE)) / RATE
+  noise = 1e-3 * np.random.default_rng(seed).standard_normal(len(t))
+  return (level * np.sin(2 * np.pi * frequency * t) + noise).astype(np.float32)
+
+
+def _decisions(gate, audio):
+  """(window end time, passed) for the sliding windows of the classifier."""
+  decisions = []
+  for end in range(WINDOW, len(audio) + 1, HOP):
+    time = end / RATE
+    decisions.append((time, gate.decide(audio[end - WINDOW : end], time)))
+  return decisions
+
+
+def test_steady_room_is_only_refreshed():
+  gate = LowFrequencyGate(max_skip_seconds=5.0)
+  decisions = _decisions(gate, _tone(100, 0.0, 12))
+  passed = [time for time, ok in decisions if ok]
+  # The first window, then one every max_skip_seconds.
+  assert len(passed) == 3
+  assert np.all(np.diff(passed) >= 5.0)
+  assert gate.reasons == {"onset": 0, "change": 0, "refresh": 3}
+  assert gate.gating_ratio == 1.0 - 3 / len(decisions)
+
+
+def test_onset_passes_once_then_steady_noise_is_skipped():
+  gate = LowFrequencyGate()
+  audio = np.concatenate([_tone(100, 0.0, 4), _tone(100, 0.3, 6, seed=1)])
+  decisions = _decisions(gate, audio)
+  assert gate.reasons["onset"] == 1
+  # The windows that fill with the hum may count as changes; after that, nothing.
+  onset_time = 4.0
+  late = [ok for time, ok in decisions if time > onset_time + 2 * WINDOW / RATE]
+  assert late and not any(late)
+
+
+def test_a_new_tone_at_the_same_level_is_a_change():
+  gate = LowFrequencyGate()
+  audio = np.concatenate([_tone(60, 0.3, 4), _tone(200, 0.3, 4, seed=1)])
+  decisions = _decisions(gate, audio)
+  assert gate.reasons["change"] >= 1
+  switched = [ok for time, ok in decisions if 4.0 < time <= 4.0 + WINDOW / RATE + HOP / RATE]
+  assert any(switched)
+
+
+def test_out_of_band_noise_does_not_open_the_gate():
+  gate = LowFrequencyGate()
+  t = np.arange(5 * RATE) / RATE
+  # Faded in: an abrupt start would splatter into the band as a click.
+  fade = np.minimum(t, 1.0)
+  whistle = _tone(2000, 0.0, 5, seed=1) + (0.5 * fade * np.sin(2 * np.pi * 2000 * t)).astype(np.float32)
+  _decisions(gate, np.concatenate([_tone(100, 0.0, 3), whistle]))
+  assert gate.reasons == {"onset": 0, "change": 0, "refresh": 1}
@@ -0,0 +1,66 @@
+import numpy as np
+
+from streaming_classifier import WINDOW_SAMPLES, StreamingClassifier, StreamingResampler
+
+
+class _RecordingModel:
+  """Stands in for YAMNet and keeps every window it is given."""
+
+  def __init__(self):
+    self.windows = []
+
+  def __call__(self, waveform):
+    self.windows.append(np.array(waveform))
+    return np.array([[0.2, 0.8]], dtype=np.float32), None, None
+
+
+def _chunks(samples, sizes):
+  """The samples in blocks of the given sizes, then the rest."""
+  start = 0
+  for size in sizes:
+    yield samples[start : start + size]
+    start += size
+  yield samples[start:]
+
+
+def test_resampler_is_independent_of_block_boundaries():
+  samples = np.random.default_rng(4).standard_normal(44_100).astype(np.float32)
+  whole = StreamingResampler(44_100).process(samples)
+  resampler = StreamingResampler(44_100)
+  sizes = np.random.default_rng(5).integers(1, 3000, size=100)
+  pieces = [resampler.process(chunk) for chunk in _chunks(samples, sizes)]
+  np.testing.assert_allclose(np.concatenate(pieces), whole, atol=1e-6)
+
+
+def test_resampler_keeps_an_in_band_tone():
+  t = np.arange(44_100) / 44_100
+  out = StreamingResampler(44_100).process(np.sin(2 * np.pi * 1000 * t).astype(np.float32))
+  assert abs(len(out) - 16_000) <= 24
+  steady = out[200:-200]
+  spectrum = np.abs(np.fft.rfft(steady * np.hanning(len(steady))))
+  assert abs(np.argmax(spectrum) * 16_000 / len(steady) - 1000) < 2
+  assert abs(np.sqrt(2 * np.mean(steady**2)) - 1.0) < 0.01
+
+
+def test_windows_slide_by_the_hop_over_the_stream():
+  model = _RecordingModel()
+  classifier = StreamingClassifier(model, ["a", "b"], hop_seconds=0.25)
+  stream = np.random.default_rng(6).uniform(-0.5, 0.5, 3 * 16_000).astype(np.float32)
+  results = []
+  for chunk in _chunks(stream, [1000, 7, 20_000, 333] + [512] * 50):
+    results.extend(classifier.push(chunk))
+
+  expected = 1 + (len(stream) - WINDOW_SAMPLES) // classifier.hop
+  assert len(results) == len(model.windows) == expected
+  for index, window in enumerate(model.windows):
+    end = WINDOW_SAMPLES + index * classifier.hop
+    np.testing.assert_array_equal(window, stream[end - WINDOW_SAMPLES : end])
+  assert results[-1].label == "b"
+  assert results[-1].time == (WINDOW_SAMPLES + (expected - 1) * classifier.hop) / 16_000
+
+
+def test_int16_blocks_are_scaled():
+  model = _RecordingModel()
+  classifier = StreamingClassifier(model, ["a", "b"])
+  classifier.push(np.full(WINDOW_SAMPLES, 16_384, dtype=np.int16))
+  np.testing.assert_allclose(model.windows[0], 0.5)
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import YAMNet_classification
+from YAMNet_classification import YAMNetClassifier, class_names_from_csv
+
+
+def _model_dir(tmp_path, names):
+  """A model directory holding only the class map."""
+  assets = tmp_path / 'assets'
+  assets.mkdir()
+  rows = ''.join(f'{index},/m/{index},"{name}"\n' for index, name in enumerate(names))
+  (assets / 'yamnet_class_map.csv').write_text('index,mid,display_name\n' + rows)
+  return str(tmp_path)
+
+
+def test_import_does_not_load_tensorflow():
+  code = 'import sys, YAMNet_classification; print(sorted(m for m in sys.modules if "tensorflow" in m))'
+  output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(YAMNet_classification.__file__),
+                          capture_output=True, text=True, check=True).stdout
+  assert output.strip() == '[]'
+
+
+def test_class_names_come_from_the_assets_without_loading(tmp_path):
+  classifier = YAMNetClassifier(_model_dir(tmp_path, ['Speech', 'Dog, bark', 'Siren']))
+  assert classifier.class_names == ['Speech', 'Dog, bark', 'Siren']
+  assert not classifier.loaded and classifier.timings == {}
+  # The map is read once and shared.
+  assert classifier.class_names is class_names_from_csv(str(tmp_path / 'assets' / 'yamnet_class_map.csv'))
+
+
+def test_bundled_class_map_is_available_at_module_level():
+  names = YAMNet_classification.class_names
+  assert len(names) == 521 and names[0] == 'Speech'
+  assert not YAMNet_classification.default_classifier().loaded
+  with pytest.raises(AttributeError):
+    YAMNet_classification.no_such_attribute
+
+
+def test_model_is_loaded_once_under_concurrent_access(tmp_path, monkeypatch):
+  loads = []
+
+  def load(path):
+    loads.append(path)
+    time.sleep(0.05)
+    return object()
+
+  monkeypatch.setitem(sys.modules, 'tensorflow_hub', types.SimpleNamespace(load=load))
+  classifier = YAMNetClassifier(_model_dir(tmp_path, ['Speech']))
+  models = []
+  threads = [threading.Thread(target=lambda: models.append(classifier.model)) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert loads == [str(tmp_path)]
+  assert classifier.loaded and len({id(model) for model in models}) == 1
+  assert set(classifier.timings) == {'import_tf', 'load'}
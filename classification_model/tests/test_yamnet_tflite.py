@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import yamnet_tflite
+from yamnet_tflite import PATCH_HOP_SAMPLES, PATCH_SAMPLES, TFLiteYAMNet
+
+
+class _FakeInterpreter:
+  """Stands in for the TFLite interpreter: scores a patch as [first sample, last sample]."""
+
+  instances = []
+
+  def __init__(self, model_path, num_threads, input_shape=(PATCH_SAMPLES,)):
+    self.model_path, self.num_threads, self.input_shape = model_path, num_threads, input_shape
+    self.allocated = False
+    self.patches = []
+    _FakeInterpreter.instances.append(self)
+
+  def allocate_tensors(self):
+    self.allocated = True
+
+  def get_input_details(self):
+    return [{'index': 0, 'shape': np.array(self.input_shape)}]
+
+  def get_output_details(self):
+    return [{'index': 1, 'shape': np.array([1, 2])}]
+
+  def set_tensor(self, index, value):
+    assert index == 0 and value.shape == (PATCH_SAMPLES,) and value.dtype == np.float32
+    self.patches.append(value.copy())
+
+  def invoke(self):
+    pass
+
+  def get_tensor(self, index):
+    assert index == 1
+    return np.array([[self.patches[-1][0], self.patches[-1][-1]]], dtype=np.float32)
+
+
+@pytest.fixture
+def fake_interpreter(monkeypatch):
+  _FakeInterpreter.instances.clear()
+  monkeypatch.setattr(yamnet_tflite, '_interpreter_class', lambda: _FakeInterpreter)
+  return _FakeInterpreter
+
+
+def _class_map(tmp_path):
+  path = tmp_path / 'class_map.csv'
+  path.write_text('index,mid,display_name\n0,/m/0,first\n1,/m/1,last\n')
+  return str(path)
+
+
+@pytest.mark.parametrize('length, patches', [
+    (1000, 1), (PATCH_SAMPLES, 1), (PATCH_SAMPLES + 1, 2), (PATCH_SAMPLES + PATCH_HOP_SAMPLES, 2),
+    (3 * 16000, 6)])
+def test_waveform_is_cut_into_yamnet_patches(tmp_path, fake_interpreter, length, patches):
+  model = TFLiteYAMNet('yamnet.tflite', num_threads=3, class_map_path=_class_map(tmp_path))
+  interpreter = fake_interpreter.instances[0]
+  assert (interpreter.model_path, interpreter.num_threads, interpreter.allocated) == ('yamnet.tflite', 3, True)
+
+  waveform = np.arange(1, length + 1, dtype=np.float64)
+  scores, embeddings, spectrogram = model(waveform)
+  assert scores.shape == (patches, 2) and embeddings is None and spectrogram is None
+  # Patches start every hop and the last one is zero-padded past the end.
+  np.testing.assert_array_equal(scores[:, 0], 1 + PATCH_HOP_SAMPLES * np.arange(patches))
+  padded = np.concatenate([waveform, np.zeros(PATCH_SAMPLES)])
+  np.testing.assert_array_equal(scores[:, 1], padded[PATCH_HOP_SAMPLES * np.arange(patches) + PATCH_SAMPLES - 1])
+
+
+def test_classify_uses_the_mean_score(tmp_path, fake_interpreter):
+  model = TFLiteYAMNet('yamnet.tflite', class_map_path=_class_map(tmp_path))
+  # Padding makes the last sample of the only patch zero, so 'first' wins.
+  label, scores = model.classify(np.ones(8000, dtype=np.float32))
+  assert label == 'first' and scores.shape == (1, 2)
+
+
+def test_model_with_another_input_shape_is_rejected(monkeypatch):
+  monkeypatch.setattr(yamnet_tflite, '_interpreter_class',
+                      lambda: lambda **kwargs: _FakeInterpreter(input_shape=(1, PATCH_SAMPLES), **kwargs))
+  with pytest.raises(ValueError, match='expected'):
+    TFLiteYAMNet('batched.tflite')
+
+
+def test_compare_with_missing_clips_is_an_error(tmp_path, capsys):
+  assert yamnet_tflite.main(['compare', 'yamnet.tflite', str(tmp_path / 'missing.wav')]) == 1
+  assert 'missing.wav' in capsys.readouterr().err
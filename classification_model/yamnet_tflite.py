@@ -0,0 +1,200 @@
+"""Quantized TFLite export and CPU inference of YAMNet.
+
+  python yamnet_tflite.py export --quantization dynamic --output yamnet_dynamic.tflite
+  python yamnet_tflite.py compare yamnet_dynamic.tflite --threads 1
+
+export converts the SavedModel in yamnet_1 to a TFLite model that scores one
+YAMNet patch (PATCH_SAMPLES of 16 kHz audio). Quantization is 'dynamic'
+(int8 weights, float activations), 'float16' (half-precision weights) or
+'none'. Only builtin TFLite ops are allowed, so the result runs on the
+tflite_runtime interpreter without TensorFlow.
+
+TFLiteYAMNet runs such a model with a fixed number of interpreter threads.
+It is called like the hub model: a 1-D waveform of any length is cut into
+patches every PATCH_HOP_SAMPLES (zero-padded at the end, as YAMNet pads) and
+the per-patch scores are stacked, so it can replace the model of
+StreamingClassifier or batch_classify.
+
+compare runs the SavedModel and the TFLite model on the same clips (the
+bundled ones by default) and reports top-1 agreement, top-5 overlap, the
+largest score difference and the inference time per second of audio.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from YAMNet_classification import MODEL_DIR, MODEL_SAMPLE_RATE, YAMNetClassifier, class_names_from_csv
+
+PATCH_SAMPLES = 15600
+PATCH_HOP_SAMPLES = 7680
+QUANTIZATIONS = ('dynamic', 'float16', 'none')
+DEFAULT_THREADS = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUNDLED_CLIPS = ('cleaner.wav', 'firecar.mp3', 'miaow_16k.wav', 'speech_whistling2.wav', 'vibration.mp3')
+
+
+def export(output_path, quantization='dynamic', model_dir=MODEL_DIR):
+  """Converts the SavedModel to a one-patch TFLite model; returns the file size."""
+  import tensorflow as tf
+
+  if quantization not in QUANTIZATIONS:
+    raise ValueError(f'quantization must be one of {QUANTIZATIONS}')
+  model = YAMNetClassifier(model_dir).model
+  scores_only = tf.function(lambda waveform: model(waveform)[0])
+  concrete = scores_only.get_concrete_function(tf.TensorSpec([PATCH_SAMPLES], tf.float32))
+
+  converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+  converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+  if quantization != 'none':
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+  if quantization == 'float16':
+    converter.target_spec.supported_types = [tf.float16]
+  flatbuffer = converter.convert()
+  with open(output_path, 'wb') as f:
+    f.write(flatbuffer)
+  return len(flatbuffer)
+
+
+def _interpreter_class():
+  try:
+    from tflite_runtime.interpreter import Interpreter
+  except ImportError:
+    import tensorflow as tf
+    Interpreter = tf.lite.Interpreter
+  return Interpreter
+
+
+class TFLiteYAMNet:
+  """Exported YAMNet on the TFLite interpreter with num_threads threads."""
+
+  def __init__(self, model_path, num_threads=DEFAULT_THREADS, class_map_path=None):
+    self.model_path = model_path
+    self.num_threads = num_threads
+    self._interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+    self._interpreter.allocate_tensors()
+    self._input = self._interpreter.get_input_details()[0]
+    self._output = self._interpreter.get_output_details()[0]
+    if tuple(self._input['shape']) != (PATCH_SAMPLES,):
+      raise ValueError(f"{model_path} takes input of shape {tuple(self._input['shape'])}, "
+                       f'expected ({PATCH_SAMPLES},)')
+    self.class_names = class_names_from_csv(
+        class_map_path or os.path.join(MODEL_DIR, 'assets', 'yamnet_class_map.csv'))
+
+  def __call__(self, waveform):
+    """Returns (scores, None, None); scores has one row per patch."""
+    waveform = np.asarray(waveform, dtype=np.float32).reshape(-1)
+    hops = -(-max(len(waveform) - PATCH_SAMPLES, 0) // PATCH_HOP_SAMPLES)
+    padded = np.zeros(PATCH_SAMPLES + hops * PATCH_HOP_SAMPLES, dtype=np.float32)
+    padded[:len(waveform)] = waveform
+    scores = []
+    for start in range(0, hops * PATCH_HOP_SAMPLES + 1, PATCH_HOP_SAMPLES):
+      self._interpreter.set_tensor(self._input['index'], padded[start:start + PATCH_SAMPLES])
+      self._interpreter.invoke()
+      scores.append(self._interpreter.get_tensor(self._output['index']).reshape(-1))
+    return np.stack(scores), None, None
+
+  def classify(self, waveform):
+    """Returns (class name, per-patch scores) for a 16 kHz mono waveform."""
+    scores, _, _ = self(waveform)
+    return self.class_names[scores.mean(axis=0).argmax()], scores
+
+
+def _timed_scores(model, waveform, repeats):
+  """Per-patch scores and the median inference time over repeats."""
+  times = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    scores = np.asarray(model(waveform)[0])
+    times.append(time.perf_counter() - start)
+  return scores, float(np.median(times))
+
+
+def compare(tflite_path, clips=None, num_threads=DEFAULT_THREADS, repeats=5):
+  """Scores clips with both models; returns a report dict with a row per clip."""
+  import librosa
+  import tensorflow as tf
+
+  try:
+    # Same thread budget for the SavedModel; only possible before TensorFlow starts up.
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(num_threads)
+  except RuntimeError:
+    pass
+
+  clips = clips or [os.path.join(HERE, name) for name in BUNDLED_CLIPS]
+  reference = YAMNetClassifier()
+  reference.warmup()
+  lite = TFLiteYAMNet(tflite_path, num_threads=num_threads)
+  names = reference.class_names
+
+  rows = []
+  for path in clips:
+    waveform, _ = librosa.load(path, sr=MODEL_SAMPLE_RATE, mono=True)
+    seconds = len(waveform) / MODEL_SAMPLE_RATE
+    reference_scores, reference_time = _timed_scores(reference, waveform, repeats)
+    lite_scores, lite_time = _timed_scores(lite, waveform, repeats)
+    patches = min(len(reference_scores), len(lite_scores))
+    reference_mean = reference_scores[:patches].mean(axis=0)
+    lite_mean = lite_scores[:patches].mean(axis=0)
+    reference_top5 = np.argsort(reference_mean)[::-1][:5]
+    lite_top5 = np.argsort(lite_mean)[::-1][:5]
+    rows.append({
+        'clip': os.path.basename(path),
+        'seconds': seconds,
+        'saved_model_label': names[reference_top5[0]],
+        'tflite_label': names[lite_top5[0]],
+        'top1_agree': bool(reference_top5[0] == lite_top5[0]),
+        'top5_overlap': len(set(reference_top5) & set(lite_top5)) / 5,
+        'max_score_diff': float(np.abs(reference_scores[:patches] - lite_scores[:patches]).max()),
+        'saved_model_ms_per_s': reference_time * 1e3 / seconds,
+        'tflite_ms_per_s': lite_time * 1e3 / seconds,
+    })
+
+  return {
+      'tflite_model': tflite_path,
+      'tflite_bytes': os.path.getsize(tflite_path),
+      'threads': num_threads,
+      'cold_start': reference.timings,
+      'top1_agreement': float(np.mean([row['top1_agree'] for row in rows])),
+      'clips': rows,
+  }
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Export YAMNet to quantized TFLite and compare it with the SavedModel.')
+  commands = parser.add_subparsers(dest='command', required=True)
+  export_parser = commands.add_parser('export', help='Convert yamnet_1 to TFLite')
+  export_parser.add_argument('--output', default='yamnet_dynamic.tflite')
+  export_parser.add_argument('--quantization', choices=QUANTIZATIONS, default='dynamic')
+  compare_parser = commands.add_parser('compare', help='Accuracy/latency against the SavedModel')
+  compare_parser.add_argument('model', help='Exported .tflite file')
+  compare_parser.add_argument('clips', nargs='*', help='Audio files (default: the bundled clips)')
+  compare_parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+  compare_parser.add_argument('--repeats', type=int, default=5)
+  args = parser.parse_args(argv)
+
+  if args.command == 'export':
+    size = export(args.output, args.quantization)
+    print(f'{args.output}: {size / 1e6:.2f} MB ({args.quantization})')
+    return 0
+
+  missing = [path for path in args.clips if not os.path.exists(path)]
+  if missing:
+    print(f"에러 : {', '.join(missing)}을 찾을 수 없습니다.", file=sys.stderr)
+    return 1
+  report = compare(args.model, args.clips, num_threads=args.threads, repeats=args.repeats)
+  for row in report['clips']:
+    print(f"{row['clip']:24s} {row['saved_model_label']:24s} {row['tflite_label']:24s} "
+          f"max diff {row['max_score_diff']:.3f}  "
+          f"{row['saved_model_ms_per_s']:.1f} vs {row['tflite_ms_per_s']:.1f} ms/s")
+  print(json.dumps({key: value for key, value in report.items() if key != 'clips'}))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())